@@ -0,0 +1,63 @@
+"""
+Benchmarks for the hot paths of eggplant.
+
+Every module can be run on its own from the root of the project, e.g.::
+
+    python -m benchmarks.cart_upsert
+
+They run against a throw-away test database created from the settings in
+use (``eggplant_project.settings.local`` unless DJANGO_SETTINGS_MODULE says
+otherwise), so point them at a PostgreSQL configuration to measure what
+production sees.
+"""
+import contextlib
+import os
+import statistics
+import time
+
+
+def setup():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE',
+                          'eggplant_project.settings.local')
+    import django
+    django.setup()
+
+
+@contextlib.contextmanager
+def test_database():
+    from django.test.runner import DiscoverRunner
+    from django.test.utils import (setup_test_environment,
+                                   teardown_test_environment)
+    runner = DiscoverRunner(verbosity=0, interactive=False)
+    setup_test_environment()
+    old_config = runner.setup_databases()
+    try:
+        yield
+    finally:
+        runner.teardown_databases(old_config)
+        teardown_test_environment()
+
+
+def measure(func, repeat):
+    """Call ``func(i)`` ``repeat`` times and return the durations."""
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(i)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def report(name, timings, unit=1000.0, unit_name='ms'):
+    print('{:<40} n={:<6} mean={:8.3f}{unit} median={:8.3f}{unit} '
+          'p95={:8.3f}{unit}'.format(
+              name, len(timings),
+              statistics.mean(timings) * unit,
+              statistics.median(timings) * unit,
+              percentile(timings, 0.95) * unit,
+              unit=unit_name))
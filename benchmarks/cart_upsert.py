@@ -0,0 +1,55 @@
+"""
+Latency of adding to the cart: the former exists() + update()/create()
+sequence against BasketItem.objects.upsert().
+"""
+import datetime
+from decimal import Decimal
+
+from benchmarks import measure, report, setup, test_database
+
+REPEAT = 2000
+PRODUCTS = 50
+
+
+def legacy_add(basket, product, quantity, delivery_date):
+    from eggplant.market.models import BasketItem
+    from django.db.models import F
+    current = basket.items.filter(product=product, delivery_date=delivery_date)
+    if current.exists():
+        current.update(quantity=F('quantity') + quantity)
+    else:
+        BasketItem.objects.create(basket=basket, product=product,
+                                  quantity=quantity,
+                                  delivery_date=delivery_date)
+
+
+def main():
+    from django.db import connection
+    from eggplant.factories import UserFactory
+    from eggplant.market.models import (Basket, BasketItem, Product,
+                                        ProductCategory, ProductTax)
+
+    category = ProductCategory.objects.create(title='bench')
+    tax = ProductTax.objects.create(title='bench', tax=Decimal(0))
+    products = [Product.objects.create(title='product %d' % i,
+                                       category=category, tax=tax,
+                                       price=Decimal('1'))
+                for i in range(PRODUCTS)]
+    delivery_date = datetime.date.today()
+    print('database: {}'.format(connection.vendor))
+
+    for name, add in (
+        ('exists + update/create', legacy_add),
+        ('upsert', BasketItem.objects.upsert),
+    ):
+        basket = Basket.objects.create(user=UserFactory())
+        timings = measure(
+            lambda i: add(basket, products[i % PRODUCTS], 1, delivery_date),
+            REPEAT)
+        report(name, timings)
+
+
+if __name__ == '__main__':
+    setup()
+    with test_database():
+        main()
@@ -0,0 +1,157 @@
+"""
+Load test of the way from the cart to a paid order, through the payment
+simulator: members, a number of them at the same time, each add a few
+products to their cart, check out and pay. Reports the throughput and the
+latency of every step, and how fast the queued payment callbacks are
+processed afterwards::
+
+    python -m benchmarks.checkout_load [members] [concurrency] \\
+        [gateway latency] [failure rate]
+
+Needs eggplant.market.simulator in GETPAID_BACKENDS, as the development
+and test settings have it. SQLite lets one writer in at a time and turns
+away transactions that would have to wait for each other, so there the
+members take turns for every request; point DJANGO_SETTINGS_MODULE at
+PostgreSQL for numbers that mean anything.
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from benchmarks import report, setup, test_database
+
+MEMBERS = 200
+CONCURRENCY = 10
+PRODUCTS = 50
+ITEMS = 3
+SIMULATOR = 'eggplant.market.simulator'
+STEPS = ('add to cart', 'checkout', 'payment')
+
+
+def populate(members):
+    from allauth.account.models import EmailAddress
+    from django.contrib.auth.models import User
+    from eggplant.factories import AccountFactory
+    from eggplant.market.models import Product, ProductCategory, ProductTax
+    from eggplant.profiles.models import UserProfile
+
+    category = ProductCategory.objects.create(title='bench')
+    tax = ProductTax.objects.create(title='bench', tax=Decimal('0.25'))
+    Product.objects.bulk_create(
+        Product(title='product {}'.format(i), category=category, tax=tax,
+                price=Decimal('2.50'), stock=members * ITEMS)
+        for i in range(PRODUCTS))
+    # One at a time, so the profiles get created.
+    users = [User.objects.create(username='member{}'.format(i),
+                                 email='member{}@example.com'.format(i))
+             for i in range(members)]
+    UserProfile.objects.update(address='address', postcode='1000',
+                               city='city', tel='12345678')
+    EmailAddress.objects.bulk_create(
+        EmailAddress(user=user, email=user.email, verified=True,
+                     primary=True)
+        for user in users)
+    for profile in UserProfile.objects.all():
+        AccountFactory(user_profiles=[profile])
+    return users, list(Product.objects.values_list('pk', flat=True))
+
+
+def buy(user, products, timings, requests):
+    """
+    Take ``user`` from an empty cart to a paid order, making each request
+    once ``requests``, a semaphore, lets it.
+    """
+    from django.core.urlresolvers import reverse
+    from django.db import connection
+    from django.test import Client
+
+    client = Client()
+    with requests:
+        client.force_login(user)
+
+    def step(name, func):
+        start = time.perf_counter()
+        with requests:
+            response = func()
+        timings[name].append(time.perf_counter() - start)
+        return response
+
+    try:
+        for product in random.sample(products, ITEMS):
+            step('add to cart', lambda: client.post(
+                reverse('eggplant:market:add_to_cart_json'),
+                {'product': product, 'quantity': 1}))
+        response = step('checkout', lambda: client.post(
+            reverse('eggplant:market:checkout')))
+        payment = response.url.rstrip('/').rsplit('/', 1)[-1]
+        response = step('payment', lambda: client.post(
+            reverse('getpaid:new-payment', kwargs={'currency': 'DKK'}),
+            {'order': payment, 'backend': SIMULATOR}, follow=True))
+        return response.status_code == 200
+    except Exception as e:
+        print('{}: {}'.format(user.username, e), file=sys.stderr)
+        return False
+    finally:
+        connection.close()
+
+
+def main(members, concurrency, latency, failure_rate):
+    from django.conf import settings
+    from django.db import connection
+    from eggplant.market.models import GetPaidPayment, PaymentCallback
+
+    # Sessions in the database would add a write after every view.
+    settings.SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+    settings.GETPAID_BACKENDS_SETTINGS = dict(
+        settings.GETPAID_BACKENDS_SETTINGS,
+        **{SIMULATOR: {'latency': latency, 'latency_jitter': latency / 2,
+                       'failure_rate': failure_rate}})
+    users, products = populate(members)
+    timings = {name: [] for name in STEPS}
+    requests = threading.BoundedSemaphore(
+        1 if connection.vendor == 'sqlite' else concurrency)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        done = list(pool.map(
+            lambda user: buy(user, products, timings, requests), users))
+    duration = time.perf_counter() - start
+    print('{} members, {} at a time: {:.1f} orders/s, {} failed'.format(
+        members, concurrency, members / duration, done.count(False)))
+    for name in STEPS:
+        report(name, timings[name])
+        print('{:<40} {:.1f}/s'.format('', len(timings[name]) / duration))
+
+    start = time.perf_counter()
+    processed = PaymentCallback.objects.process_pending()
+    duration = time.perf_counter() - start
+    print('{:<40} {:8.2f}s {:.1f}/s'.format(
+        'callbacks, {}'.format(processed), duration,
+        processed / duration if duration else 0))
+    statuses = GetPaidPayment.objects.values_list('status', flat=True)
+    print('paid={} cancelled={}'.format(
+        sum(1 for status in statuses if status == 'paid'),
+        sum(1 for status in statuses if status == 'cancelled')))
+
+
+if __name__ == '__main__':
+    setup()
+    from django.conf import settings
+    from django.db import connection
+    if SIMULATOR not in settings.GETPAID_BACKENDS:
+        sys.exit('Add {} to GETPAID_BACKENDS first.'.format(SIMULATOR))
+    args = sys.argv[1:]
+    members = int(args[0]) if len(args) > 0 else MEMBERS
+    concurrency = int(args[1]) if len(args) > 1 else CONCURRENCY
+    latency = float(args[2]) if len(args) > 2 else 0.05
+    failure_rate = float(args[3]) if len(args) > 3 else 0.05
+    if connection.vendor == 'sqlite':
+        # The threads cannot share an in-memory database.
+        path = os.path.join(tempfile.mkdtemp(), 'checkout_load.sqlite')
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = path
+    with test_database():
+        main(members, concurrency, latency, failure_rate)
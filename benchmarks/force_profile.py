@@ -0,0 +1,71 @@
+"""
+Overhead NewUserForceProfileMiddleware adds to every request of a member
+with a complete profile, in both languages: as it was, reversing the allowed
+URLs and loading the profile every time, and as it is, with the allowed
+paths reversed once per language and the profile noted complete in the
+session at login. Reports the time and the queries per request.
+"""
+from benchmarks import measure, report, setup, test_database
+
+REPEAT = 2000
+
+
+def reverse_every_request(request):
+    """process_request as it was."""
+    from django.conf import settings
+    from django.core.urlresolvers import reverse
+    if request.user.is_authenticated() and not request.user.is_superuser:
+        allowed_paths = [reverse(urlname) for urlname in
+                         settings.NEW_USER_FORCE_PROFILE_ALLOWED_URL_NAMES]
+        if request.path not in allowed_paths:
+            request.user.profile.is_complete()
+
+
+def main():
+    from django.contrib.auth.models import User
+    from django.contrib.sessions.backends.db import SessionStore
+    from django.db import connection
+    from django.test import RequestFactory
+    from django.test.utils import CaptureQueriesContext
+    from django.utils import translation
+    from eggplant.factories import UserFactory
+    from eggplant.profiles.middleware import NewUserForceProfileMiddleware
+    from eggplant.profiles.models import (PROFILE_COMPLETE_SESSION_KEY,
+                                          UserProfile)
+
+    user = UserFactory()
+    UserProfile.objects.filter(user=user).update(
+        address='address', postcode='1000', city='city', tel='12345678')
+    session = SessionStore()
+    session[PROFILE_COMPLETE_SESSION_KEY] = user.pk
+    middleware = NewUserForceProfileMiddleware()
+
+    for language in ('en', 'da'):
+        request = RequestFactory().get('/{}/market/'.format(language))
+        request.session = session
+
+        def run(process_request):
+            # As loaded by the authentication middleware, once per request.
+            users = [User.objects.get(pk=user.pk) for i in range(REPEAT)]
+
+            def call(i):
+                request.user = users[i]
+                process_request(request)
+            with translation.override(language), \
+                    CaptureQueriesContext(connection) as queries:
+                timings = measure(call, REPEAT)
+            return timings, len(queries) / REPEAT
+
+        for name, process_request in (
+                ('before', reverse_every_request),
+                ('after', middleware.process_request)):
+            timings, queries = run(process_request)
+            report('{}, {}'.format(language, name), timings, unit=1e6,
+                   unit_name='us')
+            print('{:<40} {:.1f} queries'.format('', queries))
+
+
+if __name__ == '__main__':
+    setup()
+    with test_database():
+        main()
@@ -0,0 +1,77 @@
+"""
+Ledger of a year of payments: 100 a day, most with two transactions. Exports
+the first month and the whole year in both formats and reports the time
+taken and the peak of memory allocated, which should not grow with the
+length of the period.
+"""
+import time
+import tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+
+from benchmarks import setup, test_database
+
+DAYS = 365
+PAYMENTS_PER_DAY = 100
+START = date(2016, 1, 1)
+
+
+def populate():
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from eggplant.factories import AccountFactory
+    from eggplant.market.models import GetPaidPayment, Payment
+
+    user = User.objects.create(username='member')
+    account = AccountFactory()
+    # created is set on insert, the payments are spread over the year after.
+    Payment.objects.bulk_create(
+        Payment(amount=Decimal('31.25'), account=account, user=user)
+        for i in range(DAYS * PAYMENTS_PER_DAY))
+    pks = list(Payment.objects.order_by('pk').values_list('pk', flat=True))
+    midnight = timezone.make_aware(
+        timezone.datetime.combine(START, timezone.datetime.min.time()))
+    for day in range(DAYS):
+        Payment.objects.filter(
+            pk__in=pks[day * PAYMENTS_PER_DAY:(day + 1) * PAYMENTS_PER_DAY])\
+            .update(created=midnight + timedelta(days=day, hours=12))
+    transactions = []
+    for i, pk in enumerate(pks):
+        statuses = ('failed', 'paid') if i % 10 else ('new',)
+        transactions.extend(
+            GetPaidPayment(order_id=pk, amount=Decimal('31.25'),
+                           currency='DKK', status=status,
+                           backend='getpaid.backends.epaydk')
+            for status in statuses)
+    GetPaidPayment.objects.bulk_create(transactions, batch_size=500)
+    return len(pks), len(transactions)
+
+
+def timed(name, func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = func()
+    duration = time.perf_counter() - start
+    __, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('{:<40} {:8.2f}s peak={:7.1f}MiB {:7.1f}MiB out'.format(
+        name, duration, peak / 1024 / 1024, size / 1024 / 1024))
+
+
+def main():
+    from eggplant.market.ledger import date_range, export_ledger
+
+    payments, transactions = populate()
+    print('{} payments, {} transactions'.format(payments, transactions))
+    for days in (30, DAYS):
+        period = date_range(START, START + timedelta(days=days - 1))
+        for fmt in ('csv', 'jsonl'):
+            timed('{}, {} days'.format(fmt, days),
+                  lambda: sum(len(chunk)
+                              for chunk in export_ledger(fmt, *period)))
+
+
+if __name__ == '__main__':
+    setup()
+    with test_database():
+        main()
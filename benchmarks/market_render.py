@@ -0,0 +1,73 @@
+"""
+Cost of rendering the market page with N products, with the product grid
+rendered from scratch on every request (i.e. a cold fragment cache), and of
+fetching the deepest page of the catalog through the infinite scrolling
+endpoint.
+
+Templates are loaded through the cached loader, as in production.
+"""
+import copy
+from decimal import Decimal
+
+from benchmarks import measure, report, setup, test_database
+
+SIZES = (10, 100, 300, 10000)
+REPEAT = 20
+
+
+def main():
+    from django.core.cache import cache
+    from django.test import RequestFactory
+    from eggplant.factories import UserFactory
+    from eggplant.market.models import Product, ProductCategory, ProductTax
+    from eggplant.market.pagination import make_cursor
+    from eggplant.market.views.inventory import market_home, product_page
+
+    category = ProductCategory.objects.create(title='bench')
+    tax = ProductTax.objects.create(title='bench', tax=Decimal(0))
+    request = RequestFactory().get('/en/market/')
+    request.user = UserFactory()
+
+    def render(i):
+        cache.clear()
+        market_home(request)
+
+    for size in SIZES:
+        Product.objects.all().delete()
+        Product.objects.bulk_create(
+            Product(title='product %d' % i, description='description',
+                    category=category, tax=tax, price=Decimal('1'))
+            for i in range(size))
+        render(0)
+        timings = measure(render, REPEAT)
+        report('market_home, {} products'.format(size), timings)
+
+        last = Product.objects.order_by('category', 'title', 'id')\
+            .reverse()[1]
+        page_request = RequestFactory().get('/en/market/products/',
+                                            {'after': make_cursor(last)})
+        page_request.user = request.user
+        timings = measure(lambda i: product_page(page_request), REPEAT)
+        report('  last page', timings)
+
+
+def cached_loader_templates():
+    from django.conf import settings
+    templates = copy.deepcopy(settings.TEMPLATES)
+    templates[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+    return templates
+
+
+if __name__ == '__main__':
+    setup()
+    from django.test.utils import override_settings
+    from django.utils import translation
+    translation.activate('en')
+    with test_database(), \
+            override_settings(TEMPLATES=cached_loader_templates()):
+        main()
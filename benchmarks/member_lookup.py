@@ -0,0 +1,66 @@
+"""
+Latency of the type-ahead member lookup of the cashiers over 50k members,
+against the search index of the database in use, compared with filtering
+the users, profiles and accounts with icontains.
+"""
+import random
+
+from benchmarks import measure, report, setup, test_database
+
+MEMBERS = 50000
+REPEAT = 50
+FIRST_NAMES = ('anna', 'bo', 'carl', 'dorthe', 'emil', 'freja', 'gustav',
+               'hanne', 'ida', 'jens', 'karen', 'lars', 'mette', 'niels')
+LAST_NAMES = ('jensen', 'nielsen', 'hansen', 'pedersen', 'andersen',
+              'christensen', 'larsen', 'sørensen', 'rasmussen', 'jørgensen')
+QUERIES = ('an', 'mette lar', 'nielsen', '2345', 'freja@', 'ida ras')
+
+
+def main():
+    from django.contrib.auth.models import User
+    from django.db.models import Q
+    from eggplant.profiles.models import UserProfile
+    from eggplant.profiles.search import member_document, search_members
+
+    rnd = random.Random(42)
+    users = []
+    for i in range(MEMBERS):
+        first, last = rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES)
+        users.append(User(username='member{}'.format(i), first_name=first,
+                          last_name=last,
+                          email='{}.{}{}@example.com'.format(first, last, i)))
+    # Neither sends signals: the profiles and their search text are made
+    # here instead.
+    User.objects.bulk_create(users)
+    UserProfile.objects.bulk_create(
+        UserProfile(user_id=pk, tel='+45 {:08d}'.format(rnd.randrange(10**8)),
+                    search_text=member_document(first, last, email, '', '',
+                                                ()))
+        for pk, first, last, email in User.objects.values_list(
+            'pk', 'first_name', 'last_name', 'email').iterator())
+
+    def naive(query):
+        queryset = UserProfile.objects.all()
+        for word in query.split():
+            queryset = queryset.filter(
+                Q(user__first_name__icontains=word) |
+                Q(user__last_name__icontains=word) |
+                Q(user__email__icontains=word) |
+                Q(tel__icontains=word) | Q(tel2__icontains=word) |
+                Q(accounts__name__icontains=word))
+        return queryset.distinct()
+
+    queryset = UserProfile.objects.select_related('user')
+    for query in QUERIES:
+        timings = measure(
+            lambda i: list(naive(query).select_related('user')[:10]), REPEAT)
+        report('icontains "{}"'.format(query), timings)
+        timings = measure(lambda i: list(search_members(queryset, query)),
+                          REPEAT)
+        report('indexed   "{}"'.format(query), timings)
+
+
+if __name__ == '__main__':
+    setup()
+    with test_database():
+        main()
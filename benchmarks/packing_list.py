@@ -0,0 +1,83 @@
+"""
+Packing lists of a delivery date with 5k checked-out baskets of 10 lines
+each: the totals per product, both CSV exports and the printable list.
+Every one of them should take well under a second.
+"""
+import time
+from datetime import date
+from decimal import Decimal
+
+from benchmarks import setup, test_database
+
+BASKETS = 5000
+LINES = 10
+PRODUCTS = 200
+DELIVERY_DATE = date(2016, 2, 1)
+
+
+def populate():
+    from django.contrib.auth.models import User
+    from eggplant.factories import AccountFactory
+    from eggplant.market.models import (OrderLine, Payment, Product,
+                                        ProductCategory, ProductTax)
+
+    category = ProductCategory.objects.create(title='bench')
+    tax = ProductTax.objects.create(title='bench', tax=Decimal('0.25'))
+    Product.objects.bulk_create(
+        Product(title='product {}'.format(i), category=category, tax=tax,
+                price=Decimal('2.50'))
+        for i in range(PRODUCTS))
+    products = list(Product.objects.order_by('pk'))
+    User.objects.bulk_create(
+        User(username='member{}'.format(i), first_name='Member',
+             last_name=str(i))
+        for i in range(BASKETS))
+    account = AccountFactory()
+    Payment.objects.bulk_create(
+        Payment(amount=Decimal('31.25'), account=account, user=user)
+        for user in User.objects.filter(username__startswith='member'))
+    lines = []
+    for i, payment in enumerate(Payment.objects.order_by('pk')):
+        for j in range(LINES):
+            product = products[(i + j * 7) % PRODUCTS]
+            lines.append(OrderLine(
+                payment=payment, product=product, title=product.title,
+                quantity=1 + j % 3, unit_price=product.price, tax=tax,
+                tax_rate=tax.tax, delivery_date=DELIVERY_DATE))
+    OrderLine.objects.bulk_create(lines)
+    return len(lines)
+
+
+def timed(name, func):
+    start = time.perf_counter()
+    size = func()
+    print('{:<40} {:8.3f}s {:>10}'.format(name, time.perf_counter() - start,
+                                          size))
+
+
+def main():
+    from django.contrib.auth.models import AnonymousUser
+    from django.test import RequestFactory
+    from eggplant.market.packing import export_packing_list, products_to_pack
+    from eggplant.market.views.packing import render_packing_list
+
+    print('{} baskets, {} order lines'.format(BASKETS, populate()))
+    request = RequestFactory().get('/')
+    request.user = AnonymousUser()
+
+    def size_of(chunks):
+        return sum(len(chunk) for chunk in chunks)
+
+    timed('totals per product', lambda: len(products_to_pack(DELIVERY_DATE)))
+    timed('csv by product', lambda: size_of(
+        export_packing_list(DELIVERY_DATE, 'product')))
+    timed('csv by member', lambda: size_of(
+        export_packing_list(DELIVERY_DATE, 'member')))
+    timed('printable', lambda: size_of(
+        render_packing_list(request, DELIVERY_DATE)))
+
+
+if __name__ == '__main__':
+    setup()
+    with test_database():
+        main()
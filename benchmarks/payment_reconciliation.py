@@ -0,0 +1,91 @@
+"""
+Reconciliation of 100k paid transactions with a settlement report in which
+one in a hundred is missing, one in a hundred settled for the wrong amount
+and one in two hundred settled twice. Reconciles a tenth of the report, then
+all of it, and reports the time taken and the peak of memory allocated,
+which grows only by the set of the ids settled.
+"""
+import time
+import tracemalloc
+from datetime import timedelta
+from decimal import Decimal
+
+from benchmarks import setup, test_database
+
+TRANSACTIONS = 100000
+PAYMENTS = 1000
+
+
+def populate():
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from eggplant.factories import AccountFactory
+    from eggplant.market.models import GetPaidPayment, Payment
+
+    user = User.objects.create(username='member')
+    account = AccountFactory()
+    Payment.objects.bulk_create(
+        Payment(amount=Decimal('31.25'), account=account, user=user)
+        for i in range(PAYMENTS))
+    pks = list(Payment.objects.order_by('pk').values_list('pk', flat=True))
+    GetPaidPayment.objects.bulk_create(
+        (GetPaidPayment(order_id=pks[i % PAYMENTS], amount=Decimal('31.25'),
+                        currency='DKK', status='paid',
+                        amount_paid=Decimal('31.25'), paid_on=timezone.now(),
+                        backend='getpaid.backends.epaydk')
+         for i in range(TRANSACTIONS)), batch_size=500)
+    return list(GetPaidPayment.objects.order_by('pk')
+                .values_list('pk', flat=True))
+
+
+def settlement(pks):
+    yield 'transaction,amount,currency,external_id\n'
+    for i, pk in enumerate(pks):
+        if i % 100 == 1:
+            continue
+        amount = '31.00' if i % 100 == 2 else '31.25'
+        line = '{},{},DKK,{}\n'.format(pk, amount, i)
+        yield line
+        if i % 200 == 3:
+            yield line
+
+
+def timed(name, func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    duration = time.perf_counter() - start
+    __, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('{:<40} {:8.2f}s peak={:7.1f}MiB'.format(
+        name, duration, peak / 1024 / 1024))
+    return result
+
+
+def main():
+    from django.utils import timezone
+    from eggplant.market.importexport import read_rows
+    from eggplant.market.ledger import date_range
+    from eggplant.market.reconciliation import Reconciler
+
+    pks = populate()
+    today = timezone.now().date()
+    period = date_range(today - timedelta(days=1), today)
+    for count in (len(pks) // 10, len(pks)):
+        # A generator rather than a file, so the file is not held in memory.
+        reconciler = timed(
+            'reconcile, {} transactions'.format(count),
+            lambda: Reconciler().run(read_rows(settlement(pks[:count]),
+                                               'csv')))
+        print('  matched={} mismatched={} duplicate={}'.format(
+            reconciler.matched, reconciler.mismatched, reconciler.duplicate))
+    reconciler = timed('reconcile with missing, {} transactions'.format(
+        len(pks)), lambda: Reconciler().run(
+            read_rows(settlement(pks), 'csv'), *period))
+    print('  missing={}'.format(reconciler.missing))
+
+
+if __name__ == '__main__':
+    setup()
+    with test_database():
+        main()
@@ -0,0 +1,69 @@
+"""
+Import of a 20k row supplier price list: first creating every product, then
+updating a tenth of them, and exporting the catalog again. Reports the time
+taken and the peak of memory allocated while doing it.
+"""
+import time
+import tracemalloc
+from decimal import Decimal
+
+from benchmarks import setup, test_database
+
+ROWS = 20000
+
+
+def price_list(changed_every=None):
+    yield 'sku,title,description,category,price,currency,tax,stock,enabled\n'
+    for i in range(ROWS):
+        price = Decimal(i % 100) + Decimal('0.50')
+        if changed_every and i % changed_every == 0:
+            price += 1
+        yield 'SKU{0},product {0},description of product {0},bench,{1},DKK,' \
+              'bench,{2},true\n'.format(i, price, i % 50)
+
+
+def timed(name, func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    duration = time.perf_counter() - start
+    __, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('{:<40} {:8.2f}s peak={:7.1f}MiB'.format(
+        name, duration, peak / 1024 / 1024))
+    return result
+
+
+def main():
+    from eggplant.market.importexport import (ProductImporter,
+                                              export_products, read_rows)
+    from eggplant.market.models import ProductCategory, ProductTax
+
+    ProductCategory.objects.create(title='bench')
+    ProductTax.objects.create(title='bench', tax=Decimal(0))
+
+    def run(changed_every=None):
+        # A generator rather than a file, so the file is not held in memory.
+        lines = price_list(changed_every)
+        return ProductImporter().run(read_rows(lines, 'csv'))
+
+    importer = timed('import, {} new rows'.format(ROWS), run)
+    print('  created={} errors={}'.format(importer.created,
+                                          importer.error_count))
+    importer = timed('import, 1/10 rows changed', lambda: run(10))
+    print('  updated={} unchanged={}'.format(importer.updated,
+                                             importer.unchanged))
+
+    def export():
+        size = 0
+        for chunk in export_products('csv'):
+            size += len(chunk)
+        return size
+    size = timed('export csv', export)
+    print('  {:.1f}MiB'.format(size / 1024 / 1024))
+
+
+if __name__ == '__main__':
+    setup()
+    with test_database():
+        main()
@@ -0,0 +1,53 @@
+"""
+Latency of ranked product searches over a large catalog, against the
+search index of the database in use, compared with the naive icontains
+filtering it replaces.
+"""
+import random
+from decimal import Decimal
+
+from benchmarks import measure, report, setup, test_database
+
+PRODUCTS = 50000
+REPEAT = 50
+WORDS = ('apple', 'carrot', 'potato', 'organic', 'local', 'juice', 'bread',
+         'cheese', 'honey', 'kale', 'onion', 'pear', 'plum', 'rye', 'leek')
+QUERIES = ('apple', 'organic carrot', 'hon', 'local rye bread', 'pe')
+
+
+def main():
+    from django.db.models import Q
+    from eggplant.market.models import Product, ProductCategory, ProductTax
+    from eggplant.market.search import search_products
+
+    category = ProductCategory.objects.create(title='bench')
+    tax = ProductTax.objects.create(title='bench', tax=Decimal(0))
+    rnd = random.Random(42)
+    Product.objects.bulk_create(
+        (Product(title=' '.join(rnd.sample(WORDS, 2)) + ' %d' % i,
+                 description=' '.join(rnd.sample(WORDS, 6)),
+                 category=category, tax=tax, price=Decimal('1'))
+         for i in range(PRODUCTS)))
+
+    def naive(query):
+        queryset = Product.objects.all()
+        for word in query.split():
+            queryset = queryset.filter(Q(title__icontains=word) |
+                                       Q(description__icontains=word))
+        return queryset
+
+    for query in QUERIES:
+        timings = measure(
+            lambda i: list(naive(query).order_by('title')[:20]), REPEAT)
+        report('icontains "{}"'.format(query), timings)
+        timings = measure(
+            lambda i: list(search_products(Product.objects.all(), query,
+                                           language='en')[:20]),
+            REPEAT)
+        report('ranked    "{}"'.format(query), timings)
+
+
+if __name__ == '__main__':
+    setup()
+    with test_database():
+        main()
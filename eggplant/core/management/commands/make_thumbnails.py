@@ -0,0 +1,68 @@
+import logging
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from eggplant.core.thumbnails import (get_worker_count, has_thumbnails,
+                                      render_in_background, store_thumbnails)
+
+log = logging.getLogger(__name__)
+
+# The image fields thumbnails are made for.
+IMAGE_FIELDS = (
+    ('market.Product', 'image'),
+    ('profiles.UserProfile', 'photo'),
+)
+
+
+class Command(BaseCommand):
+    help = "Make the thumbnails of the images uploaded so far."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true', default=False,
+            help="Make the thumbnails again, even if they exist."
+        )
+
+    def handle(self, *args, **options):
+        self.made = self.failed = 0
+        # Only a couple of images per worker are kept in memory at a time.
+        max_pending = get_worker_count() * 2
+        pending = {}
+        for fieldfile in self.get_images():
+            if not options['force'] and has_thumbnails(fieldfile):
+                continue
+            try:
+                pending[render_in_background(fieldfile)] = fieldfile
+            except (IOError, OSError):
+                log.exception("Could not read %s", fieldfile.name)
+                self.failed += 1
+                continue
+            if len(pending) >= max_pending:
+                finished, __ = wait(pending, return_when=FIRST_COMPLETED)
+                self.store(pending, finished)
+        self.store(pending, wait(pending).done)
+        self.stdout.write("Made the thumbnails of {} image(s), {} failed."
+                          .format(self.made, self.failed))
+
+    def get_images(self):
+        for label, field in IMAGE_FIELDS:
+            queryset = apps.get_model(label).objects\
+                .exclude(**{field: ''}).exclude(**{field: None})\
+                .only('pk', field)
+            for instance in queryset.iterator():
+                yield getattr(instance, field)
+
+    def store(self, pending, finished):
+        for future in finished:
+            fieldfile = pending.pop(future)
+            try:
+                store_thumbnails(fieldfile.storage, fieldfile.name,
+                                 future.result())
+            except Exception:
+                log.exception("Could not make the thumbnails of %s",
+                              fieldfile.name)
+                self.failed += 1
+            else:
+                self.made += 1
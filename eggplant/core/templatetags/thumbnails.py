@@ -0,0 +1,21 @@
+from django import template
+
+from eggplant.core.thumbnails import get_srcset, get_thumbnail_url
+
+register = template.Library()
+
+
+@register.filter
+def srcset(fieldfile, ext='webp'):
+    """
+    ``srcset`` of the thumbnails of an image, e.g.::
+
+        <source type="image/webp" srcset="{{ product.image|srcset:'webp' }}">
+    """
+    return get_srcset(fieldfile, ext)
+
+
+@register.filter
+def thumbnail(fieldfile, width):
+    """URL of the JPEG thumbnail of an image at least ``width`` wide."""
+    return get_thumbnail_url(fieldfile, int(width))
@@ -1,7 +1,18 @@
+import io
+import shutil
+import tempfile
+from decimal import Decimal
+
 from django.conf import settings
-from django.test import TestCase
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 from django.test.client import RequestFactory
+from PIL import Image
+from eggplant.core.templatetags.thumbnails import srcset, thumbnail
+from eggplant.core.thumbnails import has_thumbnails, thumbnail_name
 from eggplant.core.utils import generate_upload_path
+from eggplant.market.models import Product, ProductCategory, ProductTax
 
 from .context_processors import coop_vars
 
@@ -22,3 +33,59 @@ class UtilsTestCase(TestCase):
         self.assertIn('LANGUAGE_CHOOSER', context)
         for lang_code, __ in settings.LANGUAGES:
             self.assertIn(lang_code, context['LANGUAGE_CHOOSER'])
+
+
+class ThumbnailsTestCase(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root,
+                                     EGGPLANT_THUMBNAIL_WIDTHS=(100, 200),
+                                     EGGPLANT_THUMBNAIL_WORKERS=2)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        data = io.BytesIO()
+        Image.new('RGBA', (800, 400), (255, 0, 0, 128)).save(data, 'PNG')
+        self.product = Product(
+            title='test_product', description='',
+            category=ProductCategory.objects.create(title='test_category'),
+            tax=ProductTax.objects.create(title='test_tax', tax=Decimal(0)),
+            price=Decimal('10'))
+        self.product.image.save('photo.png', ContentFile(data.getvalue()))
+
+    def test_make_thumbnails(self):
+        image = self.product.image
+        self.assertFalse(has_thumbnails(image))
+        self.assertEqual(srcset(image), image.url)
+        self.assertEqual(thumbnail(image, 100), image.url)
+
+        call_command('make_thumbnails', stdout=io.StringIO())
+        self.assertTrue(has_thumbnails(image))
+        for width in (100, 200):
+            for ext in ('jpg', 'webp'):
+                with image.storage.open(
+                        thumbnail_name(image.name, width, ext)) as f:
+                    self.assertEqual(Image.open(f).size,
+                                     (width, width // 2))
+
+        self.assertEqual(
+            srcset(image, 'webp'),
+            '{0}.100.webp 100w, {0}.200.webp 200w'.format(
+                image.url.rsplit('.', 1)[0]))
+        self.assertTrue(thumbnail(image, 150).endswith('.200.jpg'))
+        self.assertTrue(thumbnail(image, 1000).endswith('.200.jpg'))
+
+    def test_readiness_is_cached(self):
+        image = self.product.image
+        largest = thumbnail_name(image.name, 200, 'webp')
+        with override_settings(EGGPLANT_THUMBNAIL_MISSING_TIMEOUT=0):
+            self.assertFalse(has_thumbnails(image))
+            image.storage.save(largest, ContentFile(b''))
+            self.assertTrue(has_thumbnails(image))
+        # Once ready, the storage is not asked again.
+        image.storage.delete(largest)
+        self.assertTrue(has_thumbnails(image))
+        with override_settings(EGGPLANT_THUMBNAIL_WIDTHS=(100, 300)):
+            self.assertFalse(has_thumbnails(image))
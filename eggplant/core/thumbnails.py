@@ -0,0 +1,189 @@
+"""
+Thumbnails of uploaded images.
+
+Every image gets a thumbnail per width in settings.EGGPLANT_THUMBNAIL_WIDTHS,
+both as WebP and as JPEG, stored next to the original:
+``product_images/<name>.jpg`` gives ``product_images/<name>.320.webp``,
+``product_images/<name>.320.jpg`` and so on.
+
+Resizing runs in a pool of worker processes once the upload has been
+committed, so it neither holds up the request nor the GIL of the process
+serving it. Until the thumbnails are ready the original is served.
+
+Whether they are ready is cached per image and set of widths: once for good,
+since an upload never gets the name of another, and briefly while they are
+not, in case another process stores them.
+"""
+import hashlib
+import io
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.dispatch import Signal
+
+log = logging.getLogger(__name__)
+
+FORMATS = {
+    'webp': 'WEBP',
+    'jpg': 'JPEG',
+}
+
+# Sent once the thumbnails of an image have been stored.
+thumbnails_ready = Signal(providing_args=['storage', 'name'])
+
+_pool = None
+
+
+def get_thumbnail_widths():
+    return getattr(settings, 'EGGPLANT_THUMBNAIL_WIDTHS', (160, 320, 640))
+
+
+def get_missing_timeout():
+    """Seconds to remember that the thumbnails of an image are missing."""
+    return getattr(settings, 'EGGPLANT_THUMBNAIL_MISSING_TIMEOUT', 60)
+
+
+def get_worker_count():
+    return getattr(settings, 'EGGPLANT_THUMBNAIL_WORKERS', None) or \
+        os.cpu_count() or 1
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(get_worker_count())
+    return _pool
+
+
+def thumbnail_name(name, width, ext):
+    return '{}.{}.{}'.format(os.path.splitext(name)[0], width, ext)
+
+
+def _ready_key(name):
+    widths = ','.join(str(width) for width in sorted(get_thumbnail_widths()))
+    return 'thumbnails:' + hashlib.md5(
+        '{}:{}'.format(name, widths).encode()).hexdigest()
+
+
+def has_thumbnails(fieldfile):
+    """
+    Whether all thumbnails of ``fieldfile`` are in place; the largest WebP
+    one is stored last.
+    """
+    key = _ready_key(fieldfile.name)
+    ready = cache.get(key)
+    if ready is None:
+        ready = fieldfile.storage.exists(thumbnail_name(
+            fieldfile.name, max(get_thumbnail_widths()), 'webp'))
+        cache.set(key, ready, None if ready else get_missing_timeout())
+    return ready
+
+
+def render_thumbnails(data, widths):
+    """
+    Resize the image in ``data`` (bytes) to every width in ``widths``.
+    Returns a list of ``(width, ext, bytes)``, in the order they should be
+    stored. Runs in the worker processes, hence only plain data in and out.
+    """
+    from PIL import Image
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    thumbnails = []
+    for ext in ('jpg', 'webp'):
+        for width in sorted(widths):
+            thumbnail = image.copy()
+            # Never upscale, a small original just gets re-encoded.
+            thumbnail.thumbnail((width, width * 4), Image.LANCZOS)
+            if ext == 'jpg' and thumbnail.mode != 'RGB':
+                thumbnail = thumbnail.convert('RGB')
+            elif ext == 'webp' and thumbnail.mode not in ('RGB', 'RGBA'):
+                thumbnail = thumbnail.convert('RGBA')
+            output = io.BytesIO()
+            thumbnail.save(output, FORMATS[ext], quality=80)
+            thumbnails.append((width, ext, output.getvalue()))
+    return thumbnails
+
+
+def store_thumbnails(storage, name, thumbnails):
+    for width, ext, data in thumbnails:
+        path = thumbnail_name(name, width, ext)
+        if storage.exists(path):
+            storage.delete(path)
+        storage.save(path, ContentFile(data))
+    cache.set(_ready_key(name), True, None)
+    thumbnails_ready.send(sender=None, storage=storage, name=name)
+
+
+def render_in_background(fieldfile):
+    """
+    Hand the image of ``fieldfile`` to the pool, returns the future of the
+    rendered thumbnails.
+    """
+    with fieldfile.storage.open(fieldfile.name) as f:
+        data = f.read()
+    return get_pool().submit(render_thumbnails, data, get_thumbnail_widths())
+
+
+def submit_thumbnails(fieldfile):
+    """
+    Make and store the thumbnails of ``fieldfile`` in the background, unless
+    they already exist.
+    """
+    if has_thumbnails(fieldfile):
+        return
+    future = render_in_background(fieldfile)
+    future.add_done_callback(
+        partial(_store_result, fieldfile.storage, fieldfile.name))
+
+
+def _store_result(storage, name, future):
+    try:
+        store_thumbnails(storage, name, future.result())
+    except Exception:
+        log.exception("Could not make the thumbnails of %s", name)
+
+
+def schedule_thumbnails(fieldfile):
+    """
+    Make the thumbnails of ``fieldfile`` in the background once the current
+    transaction commits.
+    """
+    if not fieldfile:
+        return
+    transaction.on_commit(partial(submit_thumbnails, fieldfile))
+
+
+def get_srcset(fieldfile, ext):
+    """
+    The ``srcset`` of the thumbnails of ``fieldfile`` in the format ``ext``,
+    or the URL of the original while they are not ready.
+    """
+    if not fieldfile:
+        return ''
+    if not has_thumbnails(fieldfile):
+        return fieldfile.url
+    return ', '.join(
+        '{} {}w'.format(
+            fieldfile.storage.url(thumbnail_name(fieldfile.name, width, ext)),
+            width)
+        for width in sorted(get_thumbnail_widths()))
+
+
+def get_thumbnail_url(fieldfile, width, ext='jpg'):
+    """
+    URL of the smallest thumbnail of ``fieldfile`` at least ``width`` wide,
+    or of the original while the thumbnails are not ready.
+    """
+    if not fieldfile:
+        return ''
+    if not has_thumbnails(fieldfile):
+        return fieldfile.url
+    widths = sorted(get_thumbnail_widths())
+    width = next((w for w in widths if w >= width), widths[-1])
+    return fieldfile.storage.url(thumbnail_name(fieldfile.name, width, ext))
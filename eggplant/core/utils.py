@@ -1,3 +1,4 @@
+import argparse
 import os
 import uuid
 from functools import wraps
@@ -5,6 +6,7 @@ from functools import wraps
 from django.conf import settings
 from django.contrib.sites.models import Site
 from django.core.urlresolvers import reverse
+from django.utils.dateparse import parse_date
 
 
 def absolute_url_reverse(url_name=None, **kwargs):
@@ -39,3 +41,18 @@ def disable_for_loaddata(signal_handler):
             return
         signal_handler(*args, **kwargs)
     return wrapper
+
+
+def date_argument(value):
+    """
+    Argparse type of a YYYY-MM-DD date: parse_date returns None for what
+    does not look like one, which argparse would take for a value.
+    """
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise argparse.ArgumentTypeError(
+            "{!r} is not a valid date, use YYYY-MM-DD.".format(value))
+    return parsed
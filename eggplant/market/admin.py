@@ -1,23 +1,112 @@
 from django.conf import settings
 from django.contrib import admin
 from django.contrib.admin.sites import AlreadyRegistered
+from django.utils.translation import ugettext_lazy as _
 from getpaid.admin import PaymentAdmin
 
-from .models import GetPaidPayment, Payment
+from .models import GetPaidPayment, OrderLine, Payment
+from .models.audit import PaymentEvent
+from .models.callback import PaymentCallback
 from .models.cart import Basket
+from .models.delivery import PickupSlot, ProductSupply
 from .models.inventory import Product, ProductCategory, ProductTax
+from .models.reconciliation import Reconciliation
 
 try:
     admin.site.register(GetPaidPayment, PaymentAdmin)
 except AlreadyRegistered:
     pass
 
-admin.site.register(Payment)
+
+class OrderLineInline(admin.TabularInline):
+    model = OrderLine
+    fields = readonly_fields = ('title', 'sku', 'quantity', 'unit_price',
+                                'tax_rate', 'delivery_date')
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request):
+        return False
+
+
+class MarketPaymentAdmin(admin.ModelAdmin):
+    inlines = [OrderLineInline]
+
+admin.site.register(Payment, MarketPaymentAdmin)
+
+
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = ('created', 'event', 'payment_id', 'transaction_id',
+                    'user_id')
+    list_filter = ('event',)
+    search_fields = ('=payment_id', '=transaction_id')
+    readonly_fields = ('created', 'event', 'payment_id', 'transaction_id',
+                       'user_id', 'data')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+admin.site.register(PaymentEvent, PaymentEventAdmin)
+
+
+class PaymentCallbackStateFilter(admin.SimpleListFilter):
+    title = _("state")
+    parameter_name = 'state'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('pending', _("pending")),
+            ('processed', _("processed")),
+            ('failed', _("failed")),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() == 'pending':
+            return queryset & PaymentCallback.objects.pending()
+        if self.value() == 'processed':
+            return queryset.exclude(processed=None)
+        if self.value() == 'failed':
+            return queryset & PaymentCallback.objects.failed()
+        return queryset
+
+
+class PaymentCallbackAdmin(admin.ModelAdmin):
+    list_display = ('received', 'backend', 'transaction', 'status',
+                    'processed', 'attempts')
+    list_filter = (PaymentCallbackStateFilter, 'backend', 'status')
+    readonly_fields = ('backend', 'transaction', 'status', 'params',
+                       'received')
+
+admin.site.register(PaymentCallback, PaymentCallbackAdmin)
+
+
+class ReconciliationAdmin(admin.ModelAdmin):
+    list_display = ('transaction', 'status', 'settled_amount',
+                    'settled_currency', 'source', 'reconciled')
+    list_filter = ('status', 'source')
+    search_fields = ('=transaction__id', 'external_id')
+    readonly_fields = ('transaction', 'status', 'settled_amount',
+                       'settled_currency', 'external_id', 'source',
+                       'reconciled')
+
+    def has_add_permission(self, request):
+        return False
+
+admin.site.register(Reconciliation, ReconciliationAdmin)
+
+
+class ProductSupplyInline(admin.TabularInline):
+    model = ProductSupply
+    extra = 0
 
 
 class ProductAdmin(admin.ModelAdmin):
     list_display = ('title', 'category', 'stock', 'price', 'enabled')
     list_filter = ('enabled', 'category__title')
+    inlines = [ProductSupplyInline]
 
 admin.site.register(Product, ProductAdmin)
 
@@ -30,5 +119,11 @@ admin.site.register(ProductCategory, ProductCategoryAdmin)
 
 admin.site.register(ProductTax)
 
+
+class PickupSlotAdmin(admin.ModelAdmin):
+    list_display = ('date', 'capacity', 'booked')
+
+admin.site.register(PickupSlot, PickupSlotAdmin)
+
 if settings.DEBUG:
     admin.site.register(Basket)
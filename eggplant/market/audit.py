@@ -0,0 +1,173 @@
+"""
+Audit log of what happens to payments: transactions started, their changes
+of status and the checks of who may pay.
+
+The getpaid listeners only put a tuple of plain values on a bounded queue,
+everything else happens off the request: a background thread takes the
+events off the queue, formats them and writes them as PaymentEvent rows,
+one INSERT per batch of up to settings.MARKET_AUDIT_LOG_BATCH_SIZE events
+or whatever arrived within settings.MARKET_AUDIT_LOG_INTERVAL seconds.
+
+A full queue never holds up a payment, the event is dropped and counted
+instead. What is still queued is written when the process exits.
+
+With settings.MARKET_AUDIT_LOG_ASYNC False (the test settings do so) every
+event is written as it happens.
+"""
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.utils import timezone
+
+log = logging.getLogger(__name__)
+
+# Tells the writer thread to stop once it has written what came before.
+STOP = object()
+
+_audit_log = None
+_lock = threading.Lock()
+
+
+def get_queue_size():
+    return getattr(settings, 'MARKET_AUDIT_LOG_QUEUE_SIZE', 10000)
+
+
+def get_batch_size():
+    return getattr(settings, 'MARKET_AUDIT_LOG_BATCH_SIZE', 500)
+
+
+def get_interval():
+    return getattr(settings, 'MARKET_AUDIT_LOG_INTERVAL', 1.0)
+
+
+def is_async():
+    return getattr(settings, 'MARKET_AUDIT_LOG_ASYNC', True)
+
+
+class AuditLog:
+
+    def __init__(self, queue_size=None, batch_size=None, interval=None,
+                 background=None):
+        self.queue = queue.Queue(get_queue_size() if queue_size is None
+                                 else queue_size)
+        self.batch_size = batch_size or get_batch_size()
+        self.interval = get_interval() if interval is None else interval
+        self.background = is_async() if background is None else background
+        self.dropped = 0
+        self._thread = None
+
+    def record(self, event, payment_id=None, transaction_id=None,
+               user_id=None, **data):
+        """
+        Log ``event`` with ``data``, values json can serialize or turn into
+        strings. Returns False if the event had to be dropped.
+        """
+        item = (timezone.now(), event, payment_id, transaction_id, user_id,
+                data)
+        if not self.background:
+            self.write([item])
+            return True
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.start()
+        return True
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with _lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self.run, name='payment-audit-log', daemon=True)
+                self._thread.start()
+
+    def run(self):
+        stop = False
+        try:
+            while not stop:
+                batch = [self.queue.get()]
+                deadline = time.monotonic() + self.interval
+                while len(batch) < self.batch_size:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(self.queue.get(timeout=timeout))
+                    except queue.Empty:
+                        break
+                stop = STOP in batch
+                self.write([item for item in batch if item is not STOP])
+                for __ in batch:
+                    self.queue.task_done()
+        finally:
+            connection.close()
+
+    def write(self, items):
+        from .models.audit import PaymentEvent
+        if not items:
+            return
+        try:
+            PaymentEvent.objects.bulk_create(
+                PaymentEvent(created=created, event=event,
+                             payment_id=payment_id,
+                             transaction_id=transaction_id, user_id=user_id,
+                             data=json.dumps(data, default=str,
+                                             sort_keys=True))
+                for created, event, payment_id, transaction_id, user_id, data
+                in items)
+        except DatabaseError:
+            log.exception("Could not write %d payment events", len(items))
+
+    def flush(self):
+        """Wait until every event queued so far is written."""
+        if self._thread is not None and self._thread.is_alive():
+            self.queue.join()
+            return
+        items = []
+        while True:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        self.write([item for item in items if item is not STOP])
+        for __ in items:
+            self.queue.task_done()
+
+    def shutdown(self, timeout=10):
+        """Write what is queued and stop the writer thread."""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            self.flush()
+            return
+        try:
+            self.queue.put(STOP, timeout=timeout)
+        except queue.Full:
+            log.error("Payment events not written, the writer is stuck")
+            return
+        thread.join(timeout)
+        if self.dropped:
+            log.warning("%d payment events were dropped", self.dropped)
+
+
+def get_audit_log():
+    global _audit_log
+    if _audit_log is None:
+        with _lock:
+            if _audit_log is None:
+                _audit_log = AuditLog()
+                atexit.register(_audit_log.shutdown)
+    return _audit_log
+
+
+def record_event(event, **kwargs):
+    """Add ``event`` to the payment audit log, see AuditLog.record."""
+    return get_audit_log().record(event, **kwargs)
@@ -0,0 +1,74 @@
+"""
+Callbacks of the payment gateways, processed off the request.
+
+The callback views only check that a callback really comes from the
+gateway, queue it as a PaymentCallback and acknowledge it, so retries and
+bursts of callbacks cost the web workers next to nothing. The
+``process_payment_callbacks`` command then applies them, in as many
+processes as needed: every callback is locked while it is processed and
+workers skip those that are, a callback whose transaction already has its
+status is not applied again.
+
+Callbacks follow the contract of ePay, which the payment simulator copies,
+so the processor of the backend is all that differs.
+"""
+import logging
+from importlib import import_module
+
+from django.http import QueryDict
+from getpaid.backends.epaydk.forms import EpaydkOnlineForm
+from getpaid.utils import qs_to_ordered_params
+
+from .models.callback import PaymentCallback
+from .models.payment import GetPaidPayment
+
+log = logging.getLogger(__name__)
+
+
+def get_processor(backend):
+    return import_module(backend).PaymentProcessor
+
+
+def verify(processor, query, secret_path=''):
+    """
+    The id of the transaction a callback with the query string ``query``
+    confirms, or None if it did not come from the gateway of ``processor``.
+    """
+    expected = processor.get_backend_setting('callback_secret_path', '')
+    if expected and secret_path != expected:
+        return None
+    form = EpaydkOnlineForm(QueryDict(query))
+    if not form.is_valid():
+        return None
+    params = qs_to_ordered_params(query)
+    if not processor.is_received_request_valid(params):
+        return None
+    try:
+        return int(form.cleaned_data['orderid'])
+    except ValueError:
+        return None
+
+
+def queue_callback(processor, query, secret_path=''):
+    """
+    Check a callback of the gateway of ``processor`` with the query string
+    ``query`` and queue it. Returns whether it was valid.
+    """
+    transaction_id = verify(processor, query, secret_path)
+    if transaction_id is None or \
+            not GetPaidPayment.objects.filter(pk=transaction_id).exists():
+        log.error("Invalid callback of %s: %s", processor.BACKEND, query)
+        return False
+    # ePay calls back only once a payment is captured, there is no other
+    # status it reports.
+    PaymentCallback.objects.store(processor.BACKEND, transaction_id, 'paid',
+                                  query)
+    return True
+
+
+def apply_callback(callback, payment):
+    """Apply ``callback`` to ``payment``, its getpaid payment."""
+    form = EpaydkOnlineForm(QueryDict(callback.params))
+    if not form.is_valid():
+        raise ValueError(form.errors.as_text())
+    get_processor(callback.backend).confirmed(form.cleaned_data)
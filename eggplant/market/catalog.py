@@ -0,0 +1,51 @@
+"""
+Versioning of the product catalog.
+
+Rendered fragments of the market page are cached under a key that contains
+the current catalog version. Whenever a product, category or tax changes the
+version is bumped, so stale fragments are simply never looked up again and
+expire on their own.
+
+Notice: the version lives in the default cache, so all processes serving the
+market must share a cache backend (memcached, database, ...) for a change to
+be seen everywhere at once.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = 'eggplant:market:catalog-version'
+
+# Substituted with the real token of the request after a cached fragment has
+# been fetched, since the fragments are shared between all members.
+CSRF_TOKEN_PLACEHOLDER = '{{eggplant-csrf-token}}'
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Seed with a timestamp rather than 1 so that a version which has
+        # been evicted from the cache never goes back to a value that older
+        # fragments may still be stored under.
+        version = int(time.time() * 1000)
+        if not cache.add(CATALOG_VERSION_KEY, version, None):
+            version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        # The key is missing, seeding it yields a brand new version.
+        return get_catalog_version()
+
+
+def get_fragment_cache_timeout():
+    return getattr(settings, 'MARKET_CATALOG_CACHE_TIMEOUT', 60 * 60)
+
+
+def product_grid_cache_key(version, category, language):
+    return 'eggplant:market:product-grid:{}:{}:{}'.format(
+        version, category or 'all', language)
@@ -1,12 +1,15 @@
 import django_filters
+from django import forms
 from django.db.models.fields import BLANK_CHOICE_DASH
 from django.forms.widgets import flatatt
 from django.utils.encoding import force_text
 from django.utils.http import urlencode
 from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext as _
+from django.utils.translation import ugettext_lazy
 
 from .models.inventory import Product, ProductCategory
+from .search import search_products
 
 
 class LinksGroupWidget(django_filters.widgets.LinkWidget):
@@ -60,11 +63,20 @@ class ProductFilter(django_filters.FilterSet):
         queryset=ProductCategory.objects.filter(),
         widget=LinksGroupWidget()
     )
+    q = django_filters.CharFilter(
+        label='',
+        action=search_products,
+        widget=forms.TextInput(attrs={
+            'class': 'form-control',
+            'placeholder': ugettext_lazy("Search products"),
+        })
+    )
 
     class Meta:
         model = Product
         fields = [
             'category',
+            'q',
         ]
 
     def __init__(self, *args, **kwargs):
@@ -1,7 +1,13 @@
+import json
+
 from django import forms
+from django.db import transaction
 from django.forms import ModelForm
+from django.utils.translation import ugettext_lazy as _
 from eggplant.core.widgets import MoneyWidget
+from eggplant.departments.models import Department
 
+from .importexport import guess_format
 from .models.inventory import Product
 
 
@@ -17,3 +23,103 @@ class ProductForm(ModelForm):
         model = Product
         fields = ['title', 'description', 'price', 'category', 'tax', 'stock']
         widgets = {'price': MoneyWidget()}
+
+
+class ProductImportForm(forms.Form):
+    file = forms.FileField(label=_("Products file"),
+                           help_text=_("CSV or JSON Lines."))
+
+    def clean_file(self):
+        f = self.cleaned_data['file']
+        self.format = guess_format(f.name)
+        if self.format is None:
+            raise forms.ValidationError(
+                _("Upload a .csv or .jsonl file."))
+        return f
+
+
+class LedgerForm(forms.Form):
+    start = forms.DateField(label=_("From"))
+    end = forms.DateField(label=_("To"))
+    department = forms.ModelChoiceField(Department.objects.all(),
+                                        label=_("Department"),
+                                        required=False,
+                                        empty_label=_("All departments"))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get('start'), cleaned_data.get('end')
+        if start and end and start > end:
+            raise forms.ValidationError(_("The period ends before it starts."))
+        return cleaned_data
+
+
+class ProductGridForm(forms.Form):
+    """
+    The cells edited in the product grid of the purchaser dashboard, posted
+    at once as a JSON list of
+    ``{"product": id, "field": name, "value": new, "original": old}``.
+
+    Concurrency is handled optimistically: a product is only changed if
+    all its edited cells still hold the value the purchaser started from.
+    """
+    FIELDS = {
+        'stock': forms.IntegerField(min_value=0, required=False),
+        'price': forms.DecimalField(min_value=0, max_digits=12,
+                                    decimal_places=2),
+        'enabled': forms.BooleanField(required=False),
+    }
+
+    changes = forms.CharField()
+
+    def clean_changes(self):
+        try:
+            cells = json.loads(self.cleaned_data['changes'])
+        except ValueError:
+            raise forms.ValidationError(_("Invalid changes."))
+        if not isinstance(cells, list):
+            raise forms.ValidationError(_("Invalid changes."))
+        changes = {}
+        for cell in cells:
+            try:
+                product = int(cell['product'])
+                field = self.FIELDS[cell['field']]
+                value = field.clean(cell['value'])
+                original = field.clean(cell['original'])
+            except (KeyError, TypeError, ValueError):
+                raise forms.ValidationError(_("Invalid changes."))
+            except forms.ValidationError as e:
+                raise forms.ValidationError(
+                    _("Invalid {field} of product {product}: {error}").format(
+                        field=cell['field'], product=cell['product'],
+                        error=' '.join(e.messages)))
+            changes.setdefault(product, {})[cell['field']] = (value, original)
+        return changes
+
+    @transaction.atomic
+    def save(self):
+        """
+        Apply the changes with one bulk update. Returns the number of
+        products updated and the current values of those that were changed
+        meanwhile, which are left alone.
+        """
+        changes = self.cleaned_data['changes']
+        current = {
+            product['pk']: product for product in
+            Product.objects.select_for_update().filter(pk__in=list(changes))
+            .values('pk', *self.FIELDS)
+        }
+        updates, conflicts = {}, []
+        for pk, cells in changes.items():
+            if pk not in current:
+                continue
+            if any(current[pk][field] != original
+                   for field, (__, original) in cells.items()):
+                conflicts.append(current[pk])
+                continue
+            updates[pk] = {field: value
+                           for field, (value, __) in cells.items()
+                           if value != current[pk][field]}
+        Product.objects.bulk_update(
+            {pk: values for pk, values in updates.items() if values})
+        return len(updates), conflicts
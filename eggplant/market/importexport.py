@@ -0,0 +1,250 @@
+"""
+Bulk import and export of products, e.g. of the weekly price list of a
+supplier.
+
+Files are CSV with a header row, or JSON Lines (one JSON object per line),
+with the columns in COLUMNS. Categories and taxes are referred to by title.
+
+Both directions stream: rows are validated one at a time and written in
+batches, and exports are produced in chunks of products, so memory use does
+not grow with the size of the file. Products are matched on their supplier
+SKU: unknown SKUs are created, known ones updated if anything changed.
+"""
+import csv
+import json
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from moneyed import Money
+
+from .catalog import bump_catalog_version
+from .models.inventory import Product, ProductCategory, ProductTax
+
+COLUMNS = ('sku', 'title', 'description', 'category', 'price', 'currency',
+           'tax', 'stock', 'enabled')
+
+FORMATS = ('csv', 'jsonl')
+
+# Fields of Product written by an import.
+FIELDS = ('title', 'description', 'category_id', 'price', 'price_currency',
+          'tax_id', 'stock', 'enabled')
+
+TRUE_VALUES = ('1', 'true', 'yes', 'y')
+FALSE_VALUES = ('0', 'false', 'no', 'n')
+
+# Errors beyond these are counted but not kept.
+MAX_ERRORS = 100
+
+
+class RowError(Exception):
+    pass
+
+
+def guess_format(filename):
+    if filename.lower().endswith('.csv'):
+        return 'csv'
+    if filename.lower().endswith(('.jsonl', '.json', '.ndjson')):
+        return 'jsonl'
+    return None
+
+
+def read_rows(stream, fmt):
+    """
+    Yield ``(line number, row)`` for every row of the text ``stream``; rows
+    that cannot be parsed at all are yielded as None.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else None
+
+
+class ProductImporter:
+    """
+    Create and update products from rows as yielded by read_rows. Every
+    batch is written in its own transaction with one query to look up the
+    products, one ``bulk_create`` and one bulk update of the changed fields.
+    """
+
+    def __init__(self, batch_size=500):
+        self.batch_size = batch_size
+        self.categories = {title: pk for pk, title in
+                           ProductCategory.objects.values_list('pk', 'title')}
+        self.taxes = {title: pk for pk, title in
+                      ProductTax.objects.values_list('pk', 'title')}
+        self.default_currency = str(getattr(settings, 'DEFAULT_CURRENCY',
+                                            'DKK'))
+        self.currencies = {code for code, name in Product._meta.get_field(
+            'price_currency').choices}
+        price_field = Product._meta.get_field('price')
+        # The largest price that fits the column.
+        self.max_price = Decimal(10) ** (price_field.max_digits -
+                                         price_field.decimal_places)
+        self.created = self.updated = self.unchanged = 0
+        self.error_count = 0
+        self.errors = []
+
+    def run(self, rows):
+        batch = []
+        for line, row in rows:
+            try:
+                batch.append(self.clean(row))
+            except RowError as e:
+                self.error_count += 1
+                if len(self.errors) < MAX_ERRORS:
+                    self.errors.append((line, str(e)))
+                continue
+            if len(batch) >= self.batch_size:
+                self.write(batch)
+                batch = []
+        if batch:
+            self.write(batch)
+        if self.created or self.updated:
+            bump_catalog_version()
+        return self
+
+    def clean(self, row):
+        if row is None:
+            raise RowError("Not a valid row.")
+        row = {key: (value.strip() if isinstance(value, str) else value)
+               for key, value in row.items() if key}
+        cleaned = {
+            'sku': self.clean_text(row, 'sku', 64),
+            'title': self.clean_text(row, 'title', 512),
+            'description': row.get('description') or '',
+            'price_currency': str(row.get('currency') or
+                                  self.default_currency).upper(),
+        }
+        if cleaned['price_currency'] not in self.currencies:
+            raise RowError("Unknown currency {!r}.".format(
+                row.get('currency')))
+        try:
+            cleaned['category_id'] = self.categories[row.get('category')]
+        except KeyError:
+            raise RowError("Unknown category {!r}.".format(row.get('category')))
+        try:
+            cleaned['tax_id'] = self.taxes[row.get('tax')]
+        except KeyError:
+            raise RowError("Unknown tax {!r}.".format(row.get('tax')))
+        try:
+            price = Decimal(str(row.get('price')))
+        except InvalidOperation:
+            raise RowError("Invalid price {!r}.".format(row.get('price')))
+        if not price.is_finite() or price < 0:
+            raise RowError("Invalid price {!r}.".format(row.get('price')))
+        # Compared before rounding too, which fails for huge numbers.
+        if price >= self.max_price or \
+                price.quantize(Decimal('0.01')) >= self.max_price:
+            raise RowError("Price {!r} is too large.".format(row.get('price')))
+        cleaned['price'] = price.quantize(Decimal('0.01'))
+        stock = row.get('stock')
+        if stock in (None, ''):
+            cleaned['stock'] = None
+        else:
+            try:
+                cleaned['stock'] = int(stock)
+            except (TypeError, ValueError):
+                cleaned['stock'] = -1
+            if cleaned['stock'] < 0:
+                raise RowError("Invalid stock {!r}.".format(stock))
+        enabled = row.get('enabled')
+        if enabled in (None, ''):
+            cleaned['enabled'] = True
+        elif isinstance(enabled, bool):
+            cleaned['enabled'] = enabled
+        elif str(enabled).lower() in TRUE_VALUES + FALSE_VALUES:
+            cleaned['enabled'] = str(enabled).lower() in TRUE_VALUES
+        else:
+            raise RowError("Invalid enabled {!r}.".format(enabled))
+        return cleaned
+
+    def clean_text(self, row, column, max_length):
+        value = row.get(column)
+        if not value or not isinstance(value, str):
+            raise RowError("Missing {}.".format(column))
+        if len(value) > max_length:
+            raise RowError("{} is longer than {} characters.".format(
+                column.capitalize(), max_length))
+        return value
+
+    @transaction.atomic
+    def write(self, batch):
+        # The last row of a SKU wins, like it would row by row.
+        rows = OrderedDict((row['sku'], row) for row in batch)
+        existing = {
+            product['sku']: product for product in
+            Product.objects.filter(sku__in=list(rows))
+            .values('pk', 'sku', *FIELDS)
+        }
+        new, changes = [], {}
+        for sku, row in rows.items():
+            current = existing.get(sku)
+            if current is None:
+                new.append(self.make_product(row))
+                continue
+            changed = {field: row[field] for field in FIELDS
+                       if current[field] != row[field]}
+            if changed:
+                changes[current['pk']] = changed
+            else:
+                self.unchanged += 1
+        Product.objects.bulk_create(new)
+        Product.objects.bulk_update(changes)
+        self.created += len(new)
+        self.updated += len(changes)
+
+    def make_product(self, row):
+        row = dict(row)
+        row['price'] = Money(row['price'], row.pop('price_currency'))
+        return Product(**row)
+
+
+class Echo:
+    """A file-like object that just hands back what is written to it."""
+
+    def write(self, value):
+        return value
+
+
+def export_products(fmt, queryset=None, chunk_size=1000):
+    """
+    Yield the products of ``queryset`` (all by default) as text in the
+    format ``fmt``, a chunk of products at a time. The products are walked
+    by primary key so no chunk is ever fetched twice nor all at once.
+    """
+    if queryset is None:
+        queryset = Product.objects.all()
+    queryset = queryset.order_by('pk').values_list(
+        'pk', 'sku', 'title', 'description', 'category__title', 'price',
+        'price_currency', 'tax__title', 'stock', 'enabled')
+    writer = csv.writer(Echo())
+    if fmt == 'csv':
+        yield writer.writerow(COLUMNS)
+    last_pk = 0
+    while True:
+        products = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        if not products:
+            return
+        last_pk = products[-1][0]
+        lines = []
+        for product in products:
+            row = list(product[1:])
+            row[4] = str(row[4])
+            if fmt == 'csv':
+                row[8] = 'true' if row[8] else 'false'
+                lines.append(writer.writerow(row))
+            else:
+                lines.append(json.dumps(OrderedDict(zip(COLUMNS, row))) +
+                             '\n')
+        yield ''.join(lines)
@@ -0,0 +1,130 @@
+"""
+The ledger of the payments made over a period, for the accountants.
+
+Every payment is listed with its transactions, the getpaid payments it was
+paid (or tried to be paid) with, and their status. CSV has a row per
+transaction, or a single row for a payment that has none; JSON Lines has an
+object per payment with its transactions in a list.
+
+A year of payments is far more than should ever be held in memory, so the
+ledger is produced like the product export: the payments are walked by
+primary key a chunk at a time, with one more query for the transactions of
+every chunk, and written out before the next one is fetched.
+"""
+import csv
+import json
+from collections import OrderedDict
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from .importexport import Echo
+from .models.payment import GetPaidPayment, Payment
+
+FORMATS = ('csv', 'jsonl')
+
+PAYMENT_COLUMNS = ('payment', 'created', 'account', 'department', 'member',
+                   'amount', 'currency')
+TRANSACTION_COLUMNS = ('transaction', 'backend', 'status', 'started', 'paid',
+                       'amount_paid', 'external_id')
+COLUMNS = PAYMENT_COLUMNS + TRANSACTION_COLUMNS
+
+
+def date_range(start, end):
+    """
+    The datetimes from the start of the day ``start`` up to the end of the
+    day ``end``, in the current time zone.
+    """
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(start, time.min), tz),
+        timezone.make_aware(datetime.combine(end + timedelta(days=1),
+                                             time.min), tz),
+    )
+
+
+def ledger_payments(start, end, department=None):
+    """The payments created from ``start`` up to ``end`` (excluded)."""
+    payments = Payment.objects.filter(created__gte=start, created__lt=end)
+    if department is not None:
+        payments = payments.filter(account__department=department)
+    return payments
+
+
+def isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def chunks(payments, chunk_size):
+    """
+    Yield ``(payment, transactions)`` chunks of ``payments``, each a list
+    of dicts with the columns of the ledger.
+    """
+    rows = payments.order_by('pk').values_list(
+        'pk', 'created', 'account__name', 'account__department__name',
+        'user__username', 'amount', 'amount_currency')
+    transactions = GetPaidPayment.objects.order_by('order', 'created_on', 'pk')\
+        .values_list('order', 'pk', 'backend', 'status', 'created_on',
+                     'paid_on', 'amount_paid', 'external_id')
+    last_pk = 0
+    while True:
+        chunk = list(rows.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            return
+        first_pk, last_pk = chunk[0][0], chunk[-1][0]
+        # A subquery rather than a list of ids keeps the query small however
+        # large the chunk is.
+        history = {}
+        for row in transactions.filter(order__in=payments.filter(
+                pk__gte=first_pk, pk__lte=last_pk).values('pk')):
+            pk, backend, status, started, paid, amount_paid, external_id = \
+                row[1:]
+            history.setdefault(row[0], []).append(OrderedDict((
+                ('transaction', pk),
+                ('backend', backend),
+                ('status', status),
+                ('started', isoformat(started)),
+                ('paid', isoformat(paid)),
+                ('amount_paid', str(amount_paid)),
+                ('external_id', external_id),
+            )))
+        yield [
+            (OrderedDict((
+                ('payment', pk),
+                ('created', isoformat(created)),
+                ('account', account),
+                ('department', department),
+                ('member', username),
+                ('amount', str(amount)),
+                ('currency', str(currency)),
+            )), history.get(pk, []))
+            for pk, created, account, department, username, amount, currency
+            in chunk
+        ]
+
+
+def export_ledger(fmt, start, end, department=None, chunk_size=1000):
+    """
+    Yield the ledger of the payments created from ``start`` up to ``end``
+    (excluded), of ``department`` or all of them, as text in the format
+    ``fmt``, ``chunk_size`` payments at a time.
+    """
+    payments = ledger_payments(start, end, department)
+    writer = csv.writer(Echo())
+    if fmt == 'csv':
+        yield writer.writerow(COLUMNS)
+    empty = [''] * len(TRANSACTION_COLUMNS)
+    for chunk in chunks(payments, chunk_size):
+        lines = []
+        for payment, transactions in chunk:
+            if fmt == 'csv':
+                values = list(payment.values())
+                lines.extend(
+                    writer.writerow(values + list(transaction.values()))
+                    for transaction in transactions)
+                if not transactions:
+                    lines.append(writer.writerow(values + empty))
+            else:
+                payment['transactions'] = transactions
+                lines.append(json.dumps(payment) + '\n')
+        yield ''.join(lines)
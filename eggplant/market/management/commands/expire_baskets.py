@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from eggplant.market.models import Basket
+
+
+class Command(BaseCommand):
+    help = "Expire idle open baskets and return their items to the stock."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ttl', type=int, default=None,
+            help="Minutes a basket may stay idle, defaults to "
+                 "settings.MARKET_BASKET_TTL."
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help="Number of baskets released per transaction."
+        )
+
+    def handle(self, *args, **options):
+        ttl = options['ttl']
+        if ttl is not None:
+            ttl = timedelta(minutes=ttl)
+        expired = Basket.objects.expire_idle(
+            ttl=ttl, batch_size=options['batch_size'])
+        self.stdout.write("Expired {} basket(s).".format(expired))
@@ -0,0 +1,28 @@
+import io
+
+from django.core.management.base import BaseCommand
+
+from eggplant.market.importexport import FORMATS, export_products
+
+
+class Command(BaseCommand):
+    help = "Export all products as CSV or JSON Lines, in the format " \
+           "import_products reads."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format', choices=FORMATS, default='csv',
+        )
+        parser.add_argument(
+            '--output', default=None,
+            help="File to write to, the standard output by default."
+        )
+
+    def handle(self, *args, **options):
+        if options['output']:
+            with io.open(options['output'], 'w', encoding='utf-8',
+                         newline='') as output:
+                output.writelines(export_products(options['format']))
+        else:
+            for chunk in export_products(options['format']):
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,39 @@
+import io
+
+from django.core.management.base import BaseCommand, CommandError
+
+from eggplant.market.importexport import (FORMATS, ProductImporter,
+                                          guess_format, read_rows)
+
+
+class Command(BaseCommand):
+    help = "Create and update products from a CSV or JSON Lines file, " \
+           "matching them on their supplier SKU."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--format', choices=FORMATS, default=None,
+            help="Format of the file, guessed from its name by default."
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help="Number of rows written per transaction."
+        )
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or guess_format(options['path'])
+        if fmt is None:
+            raise CommandError("Cannot tell the format of {}, use --format."
+                               .format(options['path']))
+        importer = ProductImporter(batch_size=options['batch_size'])
+        with io.open(options['path'], encoding='utf-8-sig',
+                     newline='') as stream:
+            importer.run(read_rows(stream, fmt))
+        for line, error in importer.errors:
+            self.stderr.write("Line {}: {}".format(line, error))
+        self.stdout.write(
+            "Created {}, updated {} and left {} product(s) unchanged, "
+            "{} row(s) had errors.".format(
+                importer.created, importer.updated, importer.unchanged,
+                importer.error_count))
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from eggplant.market.models import PaymentCallback
+
+
+class Command(BaseCommand):
+    help = "Apply the queued callbacks of the payment gateways."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help="Number of callbacks processed at most per round."
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Keep processing callbacks as they come in."
+        )
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help="Seconds to wait for callbacks when none are left, and "
+                 "before a failed one is tried again."
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            processed = PaymentCallback.objects.process_pending(
+                limit=options['limit'])
+            if options['verbosity'] > 1 or not options['loop']:
+                self.stdout.write("Processed {} callback(s).".format(
+                    processed))
+                failed = PaymentCallback.objects.failed().count()
+                if failed:
+                    self.stderr.write(
+                        "{} callback(s) failed too often to be tried "
+                        "again, see the admin.".format(failed))
+            if not options['loop']:
+                return
+            if not processed:
+                time.sleep(options['interval'])
@@ -0,0 +1,65 @@
+import io
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from eggplant.core.utils import date_argument
+from eggplant.market.importexport import FORMATS, guess_format, read_rows
+from eggplant.market.ledger import date_range
+from eggplant.market.reconciliation import Reconciler
+
+
+class Command(BaseCommand):
+    help = "Reconcile the transactions with a settlement report of the " \
+           "payment gateway, a CSV or JSON Lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--format', choices=FORMATS, default=None,
+            help="Format of the file, guessed from its name by default."
+        )
+        parser.add_argument(
+            '--start', type=date_argument, default=None,
+            help="First day of the period the report covers, YYYY-MM-DD. "
+                 "Given with --end, the transactions paid in the period "
+                 "but not settled are reported missing."
+        )
+        parser.add_argument(
+            '--end', type=date_argument, default=None,
+            help="Last day of the period the report covers, YYYY-MM-DD."
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help="Number of rows reconciled per transaction."
+        )
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or guess_format(options['path'])
+        if fmt is None:
+            raise CommandError("Cannot tell the format of {}, use --format."
+                               .format(options['path']))
+        if (options['start'] is None) != (options['end'] is None):
+            raise CommandError("Give both --start and --end, or neither.")
+        period = ()
+        if options['start'] is not None:
+            period = date_range(options['start'], options['end'])
+        reconciler = Reconciler(source=os.path.basename(options['path']),
+                                batch_size=options['batch_size'])
+        with io.open(options['path'], encoding='utf-8-sig',
+                     newline='') as stream:
+            reconciler.run(read_rows(stream, fmt), *period)
+        for line, problem in reconciler.problems:
+            if line is None:
+                self.stderr.write(problem)
+            else:
+                self.stderr.write("Line {}: {}".format(line, problem))
+        if reconciler.problem_count > len(reconciler.problems):
+            self.stderr.write("... and {} more.".format(
+                reconciler.problem_count - len(reconciler.problems)))
+        self.stdout.write(
+            "{} matched, {} mismatched, {} duplicate and {} missing "
+            "transaction(s), {} unknown and {} invalid row(s).".format(
+                reconciler.matched, reconciler.mismatched,
+                reconciler.duplicate, reconciler.missing, reconciler.unknown,
+                reconciler.invalid))
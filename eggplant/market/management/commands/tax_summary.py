@@ -0,0 +1,34 @@
+import csv
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from eggplant.core.utils import date_argument
+from eggplant.market.models import ProductTax
+from eggplant.market.tax import period_taxes
+
+
+class Command(BaseCommand):
+    help = "Print the net, tax and gross of the orders of a period per " \
+           "month and tax rate, as CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('start', type=date_argument,
+                            help="First day of the period, YYYY-MM-DD.")
+        parser.add_argument('end', type=date_argument,
+                            help="Day after the period, YYYY-MM-DD.")
+
+    def handle(self, *args, **options):
+        start, end = [
+            timezone.make_aware(datetime.combine(options[key], time.min))
+            for key in ('start', 'end')]
+        titles = dict(ProductTax.objects.values_list('pk', 'title'))
+        writer = csv.writer(self.stdout)
+        writer.writerow(['month', 'tax', 'rate', 'currency', 'net', 'tax',
+                         'gross'])
+        for month, bucket in period_taxes(start, end):
+            writer.writerow([
+                month.strftime('%Y-%m'), titles.get(bucket.tax_id, ''),
+                bucket.rate, bucket.currency, bucket.net, bucket.tax,
+                bucket.gross])
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 16:46
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('market', '0008_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='basket',
+            name='last_activity',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='basket',
+            name='status',
+            field=models.CharField(choices=[('open', 'open'), ('checked-out', 'checked-out'), ('expired', 'expired')], default='open', max_length=15),
+        ),
+        migrations.AlterIndexTogether(
+            name='basket',
+            index_together=set([('user', 'status'), ('status', 'last_activity')]),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 16:47
+from __future__ import unicode_literals
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def fill_basket_summary(apps, schema_editor):
+    Basket = apps.get_model('market', 'Basket')
+    BasketItem = apps.get_model('market', 'BasketItem')
+    for basket in Basket.objects.filter(status='open'):
+        items = BasketItem.objects.filter(basket=basket).values_list(
+            'quantity', 'product__price', 'product__price_currency')
+        basket.item_count = 0
+        basket.total = Decimal('0')
+        for quantity, price, currency in items:
+            basket.item_count += 1
+            basket.total += quantity * price
+            basket.currency = currency
+        basket.save(update_fields=['item_count', 'total', 'currency'])
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0009_basket_last_activity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='basket',
+            name='currency',
+            field=models.CharField(blank=True, editable=False, max_length=3),
+        ),
+        migrations.AddField(
+            model_name='basket',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='basket',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), editable=False, max_digits=12),
+        ),
+        migrations.RunPython(fill_basket_summary, migrations.RunPython.noop),
+    ]
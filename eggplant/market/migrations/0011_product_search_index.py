@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+from eggplant.market.search import install_search_index
+
+
+def create_search_index(apps, schema_editor):
+    install_search_index(schema_editor.connection, rebuild=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0010_basket_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, migrations.RunPython.noop),
+    ]
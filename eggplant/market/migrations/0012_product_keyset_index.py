@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 16:56
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0011_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='product',
+            index_together=set([('category', 'title', 'id')]),
+        ),
+    ]
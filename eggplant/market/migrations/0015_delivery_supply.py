@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 17:11
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0014_orderline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PickupSlot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True, verbose_name='date')),
+                ('capacity', models.PositiveIntegerField(verbose_name='capacity')),
+                ('booked', models.PositiveIntegerField(default=0, editable=False, verbose_name='booked')),
+            ],
+            options={
+                'ordering': ('date',),
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductSupply',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delivery_date', models.DateField(verbose_name='delivery date')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='quantity left')),
+            ],
+            options={
+                'verbose_name_plural': 'product supplies',
+            },
+        ),
+        migrations.AddField(
+            model_name='stockreservation',
+            name='delivery_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='stockreservation',
+            unique_together=set([('basket', 'product', 'delivery_date')]),
+        ),
+        migrations.AddField(
+            model_name='productsupply',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='supplies', to='market.Product'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='productsupply',
+            unique_together=set([('product', 'delivery_date')]),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 17:14
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0015_delivery_supply'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='orderline',
+            name='delivery_date',
+            field=models.DateField(db_index=True, editable=False, null=True, verbose_name='delivery date'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 17:19
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def count_demand(apps, schema_editor):
+    BasketItem = apps.get_model('market', 'BasketItem')
+    OrderLine = apps.get_model('market', 'OrderLine')
+    ProductDemand = apps.get_model('market', 'ProductDemand')
+    demand = {}
+    reserved = BasketItem.objects.filter(basket__status='open')\
+        .values_list('product', 'delivery_date')\
+        .annotate(quantity=models.Sum('quantity')).order_by()
+    for product_id, date, quantity in reserved:
+        demand[product_id, date] = [quantity, 0]
+    ordered = OrderLine.objects.filter(product__isnull=False)\
+        .values_list('product', 'delivery_date')\
+        .annotate(quantity=models.Sum('quantity')).order_by()
+    for product_id, date, quantity in ordered:
+        demand.setdefault((product_id, date), [0, 0])[1] = quantity
+    ProductDemand.objects.bulk_create(
+        ProductDemand(product_id=product_id, delivery_date=date,
+                      reserved=reserved, ordered=ordered)
+        for (product_id, date), (reserved, ordered) in demand.items())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0016_orderline_delivery_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductDemand',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delivery_date', models.DateField(blank=True, null=True, verbose_name='delivery date')),
+                ('reserved', models.IntegerField(default=0, verbose_name='in baskets')),
+                ('ordered', models.IntegerField(default=0, verbose_name='ordered')),
+            ],
+            options={
+                'verbose_name_plural': 'product demand',
+            },
+        ),
+        migrations.AddField(
+            model_name='productdemand',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='demand', to='market.Product'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='productdemand',
+            unique_together=set([('product', 'delivery_date')]),
+        ),
+        migrations.RunPython(count_demand, migrations.RunPython.noop),
+    ]
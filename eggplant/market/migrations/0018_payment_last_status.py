@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 17:31
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models.expressions import RawSQL
+
+
+def fill_last_status(apps, schema_editor):
+    Payment = apps.get_model('market', 'Payment')
+    Payment.objects.update(last_status=RawSQL(
+        'SELECT getpaid_payment.status FROM getpaid_payment '
+        'WHERE getpaid_payment.order_id = market_payment.id '
+        'ORDER BY getpaid_payment.created_on DESC, getpaid_payment.id DESC '
+        'LIMIT 1', ()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('getpaid', '0002_auto_20150723_0923'),
+        ('market', '0017_productdemand'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='last_status',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=20, null=True, verbose_name='payment status'),
+        ),
+        migrations.RunPython(fill_last_status, migrations.RunPython.noop),
+    ]
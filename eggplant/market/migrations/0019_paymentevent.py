@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 17:33
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0018_payment_last_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(db_index=True, verbose_name='created')),
+                ('event', models.CharField(max_length=32, verbose_name='event')),
+                ('payment_id', models.IntegerField(db_index=True, null=True, verbose_name='payment')),
+                ('transaction_id', models.IntegerField(null=True, verbose_name='transaction')),
+                ('user_id', models.IntegerField(null=True, verbose_name='user')),
+                ('data', models.TextField(blank=True, verbose_name='data')),
+            ],
+            options={
+                'ordering': ('created', 'pk'),
+            },
+        ),
+    ]
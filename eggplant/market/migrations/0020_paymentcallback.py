@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 17:37
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('getpaid', '0002_auto_20150723_0923'),
+        ('market', '0019_paymentevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentCallback',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('backend', models.CharField(max_length=50, verbose_name='backend')),
+                ('status', models.CharField(max_length=20, verbose_name='status')),
+                ('params', models.TextField(verbose_name='parameters')),
+                ('received', models.DateTimeField(auto_now_add=True, verbose_name='received')),
+                ('processed', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='processed')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='attempts')),
+                ('error', models.TextField(blank=True, verbose_name='error')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='paymentcallback',
+            name='transaction',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='callbacks', to='getpaid.Payment'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='paymentcallback',
+            unique_together=set([('transaction', 'status')]),
+        ),
+    ]
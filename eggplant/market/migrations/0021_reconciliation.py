@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 17:51
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('getpaid', '0002_auto_20150723_0923'),
+        ('market', '0020_paymentcallback'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reconciliation',
+            fields=[
+                ('transaction', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='reconciliation', serialize=False, to='getpaid.Payment')),
+                ('status', models.CharField(choices=[('matched', 'matched'), ('mismatched', 'mismatched'), ('duplicate', 'settled more than once'), ('missing', 'missing from the settlement')], db_index=True, max_length=20, verbose_name='status')),
+                ('settled_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='settled amount')),
+                ('settled_currency', models.CharField(blank=True, max_length=3, verbose_name='settled currency')),
+                ('external_id', models.CharField(blank=True, max_length=64, verbose_name='external id')),
+                ('source', models.CharField(blank=True, max_length=255, verbose_name='settlement')),
+                ('reconciled', models.DateTimeField(default=django.utils.timezone.now, verbose_name='reconciled')),
+            ],
+        ),
+    ]
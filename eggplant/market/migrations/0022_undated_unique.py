@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from eggplant.market.undated import install_undated_indexes
+
+
+def merge_undated(apps, schema_editor):
+    """Fold duplicate undated rows into the first of them."""
+    for model_name, fields, counters in (
+            ('BasketItem', ('basket', 'product'), ('quantity',)),
+            ('StockReservation', ('basket', 'product'), ('quantity',)),
+            ('ProductDemand', ('product',), ('reserved', 'ordered'))):
+        model = apps.get_model('market', model_name)
+        undated = model.objects.filter(delivery_date=None)
+        duplicates = undated.values(*fields)\
+            .annotate(rows=models.Count('pk')).filter(rows__gt=1)
+        for duplicate in duplicates:
+            rows = list(undated.filter(**{field: duplicate[field]
+                                          for field in fields})
+                        .order_by('pk'))
+            first = rows[0]
+            for row in rows[1:]:
+                for counter in counters:
+                    setattr(first, counter,
+                            getattr(first, counter) + getattr(row, counter))
+                row.delete()
+            first.save()
+
+
+def create_indexes(apps, schema_editor):
+    install_undated_indexes(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0021_reconciliation'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_undated, migrations.RunPython.noop),
+        migrations.RunPython(create_indexes, migrations.RunPython.noop),
+    ]
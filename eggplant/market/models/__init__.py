@@ -1,4 +1,10 @@
 from .listeners import *  # @UnusedWildImport # NOQA
+from .audit import *  # @UnusedWildImport # NOQA
+from .callback import *  # @UnusedWildImport # NOQA
 from .cart import *  # @UnusedWildImport # NOQA
+from .delivery import *  # @UnusedWildImport # NOQA
 from .inventory import *  # @UnusedWildImport # NOQA
+from .order import *  # @UnusedWildImport # NOQA
 from .payment import *  # @UnusedWildImport # NOQA
+from .reconciliation import *  # @UnusedWildImport # NOQA
+from .reservation import *  # @UnusedWildImport # NOQA
@@ -0,0 +1,24 @@
+from django.db import models
+from django.utils.translation import ugettext_lazy as _
+
+
+class PaymentEvent(models.Model):
+    """
+    An entry of the payment audit log, see market.audit. Entries are only
+    ever added. They refer to payments, transactions and users by plain ids,
+    so they outlive whatever they are about.
+    """
+    created = models.DateTimeField(_("created"), db_index=True)
+    event = models.CharField(_("event"), max_length=32)
+    payment_id = models.IntegerField(_("payment"), null=True, db_index=True)
+    transaction_id = models.IntegerField(_("transaction"), null=True)
+    user_id = models.IntegerField(_("user"), null=True)
+    data = models.TextField(_("data"), blank=True)
+
+    class Meta:
+        ordering = ('created', 'pk')
+        app_label = 'market'
+
+    def __str__(self):
+        return '{} of payment#{} at {}'.format(self.event, self.payment_id,
+                                               self.created)
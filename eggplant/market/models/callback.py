@@ -0,0 +1,138 @@
+import logging
+
+from django.conf import settings
+from django.db import IntegrityError, connections, models, transaction
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+from .payment import GetPaidPayment
+
+log = logging.getLogger(__name__)
+
+
+def get_max_attempts():
+    return getattr(settings, 'MARKET_CALLBACK_MAX_ATTEMPTS', 10)
+
+
+class PaymentCallbackManager(models.Manager):
+
+    def store(self, backend, transaction_id, status, params):
+        """
+        Queue a verified callback. A callback already queued for the same
+        transaction and status, e.g. a retry of the gateway, is not stored
+        again. Returns ``(callback, created)``.
+        """
+        try:
+            with transaction.atomic():
+                return self.create(backend=backend,
+                                   transaction_id=transaction_id,
+                                   status=status, params=params), True
+        except IntegrityError:
+            return self.get(transaction_id=transaction_id,
+                            status=status), False
+
+    def pending(self):
+        return self.filter(processed=None, attempts__lt=get_max_attempts())\
+            .order_by('pk')
+
+    def failed(self):
+        """
+        The callbacks given up on after MARKET_CALLBACK_MAX_ATTEMPTS, for an
+        operator to look into. Lowering ``attempts`` queues one again.
+        """
+        return self.filter(processed=None, attempts__gte=get_max_attempts())\
+            .order_by('pk')
+
+    def claim(self, after=0):
+        """
+        Lock the first pending callback after the primary key ``after``
+        that no other worker is busy with, or return None. Must be called
+        in a transaction, which holds the lock.
+        """
+        queryset = self.pending().filter(pk__gt=after)
+        connection = connections[self.db]
+        if connection.vendor != 'postgresql':
+            # SQLite has no row locks, it lets one writer in at a time.
+            return queryset.select_for_update().first()
+        sql, params = queryset.values('pk')[:1].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(sql + ' FOR UPDATE SKIP LOCKED', params)
+            row = cursor.fetchone()
+        return row and self.get(pk=row[0])
+
+    def process_pending(self, limit=None):
+        """
+        Process pending callbacks in order, each once at most and each in a
+        transaction of its own, until none are left or ``limit`` were tried.
+        Several workers can do so at the same time. Returns the number of
+        callbacks done with.
+        """
+        tried = done = after = 0
+        while limit is None or tried < limit:
+            with transaction.atomic(using=self.db):
+                callback = self.claim(after)
+                if callback is None:
+                    break
+                done += callback.process()
+            after = callback.pk
+            tried += 1
+        return done
+
+
+class PaymentCallback(models.Model):
+    """
+    A callback of a payment gateway, checked and acknowledged by the
+    callback view, to be applied to its transaction by
+    ``process_payment_callbacks``. There is one per transaction and status
+    the gateway reported, however often it called.
+    """
+    backend = models.CharField(_("backend"), max_length=50)
+    transaction = models.ForeignKey('getpaid.Payment',
+                                    related_name='callbacks')
+    status = models.CharField(_("status"), max_length=20)
+    params = models.TextField(_("parameters"))
+    received = models.DateTimeField(_("received"), auto_now_add=True)
+    processed = models.DateTimeField(_("processed"), null=True, blank=True,
+                                     db_index=True)
+    attempts = models.PositiveIntegerField(_("attempts"), default=0)
+    error = models.TextField(_("error"), blank=True)
+
+    objects = PaymentCallbackManager()
+
+    class Meta:
+        unique_together = (
+            ('transaction', 'status'),
+        )
+        app_label = 'market'
+
+    def __str__(self):
+        return '{} of transaction {}'.format(self.status,
+                                             self.transaction_id)
+
+    def process(self):
+        """
+        Apply the callback, in the current transaction, unless the
+        transaction already has its status. If that fails the callback is
+        tried again later, up to settings.MARKET_CALLBACK_MAX_ATTEMPTS
+        times, after which it is left unprocessed among the failed ones.
+        """
+        from ..callbacks import apply_callback
+        payment = GetPaidPayment.objects.select_for_update()\
+            .get(pk=self.transaction_id)
+        self.attempts += 1
+        if payment.status != self.status:
+            try:
+                with transaction.atomic():
+                    apply_callback(self, payment)
+            except Exception as e:
+                log.exception("Could not process callback %s", self.pk)
+                self.error = '{}: {}'.format(type(e).__name__, e)
+                if self.attempts >= get_max_attempts():
+                    log.error("Gave up on callback %s of transaction %s "
+                              "after %s attempts", self.pk,
+                              self.transaction_id, self.attempts)
+                self.save(update_fields=['attempts', 'error'])
+                return False
+        self.processed = timezone.now()
+        self.save(update_fields=['attempts', 'error', 'processed'])
+        return True
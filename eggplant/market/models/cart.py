@@ -1,7 +1,33 @@
+import logging
+from datetime import timedelta
 from decimal import Decimal
 
-from django.db import models, transaction
+from django.conf import settings
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models.signals import post_save
+from django.dispatch.dispatcher import receiver
 from django.utils import timezone
+from moneyed import Money
+
+log = logging.getLogger(__name__)
+
+
+class MixedCurrencies(Exception):
+    """
+    Raised when the items of a basket are priced in different currencies.
+    """
+
+
+class BasketClosed(Exception):
+    """
+    Raised when a basket was checked out or expired meanwhile.
+    """
+
+
+class NoPaymentAccount(Exception):
+    """
+    Raised at checkout when the member has no active account to pay from.
+    """
 
 
 class BasketManager(models.Manager):
@@ -15,73 +41,322 @@ class BasketManager(models.Manager):
             .get_or_create(user=user, status=self.model.OPEN)
         return instance
 
+    def refresh_holding(self, products):
+        """
+        Refresh the summary of the open baskets holding any of ``products``
+        (instances or ids), e.g. after their prices changed.
+        """
+        baskets = self.filter(status=self.model.OPEN,
+                              items__product__in=products).distinct()
+        for basket in baskets:
+            try:
+                basket.refresh_summary()
+            except MixedCurrencies:
+                log.warning("Basket %s holds items in several currencies",
+                            basket.pk)
+
+    def expire_idle(self, ttl=None, batch_size=100):
+        """
+        Expire open baskets that have been idle for longer than ``ttl`` and
+        return the items they reserved to the stock. Returns the number of
+        baskets expired.
+
+        Meant to be called periodically, e.g. through the ``expire_baskets``
+        management command. Several processes may run it at once: a basket
+        is only ever released by the process that managed to flip its status.
+        """
+        if ttl is None:
+            ttl = timedelta(seconds=getattr(settings, 'MARKET_BASKET_TTL',
+                                            2 * 60 * 60))
+        cutoff = timezone.now() - ttl
+        expired = 0
+        while True:
+            basket_ids = list(
+                self.filter(status=self.model.OPEN, last_activity__lt=cutoff)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not basket_ids:
+                return expired
+            expired += self._expire_batch(basket_ids, cutoff)
+
+    @transaction.atomic
+    def _expire_batch(self, basket_ids, cutoff):
+        from .delivery import ProductDemand
+        from .reservation import StockReservation
+        claimed = []
+        for pk in basket_ids:
+            # Conditional on the status, so only one process wins a basket.
+            if self.filter(pk=pk, status=self.model.OPEN,
+                           last_activity__lt=cutoff)\
+                    .update(status=self.model.EXPIRED):
+                claimed.append(pk)
+        if not claimed:
+            return 0
+        StockReservation.objects.give_back(
+            StockReservation.objects.filter(basket__in=claimed))
+        # The items stay in the expired baskets, but are no longer wanted.
+        ProductDemand.objects.apply({
+            (product_id, date): (-quantity, 0)
+            for product_id, date, quantity in
+            BasketItem.objects.filter(basket__in=claimed)
+            .values_list('product', 'delivery_date')
+            .annotate(quantity=models.Sum('quantity'))
+            .order_by()
+        })
+        return len(claimed)
+
 
 class Basket(models.Model):
     OPEN = 'open'
     CHECKEDOUT = 'checked-out'
+    EXPIRED = 'expired'
     STATUES = (
         (OPEN, OPEN),
         (CHECKEDOUT, CHECKEDOUT),
+        (EXPIRED, EXPIRED),
     )
     user = models.ForeignKey('auth.User', editable=False)
     created = models.DateTimeField(auto_now_add=True)
+    last_activity = models.DateTimeField(default=timezone.now)
     status = models.CharField(choices=STATUES, default=OPEN, max_length=15)
 
+    # Summary of the items kept up to date by add_to_items and
+    # remove_from_items, so the basket can be shown without aggregating.
+    item_count = models.PositiveIntegerField(default=0, editable=False)
+    total = models.DecimalField(max_digits=12, decimal_places=2,
+                                default=Decimal('0'), editable=False)
+    currency = models.CharField(max_length=3, blank=True, editable=False)
+
     objects = BasketManager()
 
     class Meta:
         index_together = [
             ["user", "status"],
+            ["status", "last_activity"],
         ]
         app_label = 'market'
 
     def __str__(self):
         return 'Basket {} {} {}'.format(self.user, self.status, self.created)
 
+    def touch(self):
+        self.last_activity = timezone.now()
+        Basket.objects.filter(pk=self.pk)\
+            .update(last_activity=self.last_activity)
+
+    def touch_open(self):
+        """
+        Mark the basket as active unless it is no longer open, and return
+        whether it is. The UPDATE locks the basket until the transaction
+        ends, so an expiry sweep waits and then finds it active.
+        """
+        self.last_activity = timezone.now()
+        return bool(Basket.objects.filter(pk=self.pk, status=Basket.OPEN)
+                    .update(last_activity=self.last_activity))
+
+    def _update_summary(self, lines, amount, currency=None):
+        """
+        Shift the denormalized summary by ``lines`` basket lines and
+        ``amount`` in a single UPDATE, which also marks the basket as active.
+        """
+        self.last_activity = timezone.now()
+        changes = {
+            'last_activity': self.last_activity,
+            'item_count': models.F('item_count') + lines,
+            'total': models.F('total') + amount,
+        }
+        if currency:
+            changes['currency'] = currency
+            self.currency = currency
+        Basket.objects.filter(pk=self.pk).update(**changes)
+        self.item_count += lines
+        self.total += amount
+
+    @transaction.atomic
     def add_to_items(self, product=None, quantity=1, delivery_date=None):
-        current = self.items.filter(product=product,
-                                    delivery_date=delivery_date)
-        if current.exists():
-            current.update(quantity=models.F('quantity') + quantity)
-        else:
-            BasketItem.objects.create(
-                basket=self,
-                product=product,
-                quantity=quantity,
-                delivery_date=delivery_date
-            )
+        from .delivery import ProductDemand
+        currency = str(product.price.currency)
+        if self.item_count and self.currency and self.currency != currency:
+            raise MixedCurrencies(
+                "Cannot add {} priced in {} to a basket in {}".format(
+                    product, currency, self.currency))
+        created = BasketItem.objects.upsert(self, product, quantity,
+                                            delivery_date)
+        self._update_summary(int(created), quantity * product.price.amount,
+                             currency)
+        ProductDemand.objects.apply({(product.pk, delivery_date):
+                                     (quantity, 0)})
 
+    @transaction.atomic
     def remove_from_items(self, product=None, quantity=1, delivery_date=None):
+        """
+        Remove up to ``quantity`` items from the basket and return how many
+        were actually removed.
+        """
+        from .delivery import ProductDemand
         current = self.items.filter(product=product,
                                     delivery_date=delivery_date)
-        if current.exists():
-            if current[0].quantity - quantity > 1:
-                current.update(quantity=models.F('quantity') - quantity)
-            else:
-                self.items.filter(basket=self, product=product, delivery_date=delivery_date).delete()
+        item = current.select_related('product').first()
+        if item is None:
+            self.touch()
+            return 0
+        if item.quantity - quantity > 0:
+            current.update(quantity=models.F('quantity') - quantity)
+            removed, lines = quantity, 0
+        else:
+            current.delete()
+            removed, lines = item.quantity, -1
+        self._update_summary(lines, -removed * item.product.price.amount)
+        ProductDemand.objects.apply({(item.product_id, delivery_date):
+                                     (-removed, 0)})
+        return removed
+
+    def get_totals(self):
+        """
+        Sum up quantity x price of the items in one aggregate query. Returns
+        a dict mapping each currency found in the basket to its total, so
+        mixed currencies are detected rather than silently added up.
+        """
+        line_total = models.ExpressionWrapper(
+            models.F('quantity') * models.F('product__price'),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2)
+        )
+        rows = self.items.values_list('product__price_currency')\
+            .annotate(total=models.Sum(line_total))\
+            .order_by()
+        return {str(currency): total for currency, total in rows}
+
+    def get_taxes(self):
+        """Net, tax and gross of the items per tax rate, see market.tax."""
+        from ..tax import basket_taxes
+        return basket_taxes(self)
+
+    def refresh_summary(self):
+        """
+        Recompute the denormalized item count and total from the items, e.g.
+        after the price of a product in the basket has changed.
+        """
+        totals = self.get_totals()
+        if len(totals) > 1:
+            raise MixedCurrencies(
+                "Basket {} has items in {}".format(self.pk,
+                                                   ', '.join(sorted(totals))))
+        self.item_count = self.items.count()
+        self.currency, self.total = next(iter(totals.items()),
+                                         ('', Decimal('0')))
+        Basket.objects.filter(pk=self.pk).update(
+            item_count=self.item_count,
+            currency=self.currency,
+            total=self.total,
+        )
 
     def get_total_amount(self):
         # TODO: This should return a Money type instead of decimal
-        # TODO: When calculating this, we should fail when currencies differ
-        total = Decimal('0')
-        for item in self.items.all():
-            total += item.quantity * item.product.price.amount
-        return total
+        return self.total
 
     def get_items_count(self):
-        return self.items.all().count()
+        return self.item_count
 
     @transaction.atomic
-    def do_checkout(self):
-        # TODO: Why on earth are we importing this here
+    def do_checkout(self, account=None):
+        """
+        Turn the basket into a payment from ``account`` (by default the
+        first active account of the member) along with a snapshot of its
+        items as order lines, booking the pickup slots of their delivery
+        dates. Returns the payment, or None if the basket had already been
+        checked out meanwhile; raises SlotFull if a slot has no room left.
+        """
+        from ..tax import line_taxes, total
+        from .delivery import PickupSlot, ProductDemand
+        from .order import OrderLine
         from .payment import Payment
-        Payment.objects.create(
-            amount=self.get_total_amount(),
+        if account is None:
+            account = self.user.profile.accounts.filter(active=True)\
+                .order_by('pk').first()
+            if account is None:
+                raise NoPaymentAccount(
+                    "{} has no active account".format(self.user))
+        # Conditional on the status, so the basket is paid for only once.
+        if not Basket.objects.filter(pk=self.pk, status=self.OPEN)\
+                .update(status=self.CHECKEDOUT):
+            return None
+        self.status = self.CHECKEDOUT
+        lines = OrderLine.objects.snapshot(self)
+        PickupSlot.objects.book(line.delivery_date for line in lines)
+        try:
+            # The amount to pay is the gross of the lines as they are now.
+            amount = total(line_taxes(lines))
+        except ValueError:
+            raise MixedCurrencies("Basket {} has items in several "
+                                  "currencies".format(self.pk))
+        payment = Payment.objects.create(
+            amount=Money(amount.gross, amount.currency or
+                         getattr(settings, 'DEFAULT_CURRENCY', 'DKK')),
+            account=account,
             user=self.user,
         )
-        # self.order = payment
-        self.status = self.CHECKEDOUT
-        self.save()
+        demand = {}
+        for line in lines:
+            line.payment = payment
+            reserved, ordered = demand.get(
+                (line.product_id, line.delivery_date), (0, 0))
+            demand[line.product_id, line.delivery_date] = (
+                reserved - line.quantity, ordered + line.quantity)
+        OrderLine.objects.bulk_create(lines)
+        ProductDemand.objects.apply(demand)
+        # The reserved items are sold now, so they must never be released.
+        self.reservations.all().delete()
+        return payment
+
+
+class BasketItemManager(models.Manager):
+
+    def upsert(self, basket, product, quantity, delivery_date=None):
+        """
+        Add ``quantity`` to the line of ``product`` in ``basket``, creating
+        it if needed, and return whether the line was created.
+
+        On PostgreSQL this is a single INSERT ... ON CONFLICT DO UPDATE, so
+        concurrent adds of the same product never collide on the unique
+        constraint. NULL delivery dates never conflict in SQL, so those, and
+        other databases, take the portable path.
+        """
+        if connection.vendor == 'postgresql' and delivery_date is not None:
+            return self._upsert_postgresql(basket, product, quantity,
+                                           delivery_date)
+        return self._upsert_portable(basket, product, quantity,
+                                     delivery_date)
+
+    def _upsert_postgresql(self, basket, product, quantity, delivery_date):
+        table = self.model._meta.db_table
+        sql = (
+            'INSERT INTO {table} (basket_id, product_id, quantity, '
+            'delivery_date) VALUES (%s, %s, %s, %s) '
+            'ON CONFLICT (basket_id, product_id, delivery_date) '
+            'DO UPDATE SET quantity = {table}.quantity + EXCLUDED.quantity '
+            'RETURNING (xmax = 0)'
+        ).format(table=connection.ops.quote_name(table))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [basket.pk, product.pk, quantity,
+                                 delivery_date])
+            created, = cursor.fetchone()
+        return created
+
+    def _upsert_portable(self, basket, product, quantity, delivery_date):
+        current = self.filter(basket=basket, product=product,
+                              delivery_date=delivery_date)
+        if current.update(quantity=models.F('quantity') + quantity):
+            return False
+        try:
+            with transaction.atomic():
+                self.create(basket=basket, product=product,
+                            quantity=quantity, delivery_date=delivery_date)
+            return True
+        except IntegrityError:
+            # A concurrent request created the line in the meantime.
+            current.update(quantity=models.F('quantity') + quantity)
+            return False
 
 
 class BasketItem(models.Model):
@@ -98,8 +373,22 @@ class BasketItem(models.Model):
     delivery_date = models.DateField(null=True, blank=False,
                                      default=timezone.now)
 
+    objects = BasketItemManager()
+
     class Meta:
         unique_together = (
             ('basket', 'product', 'delivery_date')
         )
         app_label = 'market'
+
+
+@receiver(post_save, sender='market.Product',
+          dispatch_uid='market-product-refresh-baskets')
+def refresh_open_baskets(sender, instance, created, raw=False, **kwargs):
+    """
+    Keep the summary of open baskets right when a product they hold changes,
+    its price in particular.
+    """
+    if created or raw:
+        return
+    Basket.objects.refresh_holding([instance])
@@ -0,0 +1,230 @@
+import operator
+from functools import reduce
+
+from django.db import (DEFAULT_DB_ALIAS, IntegrityError, connections, models,
+                       transaction)
+from django.db.models.signals import post_migrate
+from django.dispatch.dispatcher import receiver
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+from ..undated import install_undated_indexes
+
+
+class SlotFull(Exception):
+    """
+    Raised at checkout when the pickup slot of a delivery date has no room
+    left for another basket.
+    """
+
+    def __init__(self, date):
+        self.date = date
+        super().__init__("The pickup slot of {} is full".format(date))
+
+
+class PickupSlotManager(models.Manager):
+
+    def upcoming(self):
+        return self.filter(date__gte=timezone.now().date()).order_by('date')
+
+    @transaction.atomic
+    def book(self, dates):
+        """
+        Take one place for a basket in the pickup slot of each of ``dates``.
+        Dates without a slot are not limited.
+
+        Every slot is booked by a single conditional UPDATE, so concurrent
+        checkouts can never overbook it; if any slot is full SlotFull is
+        raised and the places already taken are given back by the rollback.
+        """
+        dates = sorted(set(date for date in dates if date is not None))
+        if not dates:
+            return
+        # In order of date, so concurrent checkouts lock slots in the same
+        # order.
+        slots = self.filter(date__in=dates).order_by('date')\
+            .values_list('pk', 'date')
+        for pk, date in slots:
+            if not self.filter(pk=pk, booked__lt=models.F('capacity'))\
+                    .update(booked=models.F('booked') + 1):
+                raise SlotFull(date)
+
+
+class PickupSlot(models.Model):
+    """
+    How many baskets can be picked up on a delivery date.
+    """
+    date = models.DateField(_("date"), unique=True)
+    capacity = models.PositiveIntegerField(_("capacity"))
+    booked = models.PositiveIntegerField(_("booked"), default=0,
+                                         editable=False)
+
+    objects = PickupSlotManager()
+
+    class Meta:
+        ordering = ('date',)
+        app_label = 'market'
+
+    def __str__(self):
+        return 'Pickup on {}'.format(self.date)
+
+    @property
+    def remaining(self):
+        return max(self.capacity - self.booked, 0)
+
+
+class ProductSupplyManager(models.Manager):
+
+    def available(self, products, start=None):
+        """
+        The quantity left of each of ``products`` (instances or ids) per
+        delivery date from ``start`` (today by default) on, as
+        ``{product id: [(date, quantity), ...]}``, in one query.
+        """
+        if start is None:
+            start = timezone.now().date()
+        rows = self.filter(product__in=products, delivery_date__gte=start)\
+            .order_by('product', 'delivery_date')\
+            .values_list('product', 'delivery_date', 'quantity')
+        available = {}
+        for product_id, date, quantity in rows:
+            available.setdefault(product_id, []).append((date, quantity))
+        return available
+
+
+class ProductSupply(models.Model):
+    """
+    The items of a product to be delivered on a date. ``quantity`` is what
+    is left of them: reservations take from it and give back to it, like
+    Product.stock for products not planned per date, so it always reads as
+    the availability without adding up any baskets.
+    """
+    product = models.ForeignKey('market.Product', related_name='supplies')
+    delivery_date = models.DateField(_("delivery date"))
+    quantity = models.PositiveIntegerField(_("quantity left"), default=0)
+
+    objects = ProductSupplyManager()
+
+    class Meta:
+        unique_together = (
+            ('product', 'delivery_date'),
+        )
+        verbose_name_plural = _("product supplies")
+        app_label = 'market'
+
+    def __str__(self):
+        return '{} x {} on {}'.format(self.quantity, self.product_id,
+                                      self.delivery_date)
+
+
+class ProductDemandManager(models.Manager):
+
+    @transaction.atomic
+    def apply(self, changes):
+        """
+        Shift the demand by ``changes``, a dict of ``{(product id, delivery
+        date): (reserved, ordered)}`` increments: one query to find the rows,
+        one UPDATE for all of them and one INSERT of the missing ones.
+        """
+        changes = {key: delta for key, delta in changes.items()
+                   if key[0] is not None and any(delta)}
+        if not changes:
+            return
+        matches = [models.Q(product=product_id, delivery_date=date)
+                   for product_id, date in changes]
+        existing = {
+            (product_id, date): pk for pk, product_id, date in
+            self.filter(reduce(operator.or_, matches))
+            .values_list('pk', 'product', 'delivery_date')
+        }
+        if existing:
+            self.filter(pk__in=existing.values()).update(**{
+                field: models.F(field) + models.Case(
+                    *[models.When(pk=pk, then=models.Value(changes[key][i]))
+                      for key, pk in existing.items()],
+                    output_field=models.IntegerField())
+                for i, field in enumerate(('reserved', 'ordered'))
+            })
+        missing = [
+            self.model(product_id=product_id, delivery_date=date,
+                       reserved=reserved, ordered=ordered)
+            for (product_id, date), (reserved, ordered) in changes.items()
+            if (product_id, date) not in existing
+        ]
+        if not missing:
+            return
+        try:
+            with transaction.atomic():
+                self.bulk_create(missing)
+        except IntegrityError:
+            # A concurrent request created some of the rows meanwhile.
+            for row in missing:
+                if not self.filter(product=row.product_id,
+                                   delivery_date=row.delivery_date)\
+                        .update(reserved=models.F('reserved') + row.reserved,
+                                ordered=models.F('ordered') + row.ordered):
+                    row.save()
+
+    def wanted(self, delivery_date):
+        """
+        The products wanted for ``delivery_date`` by title, as ``(product,
+        sku, title, reserved, ordered)``.
+        """
+        return self.filter(delivery_date=delivery_date)\
+            .filter(models.Q(reserved__gt=0) | models.Q(ordered__gt=0))\
+            .order_by('product__title', 'product')\
+            .values_list('product', 'product__sku', 'product__title',
+                         'reserved', 'ordered')
+
+    def upcoming(self, start=None):
+        """
+        The delivery dates from ``start`` (today by default) on with any
+        demand, followed by None if there is demand without a date.
+        """
+        if start is None:
+            start = timezone.now().date()
+        demand = self.filter(models.Q(reserved__gt=0) | models.Q(ordered__gt=0))
+        dates = list(demand.filter(delivery_date__gte=start)
+                     .order_by('delivery_date')
+                     .values_list('delivery_date', flat=True).distinct())
+        if demand.filter(delivery_date=None).exists():
+            dates.append(None)
+        return dates
+
+
+class ProductDemand(models.Model):
+    """
+    How many items of a product are wanted for a delivery date: ``reserved``
+    in open baskets and ``ordered`` in checked-out ones. Kept up to date by
+    the cart, checkout and expiry of baskets in the same transactions, so the
+    purchasers never have to add up baskets to know what to order.
+    """
+    product = models.ForeignKey('market.Product', related_name='demand')
+    delivery_date = models.DateField(_("delivery date"), null=True,
+                                     blank=True)
+    reserved = models.IntegerField(_("in baskets"), default=0)
+    ordered = models.IntegerField(_("ordered"), default=0)
+
+    objects = ProductDemandManager()
+
+    class Meta:
+        unique_together = (
+            ('product', 'delivery_date'),
+        )
+        verbose_name_plural = _("product demand")
+        app_label = 'market'
+
+    def __str__(self):
+        return '{} + {} x {} on {}'.format(self.reserved, self.ordered,
+                                           self.product_id,
+                                           self.delivery_date)
+
+
+@receiver(post_migrate, dispatch_uid='market-undated-unique-indexes')
+def undated_unique_indexes(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Make sure the rows without a delivery date stay unique after migrating,
+    see market.undated.
+    """
+    if sender.name == 'eggplant.market':
+        install_undated_indexes(connections[using])
@@ -1,15 +1,80 @@
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch.dispatcher import receiver
 from django.utils.translation import ugettext_lazy as _
 from djmoney.models.fields import MoneyField
 
-from eggplant.core.utils import generate_upload_path
+from eggplant.core.thumbnails import schedule_thumbnails, thumbnails_ready
+from eggplant.core.utils import disable_for_loaddata, generate_upload_path
+
+from ..catalog import bump_catalog_version
+from ..search import install_search_index
+
+
+PRODUCT_IMAGES_DIR = 'product_images'
 
 
 def do_upload_product_image(inst, filename):
-    return generate_upload_path(inst, filename, dirname='product_images')
+    return generate_upload_path(inst, filename, dirname=PRODUCT_IMAGES_DIR)
+
+
+class ProductManager(models.Manager):
+
+    @transaction.atomic
+    def bulk_update(self, changes):
+        """
+        Apply ``changes``, a dict of ``{product id: {field: value}}``, with
+        one UPDATE per chunk of products (as many as the database takes
+        parameters for), setting every field through a CASE on the ids of the
+        products it changes for. The price is given as an amount, its
+        currency as ``price_currency``.
+
+        Like QuerySet.update() no signals are sent; the catalog version is
+        bumped and the open baskets holding repriced products refreshed
+        here instead.
+        """
+        from .cart import Basket
+        if not changes:
+            return
+        fields = sorted({field for values in changes.values()
+                         for field in values})
+        pks = sorted(changes)
+        size = connections[self.db].ops.bulk_batch_size(
+            ['pk'] + fields * 2, pks)
+        for start in range(0, len(pks), size):
+            chunk = pks[start:start + size]
+            values = {}
+            for field in fields:
+                whens = [models.When(pk=pk,
+                                     then=models.Value(changes[pk][field]))
+                         for pk in chunk if field in changes[pk]]
+                if not whens:
+                    continue
+                if field == 'price':
+                    output_field = models.DecimalField(max_digits=12,
+                                                       decimal_places=2)
+                else:
+                    output_field = self.model._meta.get_field(field)
+                values[field] = models.Case(*whens,
+                                            default=models.F(field),
+                                            output_field=output_field)
+            self.filter(pk__in=chunk).update(**values)
+        repriced = [pk for pk, values in changes.items()
+                    if 'price' in values or 'price_currency' in values]
+        Basket.objects.refresh_holding(repriced)
+        bump_catalog_version()
 
 
 class Product(models.Model):
+    sku = models.CharField(
+        _("supplier SKU"),
+        max_length=64,
+        unique=True,
+        blank=True,
+        null=True,
+        help_text=_("Identifies the product in the price lists of the "
+                    "supplier, products are imported by it.")
+    )
     title = models.CharField(
         _("title"),
         max_length=512
@@ -38,11 +103,25 @@ class Product(models.Model):
     image = models.ImageField(upload_to=do_upload_product_image, blank=True,
                               null=True)
 
+    objects = ProductManager()
+
     def __str__(self):
         return "{} {} ({})".format(self.id, self.title, self.category)
 
+    def clean(self):
+        # Forms clean a blank SKU to '', which is unique; NULLs are not.
+        self.sku = self.sku or None
+
+    def save(self, *args, **kwargs):
+        self.sku = self.sku or None
+        super(Product, self).save(*args, **kwargs)
+
     class Meta:
         app_label = 'market'
+        # The keyset the catalog is paginated by.
+        index_together = (
+            ('category', 'title', 'id'),
+        )
 
 
 class ProductCategory(models.Model):
@@ -81,3 +160,37 @@ class ProductTax(models.Model):
 
     def __str__(self):
         return "{} ({:f}%)".format(self.title, (self.tax * 100).normalize())
+
+
+@receiver([post_save, post_delete], sender=Product,
+          dispatch_uid='market-catalog-product-changed')
+@receiver([post_save, post_delete], sender=ProductCategory,
+          dispatch_uid='market-catalog-category-changed')
+@receiver([post_save, post_delete], sender=ProductTax,
+          dispatch_uid='market-catalog-tax-changed')
+def catalog_changed(sender, **kwargs):
+    """Invalidate all cached market fragments by moving to a new version."""
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Product, dispatch_uid='market-product-thumbnails')
+@disable_for_loaddata
+def product_thumbnails(sender, instance, **kwargs):
+    schedule_thumbnails(instance.image)
+
+
+@receiver(thumbnails_ready, dispatch_uid='market-catalog-thumbnails-ready')
+def product_thumbnails_ready(sender, name, **kwargs):
+    """Cached fragments still point at the original image, refresh them."""
+    if name.startswith(PRODUCT_IMAGES_DIR + '/'):
+        bump_catalog_version()
+
+
+@receiver(post_migrate, dispatch_uid='market-product-search-index')
+def product_search_index(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Make sure the search index of the products is in place after migrating,
+    SQLite drops its triggers whenever a migration rebuilds the table.
+    """
+    if sender.name == 'eggplant.market':
+        install_search_index(connections[using])
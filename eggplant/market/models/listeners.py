@@ -8,6 +8,9 @@ import logging
 from django.forms import ValidationError
 from getpaid import signals
 
+from ..audit import record_event
+from .payment import Payment
+
 log = logging.getLogger(__name__)
 
 
@@ -16,7 +19,7 @@ def new_payment_query_listener(sender, order=None, payment=None, **kwargs):
     Fills in required payment details.
     """
     payment.amount = order.amount.amount
-    payment.currency = order.amount.currency
+    payment.currency = order.amount.currency.code
 signals.new_payment_query.connect(new_payment_query_listener)
 
 
@@ -34,6 +37,10 @@ def payment_status_changed_listener(sender, instance, old_status, new_status,
     Here we will actually do something, when payment is accepted.
     E.g. lets change an order status based on payment status.
     """
+    Payment.objects.refresh_last_status([instance.order_id])
+    record_event('status_changed', payment_id=instance.order_id,
+                 transaction_id=instance.pk, old_status=old_status,
+                 new_status=new_status)
     if old_status != 'paid' and new_status == 'paid':
         # Ensures that we process order only once
         log.debug("payment for order %s has changed status to %s",
@@ -45,7 +52,11 @@ def new_payment_listener(sender, order=None, payment=None, **kwargs):
     """
     Log how many and which payments were made.
     """
-    log.debug("order %s: payment: %s", order.__dict__, payment.__dict__)
+    Payment.objects.refresh_last_status([order.pk])
+    record_event('new_payment', payment_id=order.pk,
+                 transaction_id=payment.pk, user_id=order.user_id,
+                 backend=payment.backend, amount=payment.amount,
+                 currency=payment.currency)
 signals.new_payment.connect(new_payment_listener)
 
 
@@ -54,9 +65,11 @@ def order_additional_validation_listener(sender, request=None, order=None,
     """
     Custom validation.
     """
-    log.debug("%s order %s: backend: %s",
-              request.user, order.__dict__, backend)
-    if request.user != order.user:
+    accepted = request.user == order.user
+    record_event('validation', payment_id=order.pk,
+                 user_id=request.user.pk, backend=backend,
+                 accepted=accepted)
+    if not accepted:
         raise ValidationError("user is not owner of the order")
 signals.order_additional_validation.connect(
     order_additional_validation_listener)
@@ -0,0 +1,69 @@
+from django.db import models
+from django.utils.translation import ugettext_lazy as _
+from djmoney.models.fields import MoneyField
+
+
+class OrderLineManager(models.Manager):
+
+    def snapshot(self, basket):
+        """
+        The items of ``basket`` as unsaved order lines, with everything
+        later reports need from the catalog frozen into them.
+        """
+        items = basket.items.select_related('product__tax').order_by('pk')
+        return [
+            self.model(
+                product=item.product,
+                sku=item.product.sku,
+                title=item.product.title,
+                quantity=item.quantity,
+                unit_price=item.product.price,
+                tax=item.product.tax,
+                tax_rate=item.product.tax.tax,
+                delivery_date=item.delivery_date,
+            )
+            for item in items
+        ]
+
+
+class OrderLine(models.Model):
+    """
+    A product bought at checkout, as it was then. Lines are never changed
+    afterwards; the product and tax are only kept as references.
+    """
+    payment = models.ForeignKey('market.Payment', related_name='lines',
+                                editable=False)
+    product = models.ForeignKey('market.Product', related_name='order_lines',
+                                null=True, on_delete=models.SET_NULL,
+                                editable=False)
+    sku = models.CharField(_("supplier SKU"), max_length=64, blank=True,
+                           null=True, editable=False)
+    title = models.CharField(_("title"), max_length=512, editable=False)
+    quantity = models.PositiveIntegerField(_("quantity"), editable=False)
+    unit_price = MoneyField(_("unit price"), max_digits=12, decimal_places=2,
+                            editable=False)
+    tax = models.ForeignKey('market.ProductTax', related_name='order_lines',
+                            null=True, on_delete=models.SET_NULL,
+                            editable=False)
+    tax_rate = models.DecimalField(_("tax"), max_digits=5, decimal_places=4,
+                                   editable=False)
+    delivery_date = models.DateField(_("delivery date"), null=True,
+                                     db_index=True, editable=False)
+
+    objects = OrderLineManager()
+
+    class Meta:
+        app_label = 'market'
+
+    def __str__(self):
+        return "{} x {} at {}".format(self.quantity, self.title,
+                                      self.unit_price)
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("Order lines cannot be changed.")
+        super(OrderLine, self).save(*args, **kwargs)
+
+    @property
+    def total(self):
+        return self.unit_price * self.quantity
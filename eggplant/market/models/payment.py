@@ -1,9 +1,38 @@
 import getpaid
 from django.core.urlresolvers import reverse
 from django.db import models
+from django.db.models.expressions import RawSQL
 from django.utils.translation import ugettext_lazy as _
 from djmoney.models.fields import MoneyField
 
+# The status of the latest getpaid payment of a market payment, as a
+# subquery correlated with market_payment.
+LAST_STATUS_SQL = (
+    'SELECT getpaid_payment.status FROM getpaid_payment '
+    'WHERE getpaid_payment.order_id = market_payment.id '
+    'ORDER BY getpaid_payment.created_on DESC, getpaid_payment.id DESC '
+    'LIMIT 1'
+)
+
+
+class PaymentManager(models.Manager):
+
+    def with_current_status(self):
+        """
+        The payments with ``current_status``, the status of their latest
+        getpaid payment read by a subquery. For when ``last_status`` cannot
+        be trusted, e.g. after getpaid payments were updated in bulk.
+        """
+        return self.extra(select={'current_status': LAST_STATUS_SQL})
+
+    def refresh_last_status(self, pks=None):
+        """
+        Recompute ``last_status`` of the payments ``pks`` (all by default)
+        with a single UPDATE.
+        """
+        payments = self.all() if pks is None else self.filter(pk__in=pks)
+        return payments.update(last_status=RawSQL(LAST_STATUS_SQL, ()))
+
 
 class Payment(models.Model):
     amount = MoneyField(
@@ -12,16 +41,29 @@ class Payment(models.Model):
         decimal_places=2,
     )
     account = models.ForeignKey('accounts.Account')
+    user = models.ForeignKey('auth.User', null=True, editable=False,
+                             on_delete=models.SET_NULL,
+                             related_name='market_payments')
     created = models.DateTimeField(auto_now_add=True, null=False,
                                    db_index=True)
+    # Denormalized from the getpaid payments by the listeners, so lists of
+    # payments need no query per row. None until payment is attempted.
+    last_status = models.CharField(_("payment status"), max_length=20,
+                                   null=True, blank=True, editable=False,
+                                   db_index=True)
+
+    objects = PaymentManager()
 
     def get_absolute_url(self):
         return reverse('eggplant:market:order_info', kwargs={'pk': self.pk})
 
+    def get_taxes(self):
+        """Net, tax and gross of the lines per tax rate, see market.tax."""
+        from ..tax import order_taxes
+        return order_taxes(self)
+
     def get_last_payment_status(self):
-        payments = self.payments.all().order_by('-created_on')[:1]
-        if payments:
-            return payments[0].status
+        return self.last_status
 
     def __str__(self):
         return "Payment#{} of {} ({})".format(
@@ -31,7 +73,7 @@ class Payment(models.Model):
         )
 
     def is_ready_for_payment(self):
-        return bool(self.total)
+        return bool(self.amount)
 
     class Meta:
         app_label = 'market'
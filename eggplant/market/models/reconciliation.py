@@ -0,0 +1,67 @@
+from django.db import models, transaction
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+
+class ReconciliationManager(models.Manager):
+
+    def replace(self, rows, source='', reconciled=None, batch_size=500):
+        """
+        Store ``rows`` of ``(transaction id, status, settled amount, settled
+        currency, external id)``, reconciled with ``source`` at
+        ``reconciled`` (now by default), in place of the reconciliations of
+        the same transactions.
+        """
+        if not rows:
+            return
+        reconciled = reconciled or timezone.now()
+        with transaction.atomic(using=self.db):
+            self.filter(transaction_id__in=[row[0] for row in rows]).delete()
+            self.bulk_create([
+                self.model(transaction_id=pk, status=status,
+                           settled_amount=amount, settled_currency=currency,
+                           external_id=external_id, source=source,
+                           reconciled=reconciled)
+                for pk, status, amount, currency, external_id in rows
+            ], batch_size=batch_size)
+
+
+class Reconciliation(models.Model):
+    """
+    How a transaction, a getpaid payment, compares to the settlement report
+    of the gateway, as found by the last ``reconcile_payments`` it was part
+    of, see market.reconciliation.
+    """
+    MATCHED = 'matched'
+    MISMATCHED = 'mismatched'
+    DUPLICATE = 'duplicate'
+    MISSING = 'missing'
+    STATUSES = (
+        (MATCHED, _("matched")),
+        (MISMATCHED, _("mismatched")),
+        (DUPLICATE, _("settled more than once")),
+        (MISSING, _("missing from the settlement")),
+    )
+
+    transaction = models.OneToOneField('getpaid.Payment', primary_key=True,
+                                       related_name='reconciliation')
+    status = models.CharField(_("status"), max_length=20, choices=STATUSES,
+                              db_index=True)
+    settled_amount = models.DecimalField(_("settled amount"), max_digits=12,
+                                         decimal_places=2, null=True,
+                                         blank=True)
+    settled_currency = models.CharField(_("settled currency"), max_length=3,
+                                        blank=True)
+    external_id = models.CharField(_("external id"), max_length=64,
+                                   blank=True)
+    source = models.CharField(_("settlement"), max_length=255, blank=True)
+    reconciled = models.DateTimeField(_("reconciled"), default=timezone.now)
+
+    objects = ReconciliationManager()
+
+    class Meta:
+        app_label = 'market'
+
+    def __str__(self):
+        return '{} transaction {}'.format(self.get_status_display(),
+                                          self.transaction_id)
@@ -0,0 +1,185 @@
+import operator
+from functools import reduce
+
+from django.db import IntegrityError, models, transaction
+
+
+class InsufficientStock(Exception):
+    """
+    Raised when a product does not have enough items in stock to satisfy a
+    reservation.
+    """
+
+    def __init__(self, product, requested, available):
+        self.product = product
+        self.requested = requested
+        self.available = available
+        super().__init__(
+            "Insufficient stock of {}: requested {}, available {}".format(
+                product, requested, available))
+
+
+class StockReservationManager(models.Manager):
+
+    @transaction.atomic
+    def reserve(self, basket, product, quantity, delivery_date=None):
+        """
+        Take ``quantity`` items of ``product`` off the stock and record them
+        in the ledger of ``basket``.
+
+        Items for a ``delivery_date`` the product has a supply planned for
+        are taken from that supply, any others from Product.stock. Either
+        counter is decremented by a single conditional UPDATE in the
+        database, so concurrent buyers can never drive it below zero nor
+        overwrite each other. Products with endless stock (``stock`` is
+        NULL) are never recorded in the ledger.
+
+        The basket is marked active first, in the same transaction, so an
+        expiry sweep cannot claim it before the items are in its ledger;
+        BasketClosed is raised if it is not open any more.
+        """
+        from .cart import BasketClosed
+        from .delivery import ProductSupply
+        from .inventory import Product
+        if not basket.touch_open():
+            raise BasketClosed("Basket {} is not open".format(basket.pk))
+        if delivery_date is not None:
+            supply = ProductSupply.objects.filter(product=product,
+                                                  delivery_date=delivery_date)
+            # Read apart so the UPDATE stays on a single table: with a join
+            # Django updates the ids of a subquery, and the quantity would
+            # not be checked again against a row a concurrent buyer updated.
+            enabled = Product.objects.filter(pk=product.pk, enabled=True)\
+                .exists()
+            if enabled and supply.filter(quantity__gte=quantity)\
+                    .update(quantity=models.F('quantity') - quantity):
+                self._add_to_ledger(basket, product, quantity, delivery_date)
+                return
+            available = supply.values_list('quantity', flat=True).first()
+            if available is not None:
+                raise InsufficientStock(product, quantity,
+                                        available if enabled else 0)
+        taken = Product.objects\
+            .filter(pk=product.pk, enabled=True, stock__gte=quantity)\
+            .update(stock=models.F('stock') - quantity)
+        if not taken:
+            enabled, stock = Product.objects.filter(pk=product.pk)\
+                .values_list('enabled', 'stock').first() or (False, 0)
+            if enabled and stock is None:
+                return
+            raise InsufficientStock(product, quantity,
+                                    stock if enabled else 0)
+        self._add_to_ledger(basket, product, quantity)
+
+    @transaction.atomic
+    def release(self, basket, product, quantity, delivery_date=None):
+        """
+        Give up to ``quantity`` reserved items of ``product`` for
+        ``delivery_date`` back to where they were taken from. Returns the
+        number of items actually released, which is never more than what
+        ``basket`` has reserved.
+        """
+        from .delivery import ProductSupply
+        from .inventory import Product
+        reservations = self.select_for_update()\
+            .filter(basket=basket, product=product)
+        reservation = None
+        if delivery_date is not None:
+            reservation = reservations.filter(delivery_date=delivery_date)\
+                .first()
+        if reservation is None:
+            # Taken from the stock of the product.
+            reservation = reservations.filter(delivery_date=None).first()
+        if reservation is None:
+            return 0
+        released = min(quantity, reservation.quantity)
+        if released == reservation.quantity:
+            reservation.delete()
+        else:
+            self.filter(pk=reservation.pk)\
+                .update(quantity=models.F('quantity') - released)
+        if reservation.delivery_date is None:
+            Product.objects.filter(pk=product.pk, stock__isnull=False)\
+                .update(stock=models.F('stock') + released)
+        else:
+            ProductSupply.objects\
+                .filter(product=product,
+                        delivery_date=reservation.delivery_date)\
+                .update(quantity=models.F('quantity') + released)
+        return released
+
+    def give_back(self, reservations):
+        """
+        Return everything booked in ``reservations`` (a queryset of the
+        ledger) to the stock and supplies, with one UPDATE per kind of
+        counter, and delete them.
+        """
+        from .delivery import ProductSupply
+        from .inventory import Product
+        totals = list(reservations.values_list('product', 'delivery_date')
+                      .annotate(quantity=models.Sum('quantity'))
+                      .order_by('product', 'delivery_date'))
+        stock = [(product_id, quantity)
+                 for product_id, date, quantity in totals if date is None]
+        supplies = [(product_id, date, quantity)
+                    for product_id, date, quantity in totals
+                    if date is not None]
+        # Only the rows of the products given back are locked, and only until
+        # the end of the caller's transaction.
+        if stock:
+            Product.objects\
+                .filter(pk__in=[product_id for product_id, __ in stock],
+                        stock__isnull=False)\
+                .update(stock=models.F('stock') + models.Case(
+                    *[models.When(pk=product_id, then=models.Value(quantity))
+                      for product_id, quantity in stock],
+                    output_field=models.IntegerField()))
+        if supplies:
+            matches = [(models.Q(product=product_id, delivery_date=date),
+                        quantity)
+                       for product_id, date, quantity in supplies]
+            ProductSupply.objects\
+                .filter(reduce(operator.or_, [q for q, __ in matches]))\
+                .update(quantity=models.F('quantity') + models.Case(
+                    *[models.When(q, then=models.Value(quantity))
+                      for q, quantity in matches],
+                    output_field=models.IntegerField()))
+        reservations.delete()
+
+    def _add_to_ledger(self, basket, product, quantity, delivery_date=None):
+        current = self.filter(basket=basket, product=product,
+                              delivery_date=delivery_date)
+        if current.update(quantity=models.F('quantity') + quantity):
+            return
+        try:
+            with transaction.atomic():
+                self.create(basket=basket, product=product, quantity=quantity,
+                            delivery_date=delivery_date)
+        except IntegrityError:
+            # Another request of the same basket created the row meanwhile.
+            current.update(quantity=models.F('quantity') + quantity)
+
+
+class StockReservation(models.Model):
+    """
+    Ledger of the items a basket has taken off the stock of a product.
+    """
+    basket = models.ForeignKey('market.Basket', related_name='reservations')
+    product = models.ForeignKey('market.Product', related_name='reservations')
+    quantity = models.PositiveIntegerField(default=0)
+    # Set when the items were taken from the supply of the product for this
+    # date rather than from its stock.
+    delivery_date = models.DateField(null=True, blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    objects = StockReservationManager()
+
+    class Meta:
+        unique_together = (
+            ('basket', 'product', 'delivery_date'),
+        )
+        app_label = 'market'
+
+    def __str__(self):
+        return 'Reservation of {} x {} for {}'.format(
+            self.quantity, self.product_id, self.basket_id)
@@ -0,0 +1,111 @@
+"""
+Packing lists of a delivery date, from the order lines of the baskets
+checked out for it. The lines ordered without a date, as the cart does by
+default, are packed as a list of their own, the delivery date None.
+
+Both lists are a single GROUP BY query over the order lines: the totals per
+product tell the packers what to get out of the store, the quantities per
+member and product what goes into every bag, member number by member
+number. Rows are streamed out of the database in order, so a list never has
+to be held in memory as a whole.
+"""
+import csv
+from itertools import groupby
+
+from django.contrib.auth.models import User
+from django.db import models
+
+from .importexport import Echo
+from .models.order import OrderLine
+
+PRODUCT_COLUMNS = ('product', 'sku', 'title', 'quantity', 'members')
+MEMBER_COLUMNS = ('member', 'username', 'name', 'product', 'sku', 'title',
+                  'quantity')
+
+
+def get_delivery_dates(start):
+    """
+    The delivery dates from ``start`` on that anything is ordered for,
+    followed by None if anything is ordered without a date.
+    """
+    dates = list(OrderLine.objects.filter(delivery_date__gte=start)
+                 .order_by('delivery_date')
+                 .values_list('delivery_date', flat=True).distinct())
+    if OrderLine.objects.filter(delivery_date=None).exists():
+        dates.append(None)
+    return dates
+
+
+def products_to_pack(delivery_date):
+    """
+    The total quantity of every product ordered for ``delivery_date`` and
+    the number of members who ordered it, by title.
+    """
+    return OrderLine.objects.filter(delivery_date=delivery_date)\
+        .values_list('product', 'sku', 'title')\
+        .annotate(quantity=models.Sum('quantity'),
+                  members=models.Count('payment__user', distinct=True))\
+        .order_by('title', 'product', 'sku')
+
+
+def member_packing(delivery_date):
+    """
+    The quantity of every product each member ordered for
+    ``delivery_date``, by member number.
+    """
+    return OrderLine.objects.filter(delivery_date=delivery_date)\
+        .values_list('payment__user', 'product', 'sku', 'title')\
+        .annotate(quantity=models.Sum('quantity'))\
+        .order_by('payment__user', 'title', 'product', 'sku')
+
+
+def members_to_pack(delivery_date):
+    """
+    Yield ``(member, lines)`` for every member with an order for
+    ``delivery_date``; ``member`` is a dict of the id, username and name of
+    the member and ``lines`` an iterator of ``(product, sku, title,
+    quantity)``.
+    """
+    # Grouping on the ids only is what keeps the aggregate fast, the names
+    # of the members are looked up on their own.
+    members = {
+        user_id: {
+            'id': user_id,
+            'username': username,
+            'name': ' '.join(filter(None, (first_name, last_name))),
+        }
+        for user_id, username, first_name, last_name in
+        User.objects.filter(pk__in=OrderLine.objects
+                            .filter(delivery_date=delivery_date)
+                            .values('payment__user'))
+        .order_by()
+        .values_list('pk', 'username', 'first_name', 'last_name')
+    }
+    unknown = {'id': None, 'username': '', 'name': ''}
+    rows = member_packing(delivery_date).iterator()
+    for user_id, lines in groupby(rows, key=lambda row: row[0]):
+        yield members.get(user_id, unknown), (line[1:] for line in lines)
+
+
+def export_packing_list(delivery_date, by='product', chunk_size=1000):
+    """
+    Yield the packing list of ``delivery_date`` ``by`` product or member as
+    CSV, ``chunk_size`` rows at a time.
+    """
+    writer = csv.writer(Echo())
+    if by == 'member':
+        yield writer.writerow(MEMBER_COLUMNS)
+        rows = ((member['id'], member['username'], member['name']) + line
+                for member, lines in members_to_pack(delivery_date)
+                for line in lines)
+    else:
+        yield writer.writerow(PRODUCT_COLUMNS)
+        rows = products_to_pack(delivery_date).iterator()
+    chunk = []
+    for row in rows:
+        chunk.append(writer.writerow(row))
+        if len(chunk) >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
@@ -0,0 +1,58 @@
+"""
+Keyset (seek) pagination of the product catalog.
+
+Products are ordered by (category, title, id) and a page starts right after
+the last product of the previous one, which is handed around as an opaque
+cursor. Unlike OFFSET, looking up a page costs the same however deep into
+the catalog it is, and products added or removed meanwhile never make a
+page skip or repeat items.
+"""
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+
+CURSOR_SALT = 'eggplant.market.pagination'
+
+ORDERING = ('category_id', 'title', 'id')
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def get_page_size():
+    return getattr(settings, 'MARKET_PRODUCTS_PAGE_SIZE', 24)
+
+
+def make_cursor(product):
+    return signing.dumps([product.category_id, product.title, product.id],
+                         salt=CURSOR_SALT)
+
+
+def read_cursor(cursor):
+    try:
+        category_id, title, pk = signing.loads(cursor, salt=CURSOR_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        raise InvalidCursor(cursor)
+    return category_id, title, pk
+
+
+def seek(queryset, cursor=None, size=None):
+    """
+    Return the products of ``queryset`` following ``cursor`` (or the first
+    ones) and the cursor of the next page, or None if this is the last one.
+    """
+    size = size or get_page_size()
+    queryset = queryset.order_by(*ORDERING)
+    if cursor:
+        category_id, title, pk = read_cursor(cursor)
+        queryset = queryset.filter(
+            Q(category_id__gt=category_id) |
+            Q(category_id=category_id, title__gt=title) |
+            Q(category_id=category_id, title=title, id__gt=pk))
+    # One extra row tells whether there is a next page at all.
+    products = list(queryset[:size + 1])
+    if len(products) > size:
+        products = products[:size]
+        return products, make_cursor(products[-1])
+    return products, None
@@ -0,0 +1,163 @@
+"""
+Reconciliation of the transactions, the getpaid payments, with the
+settlement report of the payment gateway.
+
+The report is CSV with a header row, or JSON Lines, with the columns in
+COLUMNS: the id of the transaction (ePay's order id), the amount settled
+and, optionally, its currency code and the gateway's id of the transaction.
+Every transaction settled is recorded as a Reconciliation:
+
+``matched``
+    paid, and settled for the amount and currency it was paid in;
+``mismatched``
+    settled for another amount or currency, or not paid as far as we know;
+``duplicate``
+    settled more than once;
+``missing``
+    paid within the period reconciled, but not settled at all.
+
+Rows of transactions we do not know of are only reported. Like the product
+import the report is read a row at a time and reconciled in batches, with
+one query to look up the transactions of a batch and a DELETE and a
+bulk_create to write their reconciliations. The transactions are looked up
+batch by batch rather than indexed all at once, since such an index would
+grow with every payment ever made; the ids of the transactions settled so
+far are all that is kept, in a set, to tell the duplicates and the missing
+ones.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.utils import timezone
+
+from .importexport import MAX_ERRORS, RowError
+from .models.payment import GetPaidPayment
+from .models.reconciliation import Reconciliation
+
+COLUMNS = ('transaction', 'amount', 'currency', 'external_id')
+
+
+class Reconciler:
+    """
+    Reconcile the transactions with the settlement rows as yielded by
+    importexport.read_rows.
+    """
+
+    def __init__(self, source='', batch_size=500):
+        self.source = source
+        self.batch_size = batch_size
+        self.reconciled = timezone.now()
+        self.settled = set()
+        self.matched = self.mismatched = self.duplicate = 0
+        self.missing = self.unknown = self.invalid = 0
+        self.problem_count = 0
+        self.problems = []
+
+    def run(self, rows, start=None, end=None):
+        """
+        Reconcile ``rows``, then, given a period, find the transactions paid
+        from ``start`` up to ``end`` (excluded) that were not settled.
+        """
+        batch = []
+        for line, row in rows:
+            try:
+                batch.append((line, self.clean(row)))
+            except RowError as e:
+                self.invalid += 1
+                self.report(line, str(e))
+                continue
+            if len(batch) >= self.batch_size:
+                self.write(batch)
+                batch = []
+        if batch:
+            self.write(batch)
+        if start is not None and end is not None:
+            self.find_missing(start, end)
+        return self
+
+    def report(self, line, problem):
+        """Keep ``problem`` of the row ``line`` (None if none) to report."""
+        self.problem_count += 1
+        if len(self.problems) < MAX_ERRORS:
+            self.problems.append((line, problem))
+
+    def clean(self, row):
+        if row is None:
+            raise RowError("Not a valid row.")
+        row = {key: (value.strip() if isinstance(value, str) else value)
+               for key, value in row.items() if key}
+        try:
+            transaction_id = int(row.get('transaction'))
+        except (TypeError, ValueError):
+            raise RowError("Invalid transaction {!r}.".format(
+                row.get('transaction')))
+        try:
+            amount = Decimal(str(row.get('amount')))
+        except InvalidOperation:
+            raise RowError("Invalid amount {!r}.".format(row.get('amount')))
+        if not amount.is_finite():
+            raise RowError("Invalid amount {!r}.".format(row.get('amount')))
+        return (transaction_id, amount.quantize(Decimal('0.01')),
+                (row.get('currency') or '').upper(),
+                str(row.get('external_id') or '')[:64])
+
+    def write(self, batch):
+        transactions = {
+            pk: (status, amount_paid, currency) for
+            pk, status, amount_paid, currency in
+            GetPaidPayment.objects.filter(
+                pk__in={row[0] for __, row in batch})
+            .values_list('pk', 'status', 'amount_paid', 'currency')
+        }
+        reconciliations = {}
+        for line, (pk, amount, currency, external_id) in batch:
+            if pk not in transactions:
+                self.unknown += 1
+                self.report(line, "Unknown transaction {}.".format(pk))
+                continue
+            status = self.compare(line, pk, amount, currency,
+                                  *transactions[pk])
+            # The last row of a transaction wins, it is a duplicate.
+            reconciliations[pk] = (pk, status, amount, currency, external_id)
+        Reconciliation.objects.replace(list(reconciliations.values()),
+                                       self.source, self.reconciled)
+
+    def compare(self, line, pk, amount, currency, status, amount_paid,
+                paid_currency):
+        if pk in self.settled:
+            self.duplicate += 1
+            self.report(line, "Transaction {} was settled again.".format(pk))
+            return Reconciliation.DUPLICATE
+        self.settled.add(pk)
+        if status != 'paid':
+            problem = "Transaction {} is {}, not paid.".format(pk, status)
+        elif amount != amount_paid:
+            problem = "Transaction {} was paid {} but settled {}.".format(
+                pk, amount_paid, amount)
+        elif currency not in ('', paid_currency):
+            problem = "Transaction {} was paid in {} but settled in {}."\
+                .format(pk, paid_currency, currency)
+        else:
+            self.matched += 1
+            return Reconciliation.MATCHED
+        self.mismatched += 1
+        self.report(line, problem)
+        return Reconciliation.MISMATCHED
+
+    def find_missing(self, start, end):
+        paid = GetPaidPayment.objects.filter(
+            status='paid', paid_on__gte=start, paid_on__lt=end)\
+            .order_by('pk').values_list('pk', flat=True)
+        last_pk = 0
+        while True:
+            chunk = list(paid.filter(pk__gt=last_pk)[:self.batch_size])
+            if not chunk:
+                return
+            last_pk = chunk[-1]
+            missing = [pk for pk in chunk if pk not in self.settled]
+            for pk in missing:
+                self.report(None, "Transaction {} was paid but not "
+                                  "settled.".format(pk))
+            self.missing += len(missing)
+            Reconciliation.objects.replace(
+                [(pk, Reconciliation.MISSING, None, '', '')
+                 for pk in missing], self.source, self.reconciled)
@@ -0,0 +1,140 @@
+"""
+Full-text search of the products of the market.
+
+On PostgreSQL the products table carries a stored ``search_vector`` column,
+kept up to date by a trigger and indexed with GIN. It holds the title (weight
+A) and description (weight B) parsed with the text search configuration of
+every language in settings.LANGUAGES.
+
+On SQLite (development and tests) an FTS5 table with external content is
+kept in sync by triggers instead.
+
+Neither is known to the ORM: ``install_search_index`` creates them, from a
+migration and again after every ``migrate`` as SQLite drops the triggers
+whenever Django rebuilds the products table.
+"""
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.utils.translation import get_language
+
+PRODUCT_TABLE = 'market_product'
+SQLITE_FTS_TABLE = 'market_product_fts'
+
+# Text search configuration of PostgreSQL per language code.
+SEARCH_CONFIGURATIONS = {
+    'da': 'danish',
+    'en': 'english',
+}
+
+POSTGRESQL_DOCUMENT = (
+    "setweight(to_tsvector('{config}', coalesce(NEW.title, '')), 'A') || "
+    "setweight(to_tsvector('{config}', coalesce(NEW.description, '')), 'B')"
+)
+
+POSTGRESQL_INSTALL = [
+    'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector',
+    'CREATE INDEX IF NOT EXISTS {table}_search_vector '
+    'ON {table} USING GIN (search_vector)',
+    'CREATE OR REPLACE FUNCTION {table}_search_vector_update() '
+    'RETURNS trigger AS $$ BEGIN NEW.search_vector := {document}; '
+    'RETURN NEW; END $$ LANGUAGE plpgsql',
+    'DROP TRIGGER IF EXISTS {table}_search_vector_update ON {table}',
+    'CREATE TRIGGER {table}_search_vector_update '
+    'BEFORE INSERT OR UPDATE OF title, description ON {table} '
+    'FOR EACH ROW EXECUTE PROCEDURE {table}_search_vector_update()',
+]
+
+SQLITE_INSTALL = [
+    'CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5('
+    "title, description, content='{table}', content_rowid='id')",
+    'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN '
+    'INSERT INTO {fts}(rowid, title, description) '
+    'VALUES (new.id, new.title, new.description); END',
+    'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN '
+    "INSERT INTO {fts}({fts}, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); END",
+    'CREATE TRIGGER IF NOT EXISTS {fts}_au '
+    'AFTER UPDATE OF title, description ON {table} BEGIN '
+    "INSERT INTO {fts}({fts}, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    'INSERT INTO {fts}(rowid, title, description) '
+    'VALUES (new.id, new.title, new.description); END',
+]
+
+
+def get_search_configurations():
+    return [SEARCH_CONFIGURATIONS[code] for code, __ in settings.LANGUAGES
+            if code in SEARCH_CONFIGURATIONS]
+
+
+def install_search_index(connection, rebuild=False):
+    """
+    Create the search index of the products, if missing. ``rebuild``
+    (re)indexes the existing products as well.
+    """
+    if connection.vendor == 'postgresql':
+        document = ' || '.join(POSTGRESQL_DOCUMENT.format(config=config)
+                               for config in get_search_configurations())
+        statements = [sql.format(table=PRODUCT_TABLE, document=document)
+                      for sql in POSTGRESQL_INSTALL]
+        if rebuild:
+            statements.append(
+                'UPDATE {table} SET title = title'.format(table=PRODUCT_TABLE))
+    elif connection.vendor == 'sqlite':
+        statements = [sql.format(table=PRODUCT_TABLE, fts=SQLITE_FTS_TABLE)
+                      for sql in SQLITE_INSTALL]
+        if rebuild:
+            statements.append(
+                "INSERT INTO {fts}({fts}) VALUES ('rebuild')".format(
+                    fts=SQLITE_FTS_TABLE))
+    else:
+        return
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def search_products(queryset, query, language=None):
+    """
+    Narrow down ``queryset`` to the products matching ``query``, best
+    matches first. Every word of the query has to match, the last one as a
+    prefix so results show up while typing.
+    """
+    words = re.findall(r'\w+', query or '')
+    if not words:
+        return queryset
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        language = (language or get_language() or '').split('-')[0]
+        config = SEARCH_CONFIGURATIONS.get(language, 'simple')
+        tsquery = ' & '.join(words) + ':*'
+        return queryset.extra(
+            select={'search_rank': 'ts_rank({}.search_vector, '
+                                   'to_tsquery(%s, %s))'.format(PRODUCT_TABLE)},
+            select_params=(config, tsquery),
+            where=['{}.search_vector @@ to_tsquery(%s, %s)'.format(
+                PRODUCT_TABLE)],
+            params=(config, tsquery),
+            order_by=['-search_rank'],
+        )
+    if vendor == 'sqlite':
+        match = ' '.join('"{}"'.format(word) for word in words) + '*'
+        return queryset.extra(
+            select={'search_rank': 'bm25({}, 10.0, 1.0)'.format(
+                SQLITE_FTS_TABLE)},
+            tables=[SQLITE_FTS_TABLE],
+            where=[
+                '{fts}.rowid = {table}.id'.format(fts=SQLITE_FTS_TABLE,
+                                                  table=PRODUCT_TABLE),
+                '{} MATCH %s'.format(SQLITE_FTS_TABLE),
+            ],
+            params=(match,),
+            order_by=['search_rank'],
+        )
+    for word in words:
+        queryset = queryset.filter(Q(title__icontains=word) |
+                                   Q(description__icontains=word))
+    return queryset
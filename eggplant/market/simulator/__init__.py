@@ -0,0 +1,76 @@
+"""
+A getpaid backend standing in for ePay, to try out and load-test payments
+without the live gateway. Never enable it in production: it pays whatever
+it is asked to.
+
+It keeps to ePay's contract: the member is sent to a payment window with
+the signed parameters of the payment, the gateway calls the callback URL
+with the signed confirmation and sends the member on to the accept URL, or
+to the cancel URL if the payment failed. The window answers after a
+configurable delay and fails a configurable share of the payments, see
+GETPAID_BACKENDS_SETTINGS['eggplant.market.simulator']:
+
+``secret``
+    Signs the requests both ways, 'simulator' by default.
+``latency``
+    Seconds the gateway takes to answer, 0 by default.
+``latency_jitter``
+    Seconds the latency may be off by, either way, 0 by default.
+``failure_rate``
+    Share of the payments that fail, from 0 (the default) to 1.
+"""
+import hashlib
+import random
+from collections import OrderedDict
+
+from django.core.urlresolvers import reverse
+from django.utils.six.moves.urllib.parse import urlencode
+from django.utils.translation import ugettext_lazy as _
+from getpaid.backends import epaydk
+
+
+class PaymentProcessor(epaydk.PaymentProcessor):
+    BACKEND = 'eggplant.market.simulator'
+    BACKEND_NAME = _('Payment simulator')
+    BACKEND_LOGO_URL = None
+
+    @staticmethod
+    def compute_hash(params):
+        secret = PaymentProcessor.get_backend_setting('secret', 'simulator')
+        values = ''.join(value for key, value in params.items()
+                         if key != 'hash')
+        return hashlib.md5((values + secret).encode('utf8')).hexdigest()
+
+    @staticmethod
+    def is_received_request_valid(params):
+        return params.get('hash') == PaymentProcessor.compute_hash(params)
+
+    @staticmethod
+    def get_latency():
+        latency = float(PaymentProcessor.get_backend_setting('latency', 0))
+        jitter = float(PaymentProcessor.get_backend_setting('latency_jitter',
+                                                            0))
+        return max(latency + random.uniform(-jitter, jitter), 0)
+
+    @staticmethod
+    def fails():
+        rate = float(PaymentProcessor.get_backend_setting('failure_rate', 0))
+        return random.random() < rate
+
+    def get_gateway_url(self, request):
+        def url(name):
+            return request.build_absolute_uri(
+                reverse('getpaid:simulator:{}'.format(name)))
+        params = OrderedDict((
+            ('merchantnumber', 'simulator'),
+            ('orderid', str(self.payment.id)),
+            ('currency', str(self.get_number_for_currency(
+                self.payment.currency))),
+            ('amount', self.format_amount(self.payment.amount)),
+            ('accepturl', url('success')),
+            ('callbackurl', url('online')),
+            ('cancelurl', url('failure')),
+        ))
+        params['hash'] = self.compute_hash(params)
+        return ('{}?{}'.format(url('gateway'), urlencode(params)), 'GET',
+                {})
@@ -0,0 +1,3 @@
+def build_models(payment_class):
+    """The simulator keeps no models of its own."""
+    return []
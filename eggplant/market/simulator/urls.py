@@ -0,0 +1,10 @@
+from django.conf.urls import url
+
+from . import views
+
+urlpatterns = [
+    url(r'^gateway/$', views.gateway, name='gateway'),
+    url(r'^online/$', views.online, name='online'),
+    url(r'^success/$', views.success, name='success'),
+    url(r'^failure/$', views.failure, name='failure'),
+]
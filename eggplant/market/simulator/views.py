@@ -0,0 +1,94 @@
+import random
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.forms import ValidationError
+from django.http import HttpResponseBadRequest
+from django.shortcuts import get_object_or_404, redirect
+from django.utils import timezone
+from django.utils.six.moves.urllib.parse import urlencode
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET
+from getpaid.backends.epaydk.forms import EpaydkCancellForm, EpaydkOnlineForm
+from getpaid.signals import order_additional_validation
+from getpaid.utils import qs_to_ordered_params
+
+from ..callbacks import queue_callback
+from ..models.payment import GetPaidPayment
+from ..views.callbacks import acknowledge
+from . import PaymentProcessor
+
+
+@require_GET
+def gateway(request):
+    """
+    The payment window: pays after a while, or fails to, and sends the
+    member back.
+    """
+    params = qs_to_ordered_params(request.META['QUERY_STRING'])
+    if not PaymentProcessor.is_received_request_valid(params):
+        return HttpResponseBadRequest("Bad request")
+    time.sleep(PaymentProcessor.get_latency())
+    if PaymentProcessor.fails():
+        return redirect('{}?{}'.format(params['cancelurl'], urlencode(
+            (('orderid', params['orderid']), ('error', '-1')))))
+    now = timezone.localtime(timezone.now())
+    confirmation = OrderedDict((
+        ('txnid', str(random.randint(1, 10 ** 9))),
+        ('orderid', params['orderid']),
+        ('amount', params['amount']),
+        ('currency', params['currency']),
+        ('date', now.strftime('%Y%m%d')),
+        ('time', now.strftime('%H%M')),
+        ('txnfee', '0'),
+        ('paymenttype', '1'),
+    ))
+    confirmation['hash'] = PaymentProcessor.compute_hash(confirmation)
+    query = urlencode(confirmation)
+    # ePay calls the callback URL, which is the simulator's own: queue the
+    # callback right here instead, the site may not be able to reach itself.
+    queue_callback(PaymentProcessor, query)
+    return redirect('{}?{}'.format(params['accepturl'], query))
+
+
+@csrf_exempt
+@require_GET
+def online(request):
+    return acknowledge(request, PaymentProcessor)
+
+
+def get_payment(request, payment_id):
+    payment = get_object_or_404(GetPaidPayment, pk=payment_id)
+    order_additional_validation.send(sender=None, request=request,
+                                     order=payment.order,
+                                     backend=PaymentProcessor.BACKEND)
+    return payment
+
+
+@require_GET
+def success(request):
+    form = EpaydkOnlineForm(request.GET)
+    params = qs_to_ordered_params(request.META['QUERY_STRING'])
+    if not form.is_valid() or \
+            not PaymentProcessor.is_received_request_valid(params):
+        return HttpResponseBadRequest("Bad request")
+    try:
+        payment = get_payment(request, form.cleaned_data['orderid'])
+        PaymentProcessor.accepted_for_processing(payment_id=payment.pk)
+    except (ValidationError, AssertionError):
+        return HttpResponseBadRequest("Bad request")
+    return redirect(settings.GETPAID_SUCCESS_URL_NAME, pk=payment.order_id)
+
+
+@require_GET
+def failure(request):
+    form = EpaydkCancellForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest("Bad request")
+    try:
+        payment = get_payment(request, form.cleaned_data['orderid'])
+    except ValidationError:
+        return HttpResponseBadRequest("Bad request")
+    PaymentProcessor.cancelled(payment_id=payment.pk)
+    return redirect(settings.GETPAID_FAILURE_URL_NAME, pk=payment.order_id)
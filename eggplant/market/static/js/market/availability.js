@@ -0,0 +1,53 @@
+/*
+ * Delivery dates of the product cards: the cards are cached for all members,
+ * so the quantity left per date is fetched for the cards on the page, and
+ * again for every page appended by catalog.js. A product with supplies per
+ * date gets a choice of its dates in its cart form; others keep taking from
+ * their stock without a date.
+ */
+(function ($) {
+    'use strict';
+
+    function dateChoice(dates) {
+        var $select = $('<select name="delivery_date" class="form-control input-sm">');
+        $.each(dates, function (i, supply) {
+            $('<option>')
+                .val(supply.date)
+                .text(supply.date + ' (' + supply.quantity + ')')
+                .prop('disabled', supply.quantity === 0)
+                .appendTo($select);
+        });
+        return $select;
+    }
+
+    function loadAvailability() {
+        var url = $('[data-product-availability-url]').data('product-availability-url'),
+            $cards = $('[data-product-availability]:not([data-product-availability-loaded])'),
+            ids = $cards.map(function () {
+                return $(this).data('product-availability');
+            }).get();
+        if (!url || !ids.length) {
+            return;
+        }
+        $cards.attr('data-product-availability-loaded', '');
+        $.getJSON(url, $.param({product: ids}, true)).done(function (data) {
+            $cards.each(function () {
+                var $card = $(this),
+                    dates = data.products[$card.data('product-availability')];
+                if (!dates || !dates.length) {
+                    return;
+                }
+                $card.closest('.col-md-3').find('form.cart-action')
+                    .find('input[name="delivery_date"]')
+                    .replaceWith(dateChoice(dates));
+            });
+        });
+    }
+
+    $(loadAvailability);
+    $(document).ajaxSuccess(function (event, xhr, settings) {
+        if (settings.dataType !== 'json') {
+            loadAvailability();
+        }
+    });
+}(jQuery));
@@ -0,0 +1,99 @@
+/*
+ * Progressive enhancement of the cart forms rendered by the cart_action
+ * template tag: when this script is loaded, the forms are posted to their
+ * JSON endpoint and the basket is updated in place instead of reloading the
+ * whole page. Without JavaScript the forms keep working as plain POSTs.
+ */
+(function ($) {
+    'use strict';
+
+    function showMessage(text, level) {
+        if (!text) {
+            return;
+        }
+        var $alert = $('<div class="alert alert-dismissible" role="alert">')
+            .addClass('alert-' + level)
+            .text(text);
+        $('.messages .col-md-6').empty().append($alert);
+    }
+
+    function addLine($basket, data, key) {
+        // Built from the template of the page rather than reloading it.
+        var $line = $($.parseHTML($.trim(
+            $basket.find('[data-basket-line-template]').html())));
+        $line.attr('data-basket-line', key);
+        $line.find('[data-basket-line-title]').text(data.line.title);
+        $line.find('[data-basket-line-price]').text(
+            data.line.price + ' ' + data.basket.currency);
+        $line.find('input[name="product"]').val(data.line.product);
+        $line.find('input[name="delivery_date"]')
+            .val(data.line.delivery_date || '');
+        $basket.find('[data-basket-lines]').append($line);
+        return $line;
+    }
+
+    function updateBasket(data) {
+        var $basket = $('[data-basket]');
+        if (!$basket.length) {
+            // No basket on this page.
+            return;
+        }
+        $basket.find('[data-basket-item-count]').text(data.basket.item_count);
+        $basket.find('[data-basket-total]').text(
+            data.basket.total + ' ' + data.basket.currency);
+        $basket.find('[data-basket-if-items]')
+            .prop('hidden', !data.basket.item_count);
+        $basket.find('[data-basket-if-empty]')
+            .prop('hidden', !!data.basket.item_count);
+
+        var key = data.line.product + '-' + (data.line.delivery_date || '');
+        var $line = $basket.find('[data-basket-line="' + key + '"]');
+        if (data.line.quantity === 0) {
+            $line.remove();
+            return;
+        }
+        if (!$line.length) {
+            $line = addLine($basket, data, key);
+        }
+        $line.find('[data-basket-line-quantity]').text(data.line.quantity);
+    }
+
+    function updateStock(data) {
+        var $form = $('form.cart-action input[name="product"][value="' +
+                      data.line.product + '"]').closest('form'),
+            $option = $form.find('select[name="delivery_date"] option[value="' +
+                                 data.line.delivery_date + '"]');
+        if ($option.length) {
+            // Supplied per delivery date, see availability.js.
+            $option.text(data.line.delivery_date + ' (' + data.stock + ')')
+                .prop('disabled', data.stock === 0);
+        } else if (data.stock === 0) {
+            $form.find('button').prop('disabled', true);
+        }
+    }
+
+    $(document).on('submit', 'form.cart-action[data-json-action]', function (event) {
+        var $form = $(this);
+        event.preventDefault();
+        $.ajax({
+            url: $form.data('json-action'),
+            type: 'POST',
+            data: $form.serialize(),
+            dataType: 'json'
+        }).done(function (data) {
+            showMessage(data.message, 'info');
+            updateBasket(data);
+            updateStock(data);
+        }).fail(function (xhr) {
+            var data = xhr.responseJSON;
+            if (data && data.error) {
+                showMessage(data.error, 'warning');
+                updateStock(data);
+            } else {
+                // Fall back to the plain form post, which does not trigger
+                // this handler again.
+                $form.get(0).submit();
+            }
+        });
+    });
+}(jQuery));
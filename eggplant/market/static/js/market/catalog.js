@@ -0,0 +1,40 @@
+/*
+ * Infinite scrolling of the product grid: the "More products" link at the
+ * bottom of the grid is replaced with the next page of product cards when it
+ * is clicked or scrolled into view. Without JavaScript the link opens the
+ * next page of the market instead.
+ */
+(function ($) {
+    'use strict';
+
+    var loading = false;
+
+    function loadMore($more) {
+        if (loading || !$more.length) {
+            return;
+        }
+        loading = true;
+        $.get($more.find('[data-product-page]').data('product-page'))
+            .done(function (html) {
+                $more.replaceWith(html);
+            })
+            .always(function () {
+                loading = false;
+            });
+    }
+
+    function loadIfVisible() {
+        var $more = $('[data-product-pages] [data-product-more]').first(),
+            $window = $(window);
+        if ($more.length &&
+                $more.offset().top < $window.scrollTop() + $window.height() * 2) {
+            loadMore($more);
+        }
+    }
+
+    $(document).on('click', '[data-product-page]', function (event) {
+        event.preventDefault();
+        loadMore($(this).closest('[data-product-more]'));
+    });
+    $(window).on('scroll resize', loadIfVisible);
+}(jQuery));
@@ -0,0 +1,118 @@
+"""
+Tax of baskets, orders and whole periods.
+
+Prices are net, ProductTax.tax is the factor added on top of them. Tax is
+computed per bucket of lines sharing a tax, rate and currency: the net of a
+bucket is summed up in the database by one grouped aggregate, then its tax
+is rounded once, to the cent, with settings.MARKET_TAX_ROUNDING (half up by
+default). Rounding per bucket rather than per line keeps the tax of an order
+the same however its lines are split.
+
+Only the aggregated rows ever leave the database, so summaries over any
+number of order lines cost one query and no model instances.
+"""
+from collections import namedtuple
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db import models
+from django.db.models.functions import TruncMonth
+
+CENT = Decimal('0.01')
+
+TaxBucket = namedtuple('TaxBucket', ['tax_id', 'rate', 'currency', 'net',
+                                     'tax', 'gross'])
+
+# How to get at the price, quantity, tax, rate and currency of a line.
+ORDER_LINE_FIELDS = ('unit_price', 'quantity', 'tax_id', 'tax_rate',
+                     'unit_price_currency')
+BASKET_ITEM_FIELDS = ('product__price', 'quantity', 'product__tax_id',
+                      'product__tax__tax', 'product__price_currency')
+
+
+def get_rounding():
+    return getattr(settings, 'MARKET_TAX_ROUNDING', ROUND_HALF_UP)
+
+
+def make_bucket(tax_id, rate, currency, net):
+    """The tax and gross of ``net``, rounded to the cent."""
+    # Sums may come back as floats (SQLite), each line is a whole number of
+    # cents though.
+    net = Decimal(str(net)).quantize(CENT)
+    rate = Decimal(str(rate))
+    tax = (net * rate).quantize(CENT, rounding=get_rounding())
+    return TaxBucket(tax_id, rate, str(currency), net, tax, net + tax)
+
+
+def net_expression(price, quantity):
+    return models.Sum(models.ExpressionWrapper(
+        models.F(quantity) * models.F(price),
+        output_field=models.DecimalField(max_digits=12, decimal_places=2)))
+
+
+def tax_buckets(queryset, fields=ORDER_LINE_FIELDS, group_by=()):
+    """
+    Net, tax and gross of the lines in ``queryset`` per tax, rate and
+    currency (and ``group_by``, whose values lead every row), computed by a
+    single grouped aggregate. ``fields`` tells how to get at the price,
+    quantity, tax, rate and currency of the lines.
+    """
+    price, quantity, tax, rate, currency = fields
+    rows = queryset.order_by()\
+        .values_list(*(tuple(group_by) + (tax, rate, currency)))\
+        .annotate(net=net_expression(price, quantity))\
+        .order_by(*(tuple(group_by) + (tax, rate, currency)))
+    n = len(group_by)
+    return [row[:n] + (make_bucket(*row[n:]),) if n else make_bucket(*row)
+            for row in rows]
+
+
+def line_taxes(lines):
+    """
+    Same as tax_buckets, for order lines that are not saved yet.
+    """
+    nets = {}
+    for line in lines:
+        key = (line.tax_id, line.tax_rate, str(line.unit_price.currency))
+        nets[key] = nets.get(key, Decimal('0')) + \
+            line.unit_price.amount * line.quantity
+    return [make_bucket(*(key + (net,))) for key, net in sorted(
+        nets.items(), key=lambda item: (item[0][0] or 0,) + item[0][1:])]
+
+
+def order_taxes(payment):
+    return tax_buckets(payment.lines.all())
+
+
+def basket_taxes(basket):
+    return tax_buckets(basket.items.all(), fields=BASKET_ITEM_FIELDS)
+
+
+def total(buckets):
+    """
+    Add up ``buckets`` into a single one, which has no tax nor rate. All
+    buckets must be in the same currency.
+    """
+    currencies = {bucket.currency for bucket in buckets}
+    if len(currencies) > 1:
+        raise ValueError("Cannot add up {}".format(', '.join(currencies)))
+    return TaxBucket(
+        None, None, currencies.pop() if currencies else '',
+        sum((b.net for b in buckets), Decimal('0')),
+        sum((b.tax for b in buckets), Decimal('0')),
+        sum((b.gross for b in buckets), Decimal('0')),
+    )
+
+
+def period_taxes(start, end, queryset=None):
+    """
+    Tax summary of the orders checked out from ``start`` up to ``end``, per
+    month: a list of ``(month, bucket)``.
+    """
+    from .models.order import OrderLine
+    if queryset is None:
+        queryset = OrderLine.objects.all()
+    queryset = queryset.filter(payment__created__gte=start,
+                               payment__created__lt=end)\
+        .annotate(month=TruncMonth('payment__created'))
+    return tax_buckets(queryset, group_by=('month',))
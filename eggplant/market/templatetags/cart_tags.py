@@ -1,48 +1,62 @@
 from django import template
-from django.core.urlresolvers import reverse
-from django.template import Template
+from django.core.urlresolvers import get_script_prefix, reverse
 from django.template.base import TemplateSyntaxError
+from django.template.loader import get_template
+from django.utils.lru_cache import lru_cache
+from django.utils.translation import get_language
 
 register = template.Library()
 
+CART_ACTIONS = {
+    'add': {
+        'label': 'Add to cart',
+        'url_name': 'eggplant:market:add_to_cart',
+        'json_url_name': 'eggplant:market:add_to_cart_json',
+        'btn_css_classes': 'btn btn-sm btn-success',
+    },
+    'remove': {
+        'label': 'remove',
+        'url_name': 'eggplant:market:remove_from_cart',
+        'json_url_name': 'eggplant:market:remove_from_cart_json',
+        'btn_css_classes': 'btn btn-sm btn-danger',
+    },
+}
+
+
+@lru_cache()
+def get_cart_action_urls(action, language, script_prefix):
+    """
+    Reverse the URLs of a cart action once per language (they are prefixed
+    through i18n_patterns) instead of once per rendered product.
+    """
+    return (reverse(CART_ACTIONS[action]['url_name']),
+            reverse(CART_ACTIONS[action]['json_url_name']))
+
+
+@lru_cache()
+def get_cart_action_template():
+    """
+    Compile the form template once per process, it is rendered once per
+    product on the market page.
+    """
+    return get_template('eggplant/market/_cart_action.html')
+
 
 @register.simple_tag(takes_context=True)
 def cart_action(context, action, product_id=None, quantity=None,
                 delivery_date=None):
-    btn_css_classes = 'btn btn-sm '
-    if action == 'remove':
-        url = reverse('eggplant:market:remove_from_cart')
-        btn_css_classes += 'btn-danger'
-        delivery_date_field = '<input name="delivery_date" type="hidden" ' +\
-            'value="{}"/>'.format(delivery_date or '')
-    elif action == 'add':
-        action = 'Add to cart'
-        url = reverse('eggplant:market:add_to_cart')
-        btn_css_classes += 'btn-success btn-sm'
-
-        # https://github.com/kbhff/eggplant/issues/114
-        delivery_date_field = '<input name="delivery_date" type="hidden" ' +\
-            'value="{}"/>'.format(delivery_date or '')
-    else:
+    if action not in CART_ACTIONS:
         raise TemplateSyntaxError("action `{}` not supported".format(action))
-    quantity = quantity or 1
-    context.update({
-        'action': action,
+    url, json_url = get_cart_action_urls(action, get_language(),
+                                         get_script_prefix())
+    return get_cart_action_template().render({
+        'action': CART_ACTIONS[action]['label'],
         'action_url': url,
-        'btn_css_classes': btn_css_classes,
+        'json_action_url': json_url,
+        'btn_css_classes': CART_ACTIONS[action]['btn_css_classes'],
         'product_id': int(product_id),
-        'quantity': int(quantity),
+        'quantity': int(quantity or 1),
+        # https://github.com/kbhff/eggplant/issues/114
+        'delivery_date': '{}'.format(delivery_date or ''),
         'csrf_token': context['csrf_token'],
     })
-    return Template('''
-    <form action="{{action_url}}" method="POST">
-        ''' + delivery_date_field + '''
-        <input name="product" type="hidden" value="{{product_id}}"/>
-        <input name="quantity" type="hidden" value="{{quantity}}"/>
-        <input name="csrfmiddlewaretoken" type="hidden" value="{{csrf_token}}" />
-        <p class="pull-right">
-        <button type="submit"
-            class="{{btn_css_classes}}"
-            role="button" >{{action}}</button>
-        </p>
-    </form>''').render(context)
@@ -1,14 +1,52 @@
-from datetime import date
+import csv
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
 from decimal import Decimal
+from io import StringIO
 
 from allauth.account.models import EmailAddress
-from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.core.urlresolvers import (get_script_prefix, reverse,
+                                      set_script_prefix)
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.forms import modelform_factory
+from django.template import Context, Template
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone, translation
+from getpaid.backends.epaydk import PaymentProcessor
+from moneyed import EUR, Money
+
 from eggplant.factories import AccountFactory, DepartmentFactory, UserFactory
-from eggplant.market.models.cart import Basket
+from eggplant.market import ledger, packing
+from eggplant.market.audit import AuditLog
+from eggplant.market.catalog import get_catalog_version
+from eggplant.market.importexport import (ProductImporter, export_products,
+                                          read_rows)
+from eggplant.market.models.audit import PaymentEvent
+from eggplant.market.models.callback import PaymentCallback
+from eggplant.market.models.cart import (Basket, BasketClosed, BasketItem,
+                                         MixedCurrencies)
+from eggplant.market.models.delivery import (PickupSlot, ProductDemand,
+                                             ProductSupply, SlotFull)
 from eggplant.market.models.inventory import (Product, ProductCategory,
                                               ProductTax)
+from eggplant.market.models.order import OrderLine
+from eggplant.market.models.payment import GetPaidPayment, Payment
+from eggplant.market.models.reconciliation import Reconciliation
+from eggplant.market.models.reservation import (InsufficientStock,
+                                                StockReservation)
+from eggplant.market.pagination import seek
+from eggplant.market.reconciliation import Reconciler
+from eggplant.market.search import search_products
+from eggplant.market.tax import TaxBucket, period_taxes, total
 from eggplant.profiles.models import UserProfile
+from eggplant.roles.models import RoleAssignment
 
 
 class CommonSetUpPayments(TestCase):
@@ -59,6 +97,61 @@ class TestPayments(CommonSetUpPayments):
                     kwargs=dict(pk=non_existent)))
         self.assertEqual(response.status_code, 404)
 
+    def create_payment(self, *statuses):
+        payment = Payment.objects.create(
+            amount=Money(Decimal('10'), 'DKK'), user=self.test_user,
+            account=self.test_user.profile.accounts.get())
+        for status in statuses:
+            GetPaidPayment.create(payment, 'getpaid.backends.epaydk')\
+                .change_status(status)
+        return payment
+
+    def test_last_status(self):
+        payment = self.create_payment()
+        self.assertIsNone(payment.get_last_payment_status())
+        transaction = GetPaidPayment.create(payment,
+                                            'getpaid.backends.epaydk')
+        payment.refresh_from_db()
+        self.assertEqual(payment.last_status, 'new')
+        transaction.change_status('failed')
+        GetPaidPayment.create(payment, 'getpaid.backends.epaydk')\
+            .change_status('paid')
+        # Late news of an earlier attempt does not count.
+        transaction.change_status('cancelled')
+        payment.refresh_from_db()
+        self.assertEqual(payment.get_last_payment_status(), 'paid')
+
+        GetPaidPayment.objects.filter(order=payment).update(status='failed')
+        self.assertEqual(
+            Payment.objects.with_current_status().get(pk=payment.pk)
+            .current_status, 'failed')
+        Payment.objects.refresh_last_status([payment.pk])
+        payment.refresh_from_db()
+        self.assertEqual(payment.last_status, 'failed')
+
+    def test_audit_events(self):
+        payment = self.create_payment('paid')
+        events = list(PaymentEvent.objects.filter(payment_id=payment.pk))
+        self.assertEqual([event.event for event in events],
+                         ['new_payment', 'status_changed'])
+        self.assertEqual(events[0].user_id, self.test_user.pk)
+        self.assertEqual(Decimal(json.loads(events[0].data)['amount']), 10)
+        self.assertEqual(json.loads(events[1].data),
+                         {'old_status': 'new', 'new_status': 'paid'})
+
+    def test_payment_list_queries(self):
+        url = reverse('eggplant:market:payment_list')
+        self.create_payment('paid')
+        with CaptureQueriesContext(connection) as one:
+            self.assertContains(self.client.get(url), 'paid')
+        for i in range(5):
+            self.create_payment('failed', 'paid')
+        self.create_payment()
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+        self.assertContains(response, 'not created')
+        self.assertEqual(len(many), len(one))
+
 
 class TestMarketModels(CommonSetUpPayments):
 
@@ -120,3 +213,1358 @@ class TestMarketModels(CommonSetUpPayments):
         self.test_basket.remove_from_items(product=self.test_product_1, quantity=1, delivery_date=None)
         basket_items = self.test_basket.items.filter(product=self.test_product_1, delivery_date=None)
         self.assertEqual(basket_items[0].quantity, 2)
+
+
+class TestBasketSummary(TestCase):
+
+    def setUp(self):
+        category = ProductCategory.objects.create(title='test_category')
+        tax = ProductTax.objects.create(title='test_tax', tax=Decimal(0))
+        self.apple = Product.objects.create(
+            title='apple', category=category, tax=tax, price=Decimal('2.50'))
+        self.pear = Product.objects.create(
+            title='pear', category=category, tax=tax, price=Decimal('4'))
+        self.basket = Basket.objects.create(user=UserFactory())
+
+    def assertSummary(self, item_count, total):
+        self.assertEqual(self.basket.get_items_count(), item_count)
+        self.assertEqual(self.basket.get_total_amount(), Decimal(total))
+        basket = Basket.objects.get(pk=self.basket.pk)
+        self.assertEqual(basket.item_count, item_count)
+        self.assertEqual(basket.total, Decimal(total))
+
+    def test_summary_follows_items(self):
+        self.basket.add_to_items(product=self.apple, quantity=2)
+        self.basket.add_to_items(product=self.pear, quantity=1)
+        self.basket.add_to_items(product=self.apple, quantity=1)
+        self.assertSummary(2, '11.50')
+        self.assertEqual(self.basket.get_totals(), {'DKK': Decimal('11.50')})
+
+        self.basket.remove_from_items(product=self.apple, quantity=1)
+        self.assertSummary(2, '9')
+        self.basket.remove_from_items(product=self.pear, quantity=5)
+        self.assertSummary(1, '5')
+
+    def test_upsert(self):
+        today = date.today()
+        self.assertTrue(BasketItem.objects.upsert(self.basket, self.apple, 2,
+                                                  today))
+        self.assertFalse(BasketItem.objects.upsert(self.basket, self.apple,
+                                                   3, today))
+        self.assertTrue(BasketItem.objects.upsert(self.basket, self.apple, 1))
+        self.assertEqual(self.basket.items.get(delivery_date=today).quantity,
+                         5)
+        self.assertEqual(self.basket.items.count(), 2)
+
+    def test_price_change_refreshes_open_baskets(self):
+        self.basket.add_to_items(product=self.apple, quantity=2)
+        self.apple.price = Decimal('3')
+        self.apple.save()
+        self.basket.refresh_from_db()
+        self.assertSummary(1, '6')
+
+    def test_mixed_currencies(self):
+        self.basket.add_to_items(product=self.apple, quantity=1)
+        self.pear.price = Money(4, EUR)
+        self.pear.save()
+        with self.assertRaises(MixedCurrencies):
+            self.basket.add_to_items(product=self.pear, quantity=1)
+
+        self.basket.items.create(product=self.pear, quantity=1)
+        self.assertEqual(self.basket.get_totals(),
+                         {'DKK': Decimal('2.50'), 'EUR': Decimal('4')})
+        with self.assertRaises(MixedCurrencies):
+            self.basket.refresh_summary()
+
+
+class TestMarketHomeCache(CommonSetUpPayments):
+
+    def setUp(self):
+        super(TestMarketHomeCache, self).setUp()
+        category = ProductCategory.objects.create(title='test_category')
+        tax = ProductTax.objects.create(title='test_tax', tax=Decimal(0))
+        self.product = Product.objects.create(
+            title='test_product',
+            description='test description',
+            category=category,
+            tax=tax,
+            price=Decimal('10'),
+        )
+
+    def test_catalog_version_bumped_on_change(self):
+        version = get_catalog_version()
+        self.product.save()
+        self.assertGreater(get_catalog_version(), version)
+        self.product.tax.save()
+        self.product.category.delete()
+        self.assertGreater(get_catalog_version(), version + 1)
+
+    def test_product_grid_served_from_cache(self):
+        url = reverse('eggplant:market:market_home')
+        response = self.client.get(url)
+        self.assertContains(response, 'test_product')
+        self.assertNotContains(response, 'eggplant-csrf-token')
+
+        # Updating the rows directly bypasses the signals, so a cached grid
+        # still shows the old title...
+        Product.objects.filter(id=self.product.id).update(title='renamed')
+        response = self.client.get(url)
+        self.assertContains(response, 'test_product')
+        self.assertNotContains(response, 'eggplant-csrf-token')
+
+        # ...until the catalog changes through the ORM.
+        self.product.refresh_from_db()
+        self.product.save()
+        response = self.client.get(url)
+        self.assertContains(response, 'renamed')
+
+
+class TestProductSearch(CommonSetUpPayments):
+
+    def setUp(self):
+        super(TestProductSearch, self).setUp()
+        category = ProductCategory.objects.create(title='test_category')
+        tax = ProductTax.objects.create(title='test_tax', tax=Decimal(0))
+        for title, description in (('Apple juice', 'Pressed from apples'),
+                                   ('Carrots', 'Great with apple cake'),
+                                   ('Potatoes', 'Organic and local')):
+            Product.objects.create(title=title, description=description,
+                                   category=category, tax=tax,
+                                   price=Decimal('10'))
+
+    def search(self, query):
+        return list(search_products(Product.objects.all(), query)
+                    .values_list('title', flat=True))
+
+    def test_search_ranks_title_first(self):
+        self.assertEqual(self.search('apple'), ['Apple juice', 'Carrots'])
+        self.assertEqual(self.search('organic local'), ['Potatoes'])
+        self.assertEqual(self.search('appl'), ['Apple juice', 'Carrots'])
+        self.assertEqual(self.search('banana'), [])
+        self.assertEqual(len(self.search('  "*')), 3)
+
+    def test_index_follows_changes(self):
+        product = Product.objects.get(title='Potatoes')
+        product.title = 'Beetroots'
+        product.save()
+        self.assertEqual(self.search('potatoes'), [])
+        self.assertEqual(self.search('beetroot'), ['Beetroots'])
+        product.delete()
+        self.assertEqual(self.search('beetroot'), [])
+
+    def test_market_home_search(self):
+        url = reverse('eggplant:market:market_home')
+        response = self.client.get(url, {'q': 'carrot'})
+        self.assertContains(response, 'Carrots')
+        self.assertNotContains(response, 'Potatoes')
+
+
+@override_settings(MARKET_PRODUCTS_PAGE_SIZE=3)
+class TestProductPagination(CommonSetUpPayments):
+
+    def setUp(self):
+        super(TestProductPagination, self).setUp()
+        tax = ProductTax.objects.create(title='test_tax', tax=Decimal(0))
+        self.categories = [ProductCategory.objects.create(title=title)
+                           for title in ('fruit', 'vegetables')]
+        for category in self.categories:
+            # Duplicate titles are told apart by their id.
+            for title in ('b', 'a', 'c', 'a'):
+                Product.objects.create(title=title, description='',
+                                       category=category, tax=tax,
+                                       price=Decimal('10'))
+
+    def test_seek(self):
+        seen = []
+        cursor = None
+        while True:
+            products, cursor = seek(Product.objects.all(), cursor)
+            self.assertLessEqual(len(products), 3)
+            seen.extend(products)
+            if cursor is None:
+                break
+        self.assertEqual(
+            [p.id for p in seen],
+            list(Product.objects.order_by('category', 'title', 'id')
+                 .values_list('id', flat=True)))
+
+    def test_product_pages(self):
+        home = reverse('eggplant:market:market_home')
+        response = self.client.get(
+            home, {'category': self.categories[1].id})
+        self.assertEqual(
+            [p.category for p in response.context['products']],
+            [self.categories[1]] * 3)
+        next_query = response.context['next_query']
+        self.assertTrue(next_query)
+
+        response = self.client.get(
+            reverse('eggplant:market:product_page') + '?' + next_query)
+        self.assertEqual(len(response.context['products']), 1)
+        self.assertIsNone(response.context['next_query'])
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertNotContains(response, 'data-product-more')
+
+        response = self.client.get(
+            reverse('eggplant:market:product_page'), {'after': 'bogus'})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestProductImport(CommonSetUpPayments):
+
+    CSV = (
+        'sku,title,description,category,price,currency,tax,stock,enabled\n'
+        'A1,Apples,Crisp,fruit,12.50,,moms,10,true\n'
+        'C1,Carrots,,vegetables,8,DKK,moms,,\n'
+        'X1,Bad price,,fruit,cheap,,moms,,\n'
+        'X2,Bad category,,meat,10,,moms,,\n'
+        ',No SKU,,fruit,10,,moms,,\n'
+    )
+
+    def setUp(self):
+        super(TestProductImport, self).setUp()
+        ProductCategory.objects.create(title='fruit')
+        ProductCategory.objects.create(title='vegetables')
+        ProductTax.objects.create(title='moms', tax=Decimal('0.25'))
+
+    def test_blank_sku(self):
+        # The admin form has the SKU; blank ones must not clash.
+        ProductForm = modelform_factory(Product, fields='__all__')
+        data = {'title': 'no sku', 'description': 'none', 'sku': '',
+                'category': ProductCategory.objects.get(title='fruit').pk,
+                'tax': ProductTax.objects.get().pk, 'price_0': '1.00',
+                'price_1': 'DKK', 'stock': '1', 'enabled': 'on'}
+        products = []
+        for i in range(2):
+            form = ProductForm(data)
+            self.assertTrue(form.is_valid(), form.errors)
+            products.append(form.save())
+        self.assertEqual([p.sku for p in products], [None, None])
+        form = ProductForm(data, instance=products[0])
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertIsNone(form.save().sku)
+
+    def run_import(self, data, fmt='csv'):
+        return ProductImporter(batch_size=2).run(
+            read_rows(StringIO(data), fmt))
+
+    def test_import(self):
+        importer = self.run_import(self.CSV)
+        self.assertEqual((importer.created, importer.updated,
+                          importer.unchanged, importer.error_count),
+                         (2, 0, 0, 3))
+        self.assertEqual([line for line, __ in importer.errors], [4, 5, 6])
+        apples = Product.objects.get(sku='A1')
+        self.assertEqual(apples.price, Money('12.50', 'DKK'))
+        self.assertEqual((apples.stock, apples.enabled), (10, True))
+        self.assertIsNone(Product.objects.get(sku='C1').stock)
+
+        basket = Basket.objects.create(user=UserFactory())
+        basket.add_to_items(apples, 2)
+        version = get_catalog_version()
+        importer = self.run_import(
+            '{"sku": "A1", "title": "Apples", "description": "Crisp", '
+            '"category": "fruit", "price": "15", "tax": "moms", '
+            '"stock": 10, "enabled": false}\n'
+            '{"sku": "C1", "title": "Carrots", "category": "vegetables", '
+            '"price": 8, "currency": "DKK", "tax": "moms"}\n'
+            'not json\n', fmt='jsonl')
+        self.assertEqual((importer.created, importer.updated,
+                          importer.unchanged, importer.error_count),
+                         (0, 1, 1, 1))
+        apples.refresh_from_db()
+        self.assertEqual(apples.price, Money('15', 'DKK'))
+        self.assertFalse(apples.enabled)
+        self.assertGreater(get_catalog_version(), version)
+        basket.refresh_from_db()
+        self.assertEqual(basket.total, Decimal('30'))
+
+    def test_invalid_currency_and_price(self):
+        self.run_import(self.CSV)
+        importer = self.run_import(
+            '{"sku": "A1", "title": "Apples", "category": "fruit", '
+            '"price": "15", "currency": "EURO", "tax": "moms"}\n'
+            '{"sku": "N1", "title": "Nuts", "category": "fruit", '
+            '"price": "15", "currency": "XYZ", "tax": "moms"}\n'
+            '{"sku": "N2", "title": "Nuts", "category": "fruit", '
+            '"price": "1e30", "tax": "moms"}\n'
+            '{"sku": "N3", "title": "Nuts", "category": "fruit", '
+            '"price": "9999999999.999", "tax": "moms"}\n'
+            '{"sku": "N4", "title": "Nuts", "category": "fruit", '
+            '"price": "9999999999.99", "currency": "eur", "tax": "moms"}\n',
+            fmt='jsonl')
+        self.assertEqual((importer.created, importer.updated,
+                          importer.error_count), (1, 0, 4))
+        self.assertEqual([line for line, __ in importer.errors], [1, 2, 3, 4])
+        self.assertEqual(Product.objects.get(sku='A1').price,
+                         Money('12.50', 'DKK'))
+        self.assertEqual(Product.objects.get(sku='N4').price,
+                         Money('9999999999.99', 'EUR'))
+
+    def test_export_round_trip(self):
+        self.run_import(self.CSV)
+        exported = ''.join(export_products('csv', chunk_size=1))
+        self.assertTrue(exported.startswith('sku,title,description,'))
+        importer = self.run_import(exported)
+        self.assertEqual((importer.created, importer.updated,
+                          importer.unchanged, importer.error_count),
+                         (0, 0, 2, 0))
+        importer = self.run_import(''.join(export_products('jsonl')), 'jsonl')
+        self.assertEqual(importer.unchanged, 2)
+
+    def test_purchaser_upload(self):
+        url = reverse('eggplant:market:import_products')
+        upload = StringIO(self.CSV)
+        upload.name = 'products.csv'
+        response = self.client.post(url, {'file': upload})
+        self.assertEqual(response.status_code, 403)
+
+        RoleAssignment.objects.create(user=self.test_user,
+                                      role=RoleAssignment.PURCHASER)
+        upload.seek(0)
+        response = self.client.post(url, {'file': upload})
+        self.assertRedirects(response, reverse(
+            'eggplant:roles:role', kwargs={'role': 'purchaser'}),
+            fetch_redirect_response=False)
+        self.assertEqual(Product.objects.count(), 2)
+
+        response = self.client.get(reverse(
+            'eggplant:market:export_products', kwargs={'fmt': 'jsonl'}))
+        self.assertEqual(
+            len(b''.join(response.streaming_content).splitlines()), 2)
+
+
+class TestProductGrid(CommonSetUpPayments):
+
+    def setUp(self):
+        super(TestProductGrid, self).setUp()
+        RoleAssignment.objects.create(user=self.test_user,
+                                      role=RoleAssignment.PURCHASER)
+        category = ProductCategory.objects.create(title='test_category')
+        tax = ProductTax.objects.create(title='test_tax', tax=Decimal(0))
+        self.products = [
+            Product.objects.create(title='product %d' % i, description='',
+                                   category=category, tax=tax,
+                                   price=Decimal('10'), stock=5)
+            for i in range(3)]
+
+    def post(self, changes):
+        return self.client.post(reverse('eggplant:market:update_products'),
+                                {'changes': json.dumps(changes)})
+
+    def test_update_products(self):
+        first, second, third = self.products
+        # Bought meanwhile, the purchaser still sees a stock of 5.
+        Product.objects.filter(pk=third.pk).update(stock=4)
+        changes = [
+            {'product': first.pk, 'field': 'stock', 'value': '50',
+             'original': '5'},
+            {'product': first.pk, 'field': 'price', 'value': '12.50',
+             'original': '10.00'},
+            {'product': second.pk, 'field': 'enabled', 'value': 'false',
+             'original': 'true'},
+            {'product': second.pk, 'field': 'stock', 'value': '',
+             'original': '5'},
+            {'product': third.pk, 'field': 'stock', 'value': '50',
+             'original': '5'},
+        ]
+        # Session, user and role; then one SELECT ... FOR UPDATE, one UPDATE
+        # and the lookup of the baskets to reprice, plus the savepoints of
+        # the transaction.
+        with self.assertNumQueries(10):
+            response = self.post(changes)
+        data = response.json()
+        self.assertEqual(data['updated'], 2)
+        self.assertEqual([(p['pk'], p['stock']) for p in data['conflicts']],
+                         [(third.pk, 4)])
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        third.refresh_from_db()
+        self.assertEqual((first.stock, first.price), (50, Money('12.50',
+                                                                'DKK')))
+        self.assertEqual((second.stock, second.enabled), (None, False))
+        self.assertEqual(third.stock, 4)
+
+    def test_dashboard_grid(self):
+        url = reverse('eggplant:roles:role', kwargs={'role': 'purchaser'})
+        RoleAssignment.objects.filter(user=self.test_user).delete()
+        self.assertEqual(self.client.get(url).status_code, 403)
+        RoleAssignment.objects.create(user=self.test_user,
+                                      role=RoleAssignment.PURCHASER)
+        response = self.client.get(url)
+        self.assertContains(response, 'data-product-grid')
+        self.assertContains(response, 'data-original="10.00"', count=3)
+
+    def test_invalid_changes(self):
+        response = self.post([{'product': self.products[0].pk,
+                               'field': 'stock', 'value': '-1',
+                               'original': '5'}])
+        self.assertEqual(response.status_code, 400)
+        response = self.post([{'product': self.products[0].pk,
+                               'field': 'title', 'value': 'hacked',
+                               'original': ''}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Product.objects.filter(stock=5).count(), 3)
+
+
+class TestCheckout(CommonSetUpPayments):
+
+    def setUp(self):
+        super(TestCheckout, self).setUp()
+        category = ProductCategory.objects.create(title='test_category')
+        self.tax = ProductTax.objects.create(title='moms',
+                                             tax=Decimal('0.25'))
+        self.products = [
+            Product.objects.create(title='product %d' % i, description='',
+                                   category=category, tax=self.tax,
+                                   price=Decimal(price), stock=10)
+            for i, price in enumerate(('10', '2.50'))]
+        self.basket = Basket.objects.open_for_user(self.test_user)
+        self.basket.add_to_items(self.products[0], 2, date(2016, 2, 1))
+        self.basket.add_to_items(self.products[1], 3, date(2016, 2, 8))
+
+    def test_checkout_snapshots_lines(self):
+        response = self.client.get(reverse('eggplant:market:checkout'))
+        self.assertContains(response, '34.38 DKK')
+        response = self.client.post(reverse('eggplant:market:checkout'))
+        payment = Payment.objects.get(user=self.test_user)
+        self.assertRedirects(response, reverse(
+            'eggplant:market:payment_detail', kwargs={'pk': payment.pk}),
+            fetch_redirect_response=False)
+        # 27.50 net plus 25% tax.
+        self.assertEqual(payment.amount, Money('34.38', 'DKK'))
+        self.assertFalse(StockReservation.objects.exists())
+        self.basket.refresh_from_db()
+        self.assertEqual(self.basket.status, Basket.CHECKEDOUT)
+
+        # Later changes of the catalog leave the lines alone.
+        self.products[0].price = Money('99', 'DKK')
+        self.products[0].save()
+        self.tax.tax = Decimal('0.5')
+        self.tax.save()
+        lines = payment.lines.order_by('pk')
+        self.assertEqual(
+            [(line.title, line.quantity, line.unit_price, line.tax_rate,
+              line.delivery_date) for line in lines],
+            [('product 0', 2, Money('10', 'DKK'), Decimal('0.25'),
+              date(2016, 2, 1)),
+             ('product 1', 3, Money('2.50', 'DKK'), Decimal('0.25'),
+              date(2016, 2, 8))])
+        with self.assertRaises(ValueError):
+            lines[0].save()
+
+        response = self.client.get(reverse(
+            'eggplant:market:payment_detail', kwargs={'pk': payment.pk}))
+        self.assertContains(response, 'product 1')
+
+    def test_checkout_once(self):
+        # Account, claim, items, pickup slots, payment, all lines in one
+        # INSERT, the demand and the reservations, plus savepoints.
+        with self.assertNumQueries(15):
+            payment = self.basket.do_checkout()
+        self.assertEqual(payment.lines.count(), 2)
+        self.assertIsNone(self.basket.do_checkout())
+        self.assertEqual(OrderLine.objects.count(), 2)
+
+
+class TestTax(CommonSetUpPayments):
+
+    def setUp(self):
+        super(TestTax, self).setUp()
+        category = ProductCategory.objects.create(title='test_category')
+        self.full = ProductTax.objects.create(title='moms',
+                                              tax=Decimal('0.25'))
+        self.free = ProductTax.objects.create(title='free', tax=Decimal(0))
+        self.products = [
+            Product.objects.create(title='product %d' % i, description='',
+                                   category=category, tax=tax,
+                                   price=Decimal(price))
+            for i, (tax, price) in enumerate((
+                (self.full, '0.10'), (self.full, '0.30'),
+                (self.free, '4.00')))]
+        self.basket = Basket.objects.open_for_user(self.test_user)
+        for product in self.products:
+            self.basket.add_to_items(product, 1)
+
+    def test_basket_taxes(self):
+        with self.assertNumQueries(1):
+            taxes = self.basket.get_taxes()
+        # The tax is rounded once per rate: 0.40 * 25% = 0.10, rather than
+        # 0.03 + 0.08 = 0.11 line by line.
+        self.assertEqual(taxes, [
+            TaxBucket(self.full.pk, Decimal('0.25'), 'DKK', Decimal('0.40'),
+                      Decimal('0.10'), Decimal('0.50')),
+            TaxBucket(self.free.pk, Decimal('0'), 'DKK', Decimal('4.00'),
+                      Decimal('0.00'), Decimal('4.00')),
+        ])
+        self.assertEqual(total(taxes).gross, Decimal('4.50'))
+
+    def test_order_taxes_match_basket(self):
+        taxes = self.basket.get_taxes()
+        payment = self.basket.do_checkout()
+        self.assertEqual(payment.get_taxes(), taxes)
+        self.assertEqual(payment.amount, Money('4.50', 'DKK'))
+
+    def test_rounding(self):
+        self.products[1].price = Money('0.33', 'DKK')
+        self.products[1].save()
+        # 0.43 * 25% = 0.1075
+        self.assertEqual(self.basket.get_taxes()[0].tax, Decimal('0.11'))
+        with self.settings(MARKET_TAX_ROUNDING='ROUND_DOWN'):
+            self.assertEqual(self.basket.get_taxes()[0].tax, Decimal('0.10'))
+
+    def test_period_taxes(self):
+        self.basket.do_checkout()
+        now = timezone.now()
+        with self.assertNumQueries(1):
+            rows = period_taxes(now - timedelta(days=40),
+                                now + timedelta(days=1))
+        self.assertEqual([bucket.gross for __, bucket in rows],
+                         [Decimal('0.50'), Decimal('4.00')])
+        self.assertEqual(rows[0][0].month, now.month)
+        self.assertEqual(period_taxes(now + timedelta(days=1),
+                                      now + timedelta(days=2)), [])
+
+        out = StringIO()
+        start = (now - timedelta(days=40)).date().isoformat()
+        end = (now + timedelta(days=1)).date().isoformat()
+        call_command('tax_summary', start, end, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].endswith('moms,0.2500,DKK,0.40,0.10,0.50'),
+                        lines[1])
+
+        for start in ('2016-13-01', 'yesterday'):
+            with self.assertRaisesRegex(CommandError, 'not a valid date'):
+                call_command('tax_summary', start, end)
+
+
+class TestPackingList(CommonSetUpPayments):
+
+    def setUp(self):
+        super(TestPackingList, self).setUp()
+        category = ProductCategory.objects.create(title='test_category')
+        tax = ProductTax.objects.create(title='test_tax', tax=Decimal(0))
+        self.apples, self.pears = [
+            Product.objects.create(title=title, category=category, tax=tax,
+                                   price=Decimal('1'))
+            for title in ('apples', 'pears')]
+        self.date = timezone.now().date() + timedelta(days=3)
+        self.later = self.date + timedelta(days=7)
+        account = AccountFactory()
+        for user, items in ((self.test_user, [(self.apples, 2),
+                                              (self.pears, 1)]),
+                            (UserFactory(first_name='Anna'),
+                             [(self.apples, 3)])):
+            basket = Basket.objects.create(user=user)
+            for product, quantity in items:
+                basket.add_to_items(product, quantity, self.date)
+            basket.add_to_items(self.pears, 5, self.later)
+            basket.do_checkout(account)
+        self.url_kwargs = {'date': self.date.isoformat()}
+
+    def test_packer_only(self):
+        url = reverse('eggplant:market:packing_list', kwargs=self.url_kwargs)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_packing_lists(self):
+        RoleAssignment.objects.create(user=self.test_user,
+                                      role=RoleAssignment.PACKER)
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                [row[2:] for row in packing.products_to_pack(self.date)],
+                [('apples', 5, 2), ('pears', 1, 1)])
+
+        response = self.client.get(reverse(
+            'eggplant:market:packing_list_csv',
+            kwargs=dict(self.url_kwargs, by='member')))
+        rows = list(csv.reader(
+            ''.join(c.decode() for c in response.streaming_content)
+            .splitlines()))
+        self.assertEqual(rows[0], list(packing.MEMBER_COLUMNS))
+        self.assertEqual([(row[0], row[5], row[6]) for row in rows[1:]], [
+            (str(self.test_user.pk), 'apples', '2'),
+            (str(self.test_user.pk), 'pears', '1'),
+            (str(self.test_user.pk + 1), 'apples', '3'),
+        ])
+
+        User.objects.filter(first_name='Anna').update(last_name='<b>')
+        response = self.client.get(reverse('eggplant:market:packing_list',
+                                           kwargs=self.url_kwargs))
+        html = ''.join(c.decode() for c in response.streaming_content)
+        self.assertEqual(html.count('class="member"'), 2)
+        self.assertIn('Anna &lt;b&gt;', html)
+
+        response = self.client.get(
+            reverse('eggplant:roles:role', kwargs={'role': 'packer'}),
+            {'date': self.later.isoformat()})
+        self.assertEqual(response.context['delivery_date'], self.later)
+        self.assertEqual([row[2:] for row in response.context['products']],
+                         [('pears', 10, 2)])
+
+    def test_without_delivery_date(self):
+        RoleAssignment.objects.create(user=self.test_user,
+                                      role=RoleAssignment.PACKER)
+        OrderLine.objects.all().delete()
+        basket = Basket.objects.create(user=self.test_user)
+        basket.add_to_items(self.apples, 2)
+        basket.do_checkout(AccountFactory())
+
+        response = self.client.get(
+            reverse('eggplant:roles:role', kwargs={'role': 'packer'}))
+        self.assertEqual(response.context['delivery_dates'], [None])
+        self.assertIsNone(response.context['delivery_date'])
+        self.assertEqual([row[2:] for row in response.context['products']],
+                         [('apples', 2, 1)])
+        self.assertNotContains(response, 'Nothing has been ordered')
+
+        kwargs = {'date': 'none'}
+        response = self.client.get(
+            reverse('eggplant:market:packing_list', kwargs=kwargs))
+        html = ''.join(c.decode() for c in response.streaming_content)
+        self.assertEqual(html.count('class="member"'), 1)
+        self.assertIn('apples', html)
+        for by, row in (('product', ['apples', '2', '1']),
+                        ('member', ['apples', '2'])):
+            response = self.client.get(reverse(
+                'eggplant:market:packing_list_csv', kwargs=dict(kwargs, by=by)))
+            rows = list(csv.reader(
+                ''.join(c.decode() for c in response.streaming_content)
+                .splitlines()))
+            self.assertEqual(len(rows), 2)
+            self.assertEqual(rows[1][-len(row):], row)
+
+
+class TestDemand(CommonSetUpPayments):
+
+    def setUp(self):
+        super(TestDemand, self).setUp()
+        category = ProductCategory.objects.create(title='test_category')
+        tax = ProductTax.objects.create(title='test_tax', tax=Decimal(0))
+        self.apples, self.pears = [
+            Product.objects.create(title=title, category=category, tax=tax,
+                                   price=Decimal('1'))
+            for title in ('apples', 'pears')]
+        self.date = timezone.now().date() + timedelta(days=3)
+        self.basket = Basket.objects.open_for_user(self.test_user)
+
+    def assertWanted(self, *rows):
+        self.assertEqual(
+            [row[2:] for row in ProductDemand.objects.wanted(self.date)],
+            list(rows))
+
+    def test_demand_follows_baskets(self):
+        self.basket.add_to_items(self.apples, 2, self.date)
+        self.basket.add_to_items(self.apples, 1, self.date)
+        self.basket.add_to_items(self.pears, 4, self.date)
+        self.basket.add_to_items(self.pears, 1)
+        self.basket.remove_from_items(self.pears, 1, self.date)
+        self.assertWanted(('apples', 3, 0), ('pears', 3, 0))
+
+        other = Basket.objects.create(user=UserFactory())
+        other.add_to_items(self.pears, 2, self.date)
+        self.basket.do_checkout()
+        self.assertWanted(('apples', 0, 3), ('pears', 2, 3))
+
+        Basket.objects.filter(pk=other.pk).update(
+            last_activity=timezone.now() - timedelta(hours=3))
+        Basket.objects.expire_idle(timedelta(hours=1))
+        self.assertWanted(('apples', 0, 3), ('pears', 0, 3))
+        self.assertEqual(ProductDemand.objects.upcoming(), [self.date, None])
+
+    def test_purchase_orders(self):
+        self.basket.add_to_items(self.apples, 2, self.date)
+        self.basket.add_to_items(self.pears, 1)
+        url = reverse('eggplant:market:purchase_orders')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        RoleAssignment.objects.create(user=self.test_user,
+                                      role=RoleAssignment.PURCHASER)
+        response = self.client.get(url)
+        self.assertEqual(response.context['delivery_date'], self.date)
+        self.assertContains(response, 'apples')
+        self.assertNotContains(response, 'pears')
+
+        response = self.client.get(
+            reverse('eggplant:market:purchase_orders_csv'), {'date': 'none'})
+        rows = list(csv.reader(
+            ''.join(c.decode() for c in response.streaming_content)
+            .splitlines()))
+        self.assertEqual(rows[1][2:], ['pears', '1', '0', '1'])
+
+    def test_undated_demand_is_unique(self):
+        ProductDemand.objects.apply({(self.pears.pk, None): (1, 0)})
+        # As a concurrent request that did not see the row yet would.
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ProductDemand.objects.create(product=self.pears, reserved=1)
+        ProductDemand.objects.apply({(self.pears.pk, None): (2, 0)})
+        demand = ProductDemand.objects.get(product=self.pears)
+        self.assertEqual((demand.reserved, demand.ordered), (3, 0))
+
+
+@override_settings(GETPAID_BACKENDS_SETTINGS={
+    'getpaid.backends.epaydk': {'merchantnumber': '1', 'secret': 'secret'},
+})
+class TestPaymentCallbacks(CommonSetUpPayments):
+
+    def setUp(self):
+        super(TestPaymentCallbacks, self).setUp()
+        payment = Payment.objects.create(
+            amount=Money(Decimal('10'), 'DKK'), user=self.test_user,
+            account=self.test_user.profile.accounts.get())
+        self.transaction = GetPaidPayment.create(payment,
+                                                 'getpaid.backends.epaydk')
+        self.url = '/en/getpaid/epaydk/online/'
+
+    def callback(self, **changes):
+        params = OrderedDict((
+            ('txnid', '1234'),
+            ('orderid', str(self.transaction.pk)),
+            ('amount', '1000'),
+            ('currency', '208'),
+            ('date', '20161008'),
+            ('time', '1223'),
+            ('txnfee', '0'),
+            ('paymenttype', '1'),
+        ))
+        params.update(changes)
+        params['hash'] = PaymentProcessor.compute_hash(params)
+        return self.client.get(self.url, params)
+
+    def test_queued_once(self):
+        self.transaction.change_status('accepted_for_proc')
+        for i in range(2):
+            response = self.callback()
+            self.assertEqual(response.content, b'OK')
+        self.assertEqual(self.transaction.callbacks.count(), 1)
+        self.transaction.refresh_from_db()
+        self.assertEqual(self.transaction.status, 'accepted_for_proc')
+
+        self.assertEqual(PaymentCallback.objects.process_pending(), 1)
+        self.assertEqual(PaymentCallback.objects.process_pending(), 0)
+        self.transaction.refresh_from_db()
+        self.assertEqual(self.transaction.status, 'paid')
+        self.assertEqual(self.transaction.external_id, '1234')
+        self.assertEqual(PaymentEvent.objects.filter(
+            event='status_changed', data__contains='"paid"').count(), 1)
+
+    def test_invalid(self):
+        response = self.client.get(self.url, {
+            'txnid': '1234', 'orderid': str(self.transaction.pk),
+            'amount': '1000', 'currency': '208', 'date': '20161008',
+            'time': '1223', 'txnfee': '0', 'paymenttype': '1',
+            'hash': 'forged'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.callback(orderid='0').status_code, 400)
+        self.assertFalse(PaymentCallback.objects.exists())
+
+    def test_retried(self):
+        # ePay may call back before the member is back from its page.
+        self.callback()
+        call_command('process_payment_callbacks', stdout=StringIO())
+        callback = self.transaction.callbacks.get()
+        self.assertEqual((callback.processed, callback.attempts),
+                         (None, 1))
+        self.assertIn('AssertionError', callback.error)
+
+        self.transaction.change_status('accepted_for_proc')
+        call_command('process_payment_callbacks', stdout=StringIO())
+        callback.refresh_from_db()
+        self.assertIsNotNone(callback.processed)
+        self.assertEqual(callback.attempts, 2)
+
+    @override_settings(MARKET_CALLBACK_MAX_ATTEMPTS=2)
+    def test_given_up(self):
+        # Never accepted for processing, so confirming keeps failing.
+        self.callback()
+        for i in range(3):
+            PaymentCallback.objects.process_pending()
+        callback = self.transaction.callbacks.get()
+        self.assertEqual((callback.processed, callback.attempts), (None, 2))
+        self.assertFalse(PaymentCallback.objects.pending().exists())
+        self.assertEqual(list(PaymentCallback.objects.failed()), [callback])
+        err = StringIO()
+        call_command('process_payment_callbacks', stdout=StringIO(),
+                     stderr=err)
+        self.assertIn('1 callback(s) failed', err.getvalue())
+
+    def test_already_applied(self):
+        self.transaction.change_status('paid')
+        self.callback()
+        events = PaymentEvent.objects.count()
+        self.assertEqual(PaymentCallback.objects.process_pending(), 1)
+        self.assertIsNotNone(self.transaction.callbacks.get().processed)
+        self.assertEqual(PaymentEvent.objects.count(), events)
+
+
+class TestPaymentSimulator(CommonSetUpPayments):
+
+    def setUp(self):
+        super(TestPaymentSimulator, self).setUp()
+        self.payment = Payment.objects.create(
+            amount=Money(Decimal('12.50'), 'DKK'), user=self.test_user,
+            account=self.test_user.profile.accounts.get())
+
+    def pay(self):
+        return self.client.post(
+            reverse('getpaid:new-payment', kwargs={'currency': 'DKK'}),
+            {'order': self.payment.pk, 'backend': 'eggplant.market.simulator'},
+            follow=True)
+
+    def test_paid(self):
+        response = self.pay()
+        self.assertEqual(response.redirect_chain[-1][0],
+                         reverse('eggplant:market:payment_list'))
+        transaction = self.payment.payments.get()
+        self.assertEqual(transaction.status, 'accepted_for_proc')
+        self.assertEqual(PaymentCallback.objects.process_pending(), 1)
+        transaction.refresh_from_db()
+        self.assertEqual((transaction.status, transaction.amount_paid),
+                         ('paid', Decimal('12.50')))
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.last_status, 'paid')
+
+    @override_settings(GETPAID_BACKENDS_SETTINGS={
+        'eggplant.market.simulator': {'failure_rate': 1},
+    })
+    def test_failed(self):
+        self.pay()
+        self.assertEqual(self.payment.payments.get().status, 'cancelled')
+        self.assertFalse(PaymentCallback.objects.exists())
+
+
+class TestLedger(CommonSetUpPayments):
+
+    def setUp(self):
+        super(TestLedger, self).setUp()
+        self.department = DepartmentFactory()
+        account = AccountFactory(department=self.department, name='ledger')
+        other = AccountFactory(department=DepartmentFactory())
+        self.paid, self.unpaid, self.elsewhere, self.old = [
+            Payment.objects.create(amount=Money(Decimal(amount), 'DKK'),
+                                   account=account, user=self.test_user)
+            for amount in ('10.50', '3', '7', '1')]
+        Payment.objects.filter(pk=self.elsewhere.pk).update(account=other)
+        Payment.objects.filter(pk=self.old.pk).update(
+            created=timezone.now() - timedelta(days=400))
+        for status in ('failed', 'paid'):
+            GetPaidPayment.objects.create(
+                order=self.paid, amount=Decimal('10.50'), currency='DKK',
+                backend='getpaid.backends.epaydk', status=status)
+        self.today = timezone.now().date()
+        self.period = ledger.date_range(self.today - timedelta(days=30),
+                                        self.today)
+
+    def read(self, fmt, **kwargs):
+        return ''.join(ledger.export_ledger(fmt, *self.period, **kwargs))
+
+    def test_csv(self):
+        rows = list(csv.DictReader(
+            StringIO(self.read('csv', department=self.department))))
+        self.assertEqual(
+            [(row['payment'], row['amount'], row['status']) for row in rows],
+            [(str(self.paid.pk), '10.50', 'failed'),
+             (str(self.paid.pk), '10.50', 'paid'),
+             (str(self.unpaid.pk), '3.00', '')])
+        self.assertEqual(rows[0]['account'], 'ledger')
+        self.assertEqual(rows[0]['member'], self.test_user.username)
+
+    def test_jsonl(self):
+        payments = [json.loads(line)
+                    for line in self.read('jsonl').splitlines()]
+        self.assertEqual([p['payment'] for p in payments],
+                         [self.paid.pk, self.unpaid.pk, self.elsewhere.pk])
+        self.assertEqual([t['status'] for t in payments[0]['transactions']],
+                         ['failed', 'paid'])
+        self.assertEqual(payments[1]['transactions'], [])
+
+    def test_chunks(self):
+        # Two queries per chunk of payments, one more to find the end.
+        with self.assertNumQueries(7):
+            chunks = list(ledger.export_ledger('jsonl', *self.period,
+                                               chunk_size=1))
+        self.assertEqual(len(chunks), 3)
+
+    def test_accountant_only(self):
+        url = reverse('eggplant:market:ledger', kwargs={'fmt': 'csv'})
+        params = {'start': self.today.isoformat(),
+                  'end': self.today.isoformat()}
+        self.assertEqual(self.client.get(url, params).status_code, 403)
+        RoleAssignment.objects.create(user=self.test_user,
+                                      role=RoleAssignment.ACCOUNTANT)
+        response = self.client.get(
+            reverse('eggplant:roles:role', kwargs={'role': 'accountant'}))
+        self.assertContains(response, 'name="department"')
+        response = self.client.get(url, params)
+        rows = list(csv.reader(
+            ''.join(c.decode() for c in response.streaming_content)
+            .splitlines()))
+        self.assertEqual(rows[0], list(ledger.COLUMNS))
+        self.assertEqual(len(rows), 5)
+        response = self.client.get(url, {'start': params['end'],
+                                         'end': '2000-01-01'})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestReconciliation(CommonSetUpPayments):
+
+    def setUp(self):
+        super(TestReconciliation, self).setUp()
+        payment = Payment.objects.create(
+            amount=Money(Decimal('10.50'), 'DKK'),
+            account=self.test_user.profile.accounts.first(),
+            user=self.test_user)
+        self.matched, self.cheap, self.twice, self.unsettled, self.failed = [
+            GetPaidPayment.objects.create(
+                order=payment, amount=Decimal('10.50'), currency='DKK',
+                backend='getpaid.backends.epaydk', status=status,
+                amount_paid=Decimal('10.50'), paid_on=timezone.now())
+            for status in ('paid',) * 4 + ('failed',)]
+        self.today = timezone.now().date()
+        self.settlement = [
+            'transaction,amount,currency,external_id',
+            '{},10.50,dkk,1'.format(self.matched.pk),
+            '{},10.00,DKK,2'.format(self.cheap.pk),
+            '{},10.50,,3'.format(self.twice.pk),
+            '{},10.50,DKK,4'.format(self.failed.pk),
+            '{},10.50,DKK,3'.format(self.twice.pk),
+            '999999,10.50,DKK,5',
+            'x,10.50,DKK,6',
+        ]
+
+    def reconcile(self, **kwargs):
+        rows = read_rows(self.settlement, 'csv')
+        return Reconciler(source='settlement.csv', batch_size=2)\
+            .run(rows, **kwargs)
+
+    def test_reconcile(self):
+        reconciler = self.reconcile(
+            **dict(zip(('start', 'end'),
+                       ledger.date_range(self.today, self.today))))
+        self.assertEqual(
+            (reconciler.matched, reconciler.mismatched, reconciler.duplicate,
+             reconciler.missing, reconciler.unknown, reconciler.invalid),
+            (2, 2, 1, 1, 1, 1))
+        self.assertEqual(
+            dict(Reconciliation.objects.values_list('transaction', 'status')),
+            {self.matched.pk: Reconciliation.MATCHED,
+             self.cheap.pk: Reconciliation.MISMATCHED,
+             self.twice.pk: Reconciliation.DUPLICATE,
+             self.failed.pk: Reconciliation.MISMATCHED,
+             self.unsettled.pk: Reconciliation.MISSING})
+        reconciliation = Reconciliation.objects.get(transaction=self.cheap)
+        self.assertEqual(reconciliation.settled_amount, Decimal('10.00'))
+        self.assertEqual(reconciliation.external_id, '2')
+        self.assertEqual(reconciliation.source, 'settlement.csv')
+        self.assertEqual([line for line, __ in reconciler.problems],
+                         [3, 5, 6, 7, 8, None])
+
+    def test_reconcile_again(self):
+        self.reconcile()
+        self.settlement[2] = '{},10.50,DKK,2'.format(self.cheap.pk)
+        reconciler = self.reconcile()
+        self.assertEqual(reconciler.missing, 0)
+        self.assertEqual(Reconciliation.objects.count(), 4)
+        self.assertEqual(
+            Reconciliation.objects.get(transaction=self.cheap).status,
+            Reconciliation.MATCHED)
+
+    def test_command(self):
+        path = os.path.join(tempfile.mkdtemp(), 'settlement.csv')
+        with open(path, 'w') as stream:
+            stream.write('\n'.join(self.settlement))
+        out, err = StringIO(), StringIO()
+        call_command('reconcile_payments', path, start=self.today,
+                     end=self.today,
+                     stdout=out, stderr=err)
+        self.assertIn('2 matched, 2 mismatched, 1 duplicate and 1 missing',
+                      out.getvalue())
+        self.assertIn('Line 7: Unknown transaction 999999.', err.getvalue())
+
+        with self.assertRaisesRegex(CommandError, 'not a valid date'):
+            call_command('reconcile_payments', path, '--start=2016-02-30',
+                         '--end=2016-03-01')
+
+
+class TestStockReservation(TestCase):
+
+    def setUp(self):
+        category = ProductCategory.objects.create(title='test_category')
+        tax = ProductTax.objects.create(title='test_tax', tax=Decimal(0))
+        self.product = Product.objects.create(
+            title='test_product', category=category, tax=tax, stock=5)
+        self.basket = Basket.objects.create(user=UserFactory())
+
+    def test_reserve_and_release(self):
+        StockReservation.objects.reserve(self.basket, self.product, 2)
+        StockReservation.objects.reserve(self.basket, self.product, 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 2)
+        reservation = self.basket.reservations.get(product=self.product)
+        self.assertEqual(reservation.quantity, 3)
+
+        # Never release more than what was reserved.
+        released = StockReservation.objects.release(self.basket,
+                                                    self.product, 10)
+        self.assertEqual(released, 3)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+        self.assertFalse(self.basket.reservations.exists())
+
+    def test_undated_reservation_is_unique(self):
+        StockReservation.objects.reserve(self.basket, self.product, 1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            StockReservation.objects.create(basket=self.basket,
+                                            product=self.product, quantity=1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            BasketItem.objects.bulk_create([
+                BasketItem(basket=self.basket, product=self.product,
+                           quantity=1) for i in range(2)])
+
+    def test_insufficient_stock(self):
+        with self.assertRaises(InsufficientStock) as cm:
+            StockReservation.objects.reserve(self.basket, self.product, 6)
+        self.assertEqual(cm.exception.available, 5)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+        self.assertFalse(self.basket.reservations.exists())
+
+    def test_closed_basket(self):
+        # As if an expiry sweep claimed the basket just before.
+        Basket.objects.filter(pk=self.basket.pk).update(status=Basket.EXPIRED)
+        with self.assertRaises(BasketClosed):
+            StockReservation.objects.reserve(self.basket, self.product, 2)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+        self.assertFalse(self.basket.reservations.exists())
+
+    def test_endless_stock_is_not_reserved(self):
+        Product.objects.filter(pk=self.product.pk).update(stock=None)
+        StockReservation.objects.reserve(self.basket, self.product, 100)
+        self.assertFalse(self.basket.reservations.exists())
+
+    def test_expire_idle_baskets(self):
+        StockReservation.objects.reserve(self.basket, self.product, 2)
+        self.basket.add_to_items(product=self.product, quantity=2)
+        active = Basket.objects.create(user=UserFactory())
+        StockReservation.objects.reserve(active, self.product, 1)
+        Basket.objects.filter(pk=self.basket.pk).update(
+            last_activity=timezone.now() - timedelta(hours=3))
+
+        out = StringIO()
+        call_command('expire_baskets', ttl=60, stdout=out)
+        self.assertIn('Expired 1 basket(s).', out.getvalue())
+
+        self.basket.refresh_from_db()
+        self.assertEqual(self.basket.status, Basket.EXPIRED)
+        self.assertFalse(self.basket.reservations.exists())
+        self.assertEqual(Basket.objects.get(pk=active.pk).status, Basket.OPEN)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 4)
+
+        # Nothing left to do for a second sweeper.
+        self.assertEqual(Basket.objects.expire_idle(timedelta(hours=1)), 0)
+
+
+class TestDelivery(CommonSetUpPayments):
+
+    def setUp(self):
+        super(TestDelivery, self).setUp()
+        category = ProductCategory.objects.create(title='test_category')
+        tax = ProductTax.objects.create(title='test_tax', tax=Decimal(0))
+        self.product = Product.objects.create(
+            title='test_product', category=category, tax=tax,
+            price=Decimal('2.50'), stock=5)
+        self.date = timezone.now().date() + timedelta(days=7)
+        self.supply = ProductSupply.objects.create(
+            product=self.product, delivery_date=self.date, quantity=3)
+        self.basket = Basket.objects.open_for_user(self.test_user)
+
+    def add(self, quantity, delivery_date):
+        StockReservation.objects.reserve(self.basket, self.product, quantity,
+                                         delivery_date)
+        self.basket.add_to_items(self.product, quantity, delivery_date)
+
+    def assertLeft(self, supply, stock):
+        self.supply.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual((self.supply.quantity, self.product.stock),
+                         (supply, stock))
+
+    def test_reserve_per_date(self):
+        self.add(2, self.date)
+        self.assertLeft(1, 5)
+        with self.assertRaises(InsufficientStock) as cm:
+            self.add(2, self.date)
+        self.assertEqual(cm.exception.available, 1)
+        # Dates without a supply take from the stock.
+        self.add(1, self.date + timedelta(days=7))
+        self.assertLeft(1, 4)
+
+        released = StockReservation.objects.release(
+            self.basket, self.product, 5, self.date)
+        self.assertEqual(released, 2)
+        self.assertLeft(3, 4)
+        StockReservation.objects.release(
+            self.basket, self.product, 1, self.date + timedelta(days=7))
+        self.assertLeft(3, 5)
+
+    def test_supply_update_single_table(self):
+        # A subquery would leave the quantity unchecked against concurrent
+        # updates on PostgreSQL.
+        with CaptureQueriesContext(connection) as queries:
+            self.add(1, self.date)
+        updates = [q['sql'] for q in queries
+                   if q['sql'].startswith('UPDATE "market_productsupply"')]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('SELECT', updates[0])
+        self.assertIn('"quantity" >=', updates[0])
+        Product.objects.filter(pk=self.product.pk).update(enabled=False)
+        with self.assertRaises(InsufficientStock) as cm:
+            self.add(1, self.date)
+        self.assertEqual(cm.exception.available, 0)
+        self.assertLeft(2, 5)
+
+    def test_expire_gives_back_supply(self):
+        self.add(2, self.date)
+        self.add(1, None)
+        self.assertLeft(1, 4)
+        Basket.objects.filter(pk=self.basket.pk).update(
+            last_activity=timezone.now() - timedelta(hours=3))
+        self.assertEqual(Basket.objects.expire_idle(timedelta(hours=1)), 1)
+        self.assertLeft(3, 5)
+
+    def test_pickup_slot_capacity(self):
+        PickupSlot.objects.create(date=self.date, capacity=1)
+        self.add(1, self.date)
+        self.basket.do_checkout()
+
+        other = Basket.objects.create(user=self.test_user)
+        StockReservation.objects.reserve(other, self.product, 1, self.date)
+        other.add_to_items(self.product, 1, self.date)
+        with self.assertRaises(SlotFull):
+            other.do_checkout()
+        other.refresh_from_db()
+        self.assertEqual(other.status, Basket.OPEN)
+        self.assertEqual(Payment.objects.count(), 1)
+        self.assertEqual(PickupSlot.objects.get().remaining, 0)
+
+        response = self.client.post(reverse('eggplant:market:checkout'))
+        self.assertRedirects(response,
+                             reverse('eggplant:market:cart_details'))
+
+    def test_availability(self):
+        PickupSlot.objects.create(date=self.date, capacity=10)
+        self.add(1, self.date)
+        response = self.client.get(
+            reverse('eggplant:market:product_availability'),
+            {'product': [self.product.pk, 'x']})
+        self.assertEqual(response.json(), {'products': {
+            str(self.product.pk): [{'date': self.date.isoformat(),
+                                    'quantity': 2}],
+        }})
+        response = self.client.get(reverse('eggplant:market:market_home'))
+        self.assertContains(response, '10 places left')
+
+
+class TestConcurrentStockReservation(TransactionTestCase):
+    buyers = 20
+    stock = 7
+
+    def setUp(self):
+        category = ProductCategory.objects.create(title='test_category')
+        tax = ProductTax.objects.create(title='test_tax', tax=Decimal(0))
+        self.product = Product.objects.create(
+            title='test_product', category=category, tax=tax,
+            stock=self.stock)
+        self.baskets = [Basket.objects.create(user=UserFactory())
+                        for __ in range(self.buyers)]
+
+    def reserve(self, basket):
+        StockReservation.objects.reserve(basket, self.product, 1)
+
+    def buy(self, basket, results, barrier):
+        barrier.wait()
+        try:
+            while True:
+                try:
+                    self.reserve(basket)
+                    results.append(True)
+                    break
+                except InsufficientStock:
+                    results.append(False)
+                    break
+                except OperationalError:
+                    # SQLite refuses concurrent writers rather than waiting.
+                    continue
+        finally:
+            connection.close()
+
+    def test_concurrent_buyers_never_oversell(self):
+        results = []
+        barrier = threading.Barrier(self.buyers)
+        threads = [threading.Thread(target=self.buy,
+                                    args=(basket, results, barrier))
+                   for basket in self.baskets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), self.buyers)
+        self.assertEqual(results.count(True), self.stock)
+        self.assertEqual(self.get_left(), 0)
+        self.assertEqual(StockReservation.objects.count(), self.stock)
+
+    def get_left(self):
+        self.product.refresh_from_db()
+        return self.product.stock
+
+
+class TestConcurrentSupplyReservation(TestConcurrentStockReservation):
+
+    def setUp(self):
+        super(TestConcurrentSupplyReservation, self).setUp()
+        self.supply = ProductSupply.objects.create(
+            product=self.product, delivery_date=date(2016, 2, 1),
+            quantity=self.stock)
+        Product.objects.filter(pk=self.product.pk).update(stock=0)
+
+    def reserve(self, basket):
+        StockReservation.objects.reserve(basket, self.product, 1,
+                                         self.supply.delivery_date)
+
+    def get_left(self):
+        self.supply.refresh_from_db()
+        return self.supply.quantity
+
+
+class TestAuditLogThread(TransactionTestCase):
+
+    def test_batches(self):
+        audit_log = AuditLog(queue_size=1000, batch_size=10, interval=0.05,
+                             background=True)
+        for i in range(25):
+            self.assertTrue(audit_log.record('test', payment_id=i))
+        audit_log.flush()
+        self.assertEqual(
+            list(PaymentEvent.objects.values_list('payment_id', flat=True)
+                 .order_by('pk')), list(range(25)))
+        audit_log.shutdown()
+        self.assertFalse(audit_log._thread.is_alive())
+
+    def test_bounded_queue(self):
+        audit_log = AuditLog(queue_size=5, batch_size=2, interval=0.05,
+                             background=True)
+        recorded = sum(audit_log.record('test', payment_id=i)
+                       for i in range(200))
+        audit_log.shutdown()
+        self.assertEqual(recorded + audit_log.dropped, 200)
+        self.assertEqual(PaymentEvent.objects.count(), recorded)
+
+
+class TestCartActionTag(TestCase):
+    template = Template(
+        "{% load cart_tags %}"
+        "{% cart_action 'add' product_id=3 quantity=2 delivery_date=date %}")
+
+    def render(self):
+        return self.template.render(Context({
+            'csrf_token': 'token<', 'date': date(2016, 2, 1)}))
+
+    def test_form(self):
+        html = self.render()
+        self.assertInHTML(
+            '<input name="delivery_date" type="hidden" value="2016-02-01"/>',
+            html)
+        self.assertInHTML('<input name="product" type="hidden" value="3"/>',
+                          html)
+        self.assertInHTML('<input name="quantity" type="hidden" value="2"/>',
+                          html)
+        self.assertInHTML('<input name="csrfmiddlewaretoken" type="hidden" '
+                          'value="token&lt;"/>', html)
+        self.assertIn('action="{}"'.format(
+            reverse('eggplant:market:add_to_cart')), html)
+        self.assertIn('data-json-action="{}"'.format(
+            reverse('eggplant:market:add_to_cart_json')), html)
+
+    def test_urls_follow_language_and_script_prefix(self):
+        for language in ('en', 'da', 'en'):
+            with translation.override(language):
+                self.assertIn('action="/{}/market/'.format(language),
+                              self.render())
+        self.addCleanup(set_script_prefix, get_script_prefix())
+        for prefix in ('/shop/', '/'):
+            set_script_prefix(prefix)
+            with translation.override('da'):
+                self.assertIn('action="{}da/market/'.format(prefix),
+                              self.render())
+
+
+class TestCartJson(CommonSetUpPayments):
+
+    def setUp(self):
+        super(TestCartJson, self).setUp()
+        category = ProductCategory.objects.create(title='test_category')
+        tax = ProductTax.objects.create(title='test_tax', tax=Decimal(0))
+        self.product = Product.objects.create(
+            title='test_product', category=category, tax=tax,
+            price=Decimal('2.50'), stock=3)
+
+    def post(self, name, quantity):
+        return self.client.post(reverse(name), {
+            'product': self.product.pk,
+            'quantity': quantity,
+            'delivery_date': '',
+        })
+
+    def test_add_and_remove(self):
+        response = self.post('eggplant:market:add_to_cart_json', 2)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['line']['quantity'], 2)
+        self.assertEqual(data['basket'], {'item_count': 1, 'total': '5.00',
+                                          'currency': 'DKK'})
+        self.assertEqual(data['stock'], 1)
+
+        response = self.post('eggplant:market:add_to_cart_json', 2)
+        self.assertEqual(response.status_code, 409)
+        data = response.json()
+        self.assertIn('error', data)
+        self.assertEqual(data['line']['quantity'], 2)
+
+        response = self.post('eggplant:market:remove_from_cart_json', 2)
+        data = response.json()
+        self.assertEqual(data['line']['quantity'], 0)
+        self.assertEqual(data['basket']['item_count'], 0)
+        self.assertEqual(data['stock'], 3)
+
+    def test_mixed_currencies(self):
+        self.post('eggplant:market:add_to_cart_json', 1)
+        euros = Product.objects.create(
+            title='euros', category=self.product.category,
+            tax=self.product.tax, price=Money('1.00', EUR), stock=5)
+        response = self.client.post(
+            reverse('eggplant:market:add_to_cart_json'),
+            {'product': euros.pk, 'quantity': 2, 'delivery_date': ''})
+        self.assertEqual(response.status_code, 409)
+        data = response.json()
+        self.assertIn('currency', data['error'])
+        self.assertEqual(data['line']['quantity'], 0)
+        self.assertEqual(data['stock'], 5)
+        self.assertFalse(StockReservation.objects.filter(product=euros)
+                         .exists())
+
+    def test_empty_basket_can_be_filled_in_place(self):
+        # cart.js adds the first line from the template, without a reload.
+        for name in ('eggplant:market:market_home',
+                     'eggplant:market:cart_details'):
+            response = self.client.get(reverse(name))
+            self.assertContains(response, 'data-basket-if-items hidden')
+            self.assertContains(response, 'data-basket-lines')
+            self.assertContains(response, 'data-basket-line-template')
+
+    def test_plain_post_still_redirects(self):
+        response = self.post('eggplant:market:add_to_cart', 1)
+        self.assertRedirects(response,
+                             reverse('eggplant:market:market_home'))
@@ -0,0 +1,33 @@
+"""
+Uniqueness of the rows without a delivery date.
+
+Basket lines, stock reservations and product demand are unique per product
+and delivery date, but NULLs never conflict in SQL: the unique constraints
+alone let two concurrent requests insert the same undated row. A partial
+unique index on the rows without a date makes the second insert fail, so
+the IntegrityError fallbacks of the managers cover undated rows as well.
+
+SQLite drops these indexes whenever a migration rebuilds a table, so they
+are installed again after every migrate, like the search indexes.
+"""
+
+# Table and columns unique among the rows without a delivery date.
+UNDATED_UNIQUE = (
+    ('market_basketitem', ('basket_id', 'product_id')),
+    ('market_stockreservation', ('basket_id', 'product_id')),
+    ('market_productdemand', ('product_id',)),
+)
+
+
+def install_undated_indexes(connection):
+    """Create the partial unique indexes, if missing."""
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for table, columns in UNDATED_UNIQUE:
+            cursor.execute(
+                'CREATE UNIQUE INDEX IF NOT EXISTS {index} ON {table} '
+                '({columns}) WHERE delivery_date IS NULL'.format(
+                    index=qn(table + '_undated_uniq'), table=qn(table),
+                    columns=', '.join(qn(column) for column in columns)))
@@ -1,7 +1,7 @@
 
 from django.conf.urls import include, url
 
-from .views import cart, inventory, payment
+from .views import cart, inventory, packing, payment
 
 payment_patterns = [
     url(r'payment-list/$', payment.payment_list, name="payment_list"),
@@ -21,14 +21,37 @@ payment_patterns = [
     url(r'payment-rejected/(?P<pk>\d+)/$',
         payment.payment_rejected,
         name="payment_rejected"),
+
+    url(r'ledger\.(?P<fmt>\w+)$', payment.ledger, name="ledger"),
 ]
 
 urlpatterns = [
     url(r'payment/', include(payment_patterns)),
     url(r'add-to-cart/$', cart.add_to_cart, name="add_to_cart"),
+    url(r'add-to-cart\.json$', cart.add_to_cart_json,
+        name="add_to_cart_json"),
     url(r'remove-from-cart/$', cart.remove_from_cart, name="remove_from_cart"),
+    url(r'remove-from-cart\.json$', cart.remove_from_cart_json,
+        name="remove_from_cart_json"),
     url(r'your-cart/$', cart.cart_details, name="cart_details"),
     url(r'checkout/$', cart.checkout, name="checkout"),
     url(r'market/add-product/$', inventory.add_product, name="add_product"),
+    url(r'products/$', inventory.product_page, name="product_page"),
+    url(r'products/availability\.json$', inventory.product_availability,
+        name="product_availability"),
+    url(r'products/import/$', inventory.import_products,
+        name="import_products"),
+    url(r'products/update\.json$', inventory.update_products,
+        name="update_products"),
+    url(r'products/export\.(?P<fmt>\w+)$', inventory.export_products_file,
+        name="export_products"),
+    url(r'purchase-orders/$', inventory.purchase_orders,
+        name="purchase_orders"),
+    url(r'purchase-orders\.csv$', inventory.purchase_orders_csv,
+        name="purchase_orders_csv"),
+    url(r'packing/(?P<date>\d{4}-\d{2}-\d{2}|none)/$', packing.packing_list,
+        name="packing_list"),
+    url(r'packing/(?P<date>\d{4}-\d{2}-\d{2}|none)/by-(?P<by>product|member)'
+        r'\.csv$', packing.packing_list_csv, name="packing_list_csv"),
     url(r'$', inventory.market_home, name="market_home"),
 ]
@@ -0,0 +1,24 @@
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET
+from getpaid.backends import epaydk
+
+from ..callbacks import queue_callback
+
+
+def acknowledge(request, processor, secret_path=''):
+    """
+    Queue a callback of the gateway of ``processor`` and acknowledge it,
+    see market.callbacks.
+    """
+    if not queue_callback(processor, request.META['QUERY_STRING'],
+                          secret_path):
+        return HttpResponseBadRequest('400 Bad Request')
+    return HttpResponse('OK')
+
+
+@csrf_exempt
+@require_GET
+def epaydk_callback(request, secret_path=''):
+    """Takes the place of getpaid's ePay callback."""
+    return acknowledge(request, epaydk.PaymentProcessor, secret_path)
@@ -10,8 +10,12 @@ from django.utils.translation import ugettext as _
 from django.views.generic.edit import FormView
 
 from ..forms import BasketItemForm
-from ..models.cart import Basket
+from ..models.cart import (Basket, BasketClosed, MixedCurrencies,
+                           NoPaymentAccount)
+from ..models.delivery import ProductSupply, SlotFull
 from ..models.inventory import Product
+from ..models.reservation import InsufficientStock, StockReservation
+from ..tax import total as tax_total
 
 
 class BaseCartActionView(FormView):
@@ -28,6 +32,63 @@ class BaseCartActionView(FormView):
     def form_invalid(self, form):
         return JsonResponse(form.errors, status=400)
 
+    def cart_action_failed(self, form, msg):
+        messages.warning(self.request, msg)
+        return redirect(self.get_success_url())
+
+    def cart_action_done(self, form, msg=None):
+        if msg:
+            messages.info(self.request, msg)
+        return redirect(self.get_success_url())
+
+
+class JsonCartActionMixin(object):
+    """
+    Answer a cart action with the changed basket line, the basket summary and
+    the stock left instead of redirecting, so the page can be updated in
+    place without rendering anything on the server.
+    """
+
+    def cart_action_failed(self, form, msg):
+        data = self.get_cart_data(form)
+        data['error'] = msg
+        return JsonResponse(data, status=409)
+
+    def cart_action_done(self, form, msg=None):
+        data = self.get_cart_data(form)
+        data['message'] = msg
+        return JsonResponse(data)
+
+    def get_cart_data(self, form):
+        product = form.cleaned_data['product']
+        delivery_date = form.cleaned_data.get('delivery_date')
+        quantity = self.basket.items\
+            .filter(product=product, delivery_date=delivery_date)\
+            .values_list('quantity', flat=True).first()
+        stock = None
+        if delivery_date is not None:
+            stock = ProductSupply.objects\
+                .filter(product=product, delivery_date=delivery_date)\
+                .values_list('quantity', flat=True).first()
+        if stock is None:
+            stock = Product.objects.filter(pk=product.pk)\
+                .values_list('stock', flat=True).first()
+        return {
+            'line': {
+                'product': product.pk,
+                'title': product.title,
+                'price': str(product.price.amount),
+                'delivery_date': delivery_date and delivery_date.isoformat(),
+                'quantity': quantity or 0,
+            },
+            'basket': {
+                'item_count': self.basket.item_count,
+                'total': str(self.basket.total),
+                'currency': self.basket.currency,
+            },
+            'stock': stock,
+        }
+
 
 class AddToCart(BaseCartActionView):
     def form_valid(self, form):
@@ -37,45 +98,62 @@ class AddToCart(BaseCartActionView):
             if self.basket.get_items_count() >= max_items:
                 msg = _("You are not allowed to have more "
                         "than %d items in your basket.") % (max_items)
-                messages.warning(self.request, msg)
-                return redirect('eggplant:market:market_home')
-            product = form.cleaned_data['product']
-            quantity = form.cleaned_data['quantity']
-            if not product.enabled or (product.stock is not None and
-                                       product.stock < quantity):
+                return self.cart_action_failed(form, msg)
+            try:
+                StockReservation.objects.reserve(self.basket,
+                                                 **form.cleaned_data)
+            except InsufficientStock:
                 msg = _("Sorry, this product is currently not this much on stock")
-                messages.warning(self.request, msg)
-                return redirect('eggplant:market:market_home')
-            self.basket.add_to_items(**form.cleaned_data)
-            if product.stock is not None:
-                stock = product.stock - quantity
-                Product.objects.filter(id=product.id).update(stock=stock)
+                return self.cart_action_failed(form, msg)
+            except BasketClosed:
+                msg = _("Your basket has expired, please try again.")
+                return self.cart_action_failed(form, msg)
+            try:
+                self.basket.add_to_items(**form.cleaned_data)
+            except MixedCurrencies:
+                StockReservation.objects.release(
+                    self.basket, form.cleaned_data['product'],
+                    form.cleaned_data['quantity'],
+                    form.cleaned_data['delivery_date'])
+                msg = _("Your cart holds products priced in a different "
+                        "currency.")
+                return self.cart_action_failed(form, msg)
         msg = _("You have just added %s to your basket.") % \
             (form.cleaned_data['product'].title)
-        messages.info(self.request, msg)
-        return redirect('eggplant:market:market_home')
+        return self.cart_action_done(form, msg)
 add_to_cart = login_required(AddToCart.as_view())
 
 
+class AddToCartJson(JsonCartActionMixin, AddToCart):
+    pass
+add_to_cart_json = login_required(AddToCartJson.as_view())
+
+
 class RemoveFromCart(BaseCartActionView):
+    success_url = reverse_lazy('eggplant:market:cart_details')
+
     def form_valid(self, form):
         with transaction.atomic():
             super().form_valid(form)
-            self.basket.remove_from_items(**form.cleaned_data)
-            product = form.cleaned_data['product']
-            if product.stock is not None:
-                stock = product.stock + form.cleaned_data['quantity']
-                Product.objects.filter(id=product.id).update(stock=stock)
-        return redirect('eggplant:market:cart_details')
+            removed = self.basket.remove_from_items(**form.cleaned_data)
+            StockReservation.objects.release(
+                self.basket, form.cleaned_data['product'], removed,
+                form.cleaned_data['delivery_date'])
+        return self.cart_action_done(form)
 remove_from_cart = login_required(RemoveFromCart.as_view())
 
 
+class RemoveFromCartJson(JsonCartActionMixin, RemoveFromCart):
+    pass
+remove_from_cart_json = login_required(RemoveFromCartJson.as_view())
+
+
 @login_required
 def cart_details(request):
     basket = Basket.objects.open_for_user(request.user)
     ctx = {
         'basket': basket,
-        'items': basket.items.all(),
+        'items': basket.items.select_related('product'),
     }
     return render(request, 'eggplant/market/cart_details.html', ctx)
 
@@ -84,17 +162,41 @@ def cart_details(request):
 def checkout(request):
     basket = get_object_or_404(Basket, user=request.user, status=Basket.OPEN)
 
-    items = basket.items.all()
-    if items.count() < 1:
+    if basket.get_items_count() < 1:
         return redirect('eggplant:market:market_home')
+    items = basket.items.select_related('product')
 
     if request.method == 'POST':
-        basket.do_checkout()
-        return redirect('eggplant:market:order_detail',
-                        pk=str(basket.order.id))
-
+        try:
+            payment = basket.do_checkout()
+        except NoPaymentAccount:
+            messages.error(request, _("You have no active account to pay "
+                                      "from, please contact us."))
+            return redirect('eggplant:market:cart_details')
+        except MixedCurrencies:
+            messages.error(request, _("Your cart holds products priced in "
+                                      "different currencies."))
+            return redirect('eggplant:market:cart_details')
+        except SlotFull as e:
+            messages.error(request, _(
+                "Sorry, there is no more room for pickups on %s, please "
+                "choose another delivery date.") % e.date)
+            return redirect('eggplant:market:cart_details')
+        if payment is None:
+            return redirect('eggplant:market:payment_list')
+        return redirect('eggplant:market:payment_detail', pk=payment.pk)
+
+    taxes = basket.get_taxes()
+    try:
+        taxes_total = tax_total(taxes)
+    except ValueError:
+        messages.error(request, _("Your cart holds products priced in "
+                                  "different currencies."))
+        return redirect('eggplant:market:cart_details')
     ctx = {
         'basket': basket,
         'items': items,
+        'taxes': taxes,
+        'taxes_total': taxes_total,
     }
     return render(request, 'eggplant/market/checkout.html', ctx)
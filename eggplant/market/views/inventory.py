@@ -1,35 +1,153 @@
 
+import csv
+import io
 import logging
 
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseRedirect
-from django.shortcuts import render
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.http import (Http404, HttpResponseBadRequest,
+                         HttpResponseRedirect, JsonResponse,
+                         StreamingHttpResponse)
+from django.middleware.csrf import get_token
+from django.shortcuts import redirect, render
+from django.template.loader import render_to_string
+from django.utils.http import urlencode
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+from django.utils.translation import ugettext as _
+from django.views.decorators.http import require_POST
+from eggplant.roles.decorators import role_required
+from eggplant.roles.models import RoleAssignment
 
+from ..catalog import (CSRF_TOKEN_PLACEHOLDER, get_catalog_version,
+                       get_fragment_cache_timeout, product_grid_cache_key)
 from ..filters import ProductFilter
-from ..forms import ProductForm
+from ..forms import ProductForm, ProductGridForm, ProductImportForm
+from ..importexport import (FORMATS, Echo, ProductImporter,
+                            export_products, read_rows)
 from ..models.cart import Basket
-from ..models.inventory import Product, ProductCategory
+from ..models.delivery import PickupSlot, ProductDemand, ProductSupply
+from ..models.inventory import Product
+from ..pagination import InvalidCursor, get_page_size, seek
 
 log = logging.getLogger(__name__)
 
+# Upcoming pickup dates listed on the market page.
+MAX_PICKUP_SLOTS = 8
+
+DEMAND_COLUMNS = ('product', 'sku', 'title', 'in baskets', 'ordered', 'total')
+
+# More than a few pages worth of product cards at once is not asked for by
+# the market page.
+MAX_AVAILABILITY_PRODUCTS = 200
+
+
+def get_product_page(request):
+    """
+    Return the context of the page of products asked for by the query
+    string of ``request``: the products, the filter and the query string of
+    the next page, if any.
+
+    Search results are ranked rather than ordered by the keyset, so only
+    the best matches are shown.
+    """
+    product_filter = ProductFilter(request.GET,
+                                   queryset=Product.objects.filter(enabled=True))
+    if request.GET.get('q'):
+        products = list(product_filter.qs[:get_page_size()])
+        cursor = None
+    else:
+        products, cursor = seek(product_filter.qs, request.GET.get('after'))
+    next_query = None
+    if cursor:
+        next_query = urlencode({'category': request.GET.get('category', ''),
+                                'after': cursor})
+    return {
+        'product_filter': product_filter,
+        'products': products,
+        'next_query': next_query,
+    }
+
+
+def render_product_grid(request):
+    """
+    Render the product filter and the first page of the product grid of the
+    market page.
+
+    The result is the same for every member, so it is cached per catalog
+    version, category filter and language. The CSRF token of the cart forms
+    is filled in per request.
+    """
+    category = request.GET.get('category', '')
+    cache_key = None
+    # Searches and deeper pages are not worth caching, they hardly repeat.
+    if set(request.GET) <= {'category'} and \
+            (not category or category.isdigit()):
+        cache_key = product_grid_cache_key(get_catalog_version(), category,
+                                           get_language())
+        html = cache.get(cache_key)
+    else:
+        html = None
+    if html is None:
+        ctx = get_product_page(request)
+        ctx['csrf_token'] = CSRF_TOKEN_PLACEHOLDER
+        html = render_to_string('eggplant/market/_product_grid.html', ctx)
+        if cache_key:
+            cache.set(cache_key, html, get_fragment_cache_timeout())
+    return mark_safe(html.replace(CSRF_TOKEN_PLACEHOLDER, get_token(request)))
+
 
 @login_required
 def market_home(request, category_id=None):
-    default_filters = dict(enabled=True)
-    queryset = Product.objects.filter(**default_filters)
-    product_filter = ProductFilter(request.GET, queryset=queryset)
-    categories = ProductCategory.objects.filter(enabled=True)
     basket = Basket.objects.open_for_user(request.user)
-    all_items = basket.items.all()
+    all_items = basket.items.select_related('product')
+    try:
+        product_grid = render_product_grid(request)
+    except InvalidCursor:
+        return HttpResponseBadRequest()
     ctx = {
         'basket': basket,
         'basket_items': all_items,
-        'product_filter': product_filter,
-        'product_categories': categories,
+        'product_grid': product_grid,
+        'pickup_slots': PickupSlot.objects.upcoming()[:MAX_PICKUP_SLOTS],
     }
     return render(request, 'eggplant/market/market_home.html', ctx)
 
 
+@login_required
+def product_page(request):
+    """
+    The product cards of the page following the ``after`` cursor, appended
+    to the market page as the member scrolls down.
+    """
+    try:
+        ctx = get_product_page(request)
+    except InvalidCursor:
+        return HttpResponseBadRequest()
+    return render(request, 'eggplant/market/_product_page.html', ctx)
+
+
+@login_required
+def product_availability(request):
+    """
+    The quantity left per delivery date of the products in the ``product``
+    parameters, filled into the cards of the market page, which are cached
+    for every member alike.
+    """
+    product_ids = [int(pk) for pk in request.GET.getlist('product')
+                   if pk.isdigit()][:MAX_AVAILABILITY_PRODUCTS]
+    available = ProductSupply.objects.available(product_ids)
+    return JsonResponse({
+        'products': {
+            product_id: [{'date': date.isoformat(), 'quantity': quantity}
+                         for date, quantity in dates]
+            for product_id, dates in available.items()
+        },
+    })
+
+
 @login_required
 def add_product(request):
     if request.method == 'POST':
@@ -42,3 +160,105 @@ def add_product(request):
             'form': ProductForm()
         }
         return render(request, 'eggplant/market/add_product.html', ctx)
+
+
+@require_POST
+@role_required(RoleAssignment.PURCHASER)
+def import_products(request):
+    form = ProductImportForm(request.POST, request.FILES)
+    if not form.is_valid():
+        for error in form.errors.get('file', []):
+            messages.error(request, error)
+    else:
+        stream = io.TextIOWrapper(form.cleaned_data['file'].file,
+                                  encoding='utf-8-sig', newline='')
+        importer = ProductImporter().run(read_rows(stream, form.format))
+        messages.info(request, _(
+            "Created {created}, updated {updated} and left {unchanged} "
+            "product(s) unchanged.").format(
+                created=importer.created, updated=importer.updated,
+                unchanged=importer.unchanged))
+        for line, error in importer.errors:
+            messages.warning(request, _("Line {line}: {error}").format(
+                line=line, error=error))
+        if importer.error_count > len(importer.errors):
+            messages.warning(request, _("...and {} more error(s).").format(
+                importer.error_count - len(importer.errors)))
+    return redirect(reverse('eggplant:roles:role',
+                            kwargs={'role': RoleAssignment.PURCHASER}))
+
+
+@role_required(RoleAssignment.PURCHASER)
+def export_products_file(request, fmt):
+    if fmt not in FORMATS:
+        raise Http404
+    content_type = {
+        'csv': 'text/csv; charset=utf-8',
+        'jsonl': 'application/x-ndjson; charset=utf-8',
+    }[fmt]
+    response = StreamingHttpResponse(export_products(fmt),
+                                     content_type=content_type)
+    response['Content-Disposition'] = \
+        'attachment; filename="products.{}"'.format(fmt)
+    return response
+
+
+@require_POST
+@role_required(RoleAssignment.PURCHASER)
+def update_products(request):
+    """
+    Save the cells edited in the product grid of the purchaser dashboard.
+    """
+    form = ProductGridForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors['changes']}, status=400)
+    updated, conflicts = form.save()
+    return JsonResponse({'updated': updated, 'conflicts': conflicts})
+
+
+def get_demand_date(request, dates):
+    """
+    The delivery date in the ``date`` parameter out of ``dates``, the first
+    one by default; ``none`` stands for the demand without a date.
+    """
+    selected = request.GET.get('date')
+    for date in dates:
+        if (date.isoformat() if date else 'none') == selected:
+            return date
+    return dates[0] if dates else None
+
+
+@role_required(RoleAssignment.PURCHASER)
+def purchase_orders(request):
+    """
+    What to order from the suppliers for a delivery date, read from the
+    demand kept up to date by the cart and checkout.
+    """
+    dates = ProductDemand.objects.upcoming()
+    delivery_date = get_demand_date(request, dates)
+    ctx = {
+        'delivery_dates': dates,
+        'delivery_date': delivery_date,
+        'date_param': delivery_date.isoformat() if delivery_date else 'none',
+        'products': ProductDemand.objects.wanted(delivery_date) if dates
+        else [],
+    }
+    return render(request, 'eggplant/market/purchase_orders.html', ctx)
+
+
+@role_required(RoleAssignment.PURCHASER)
+def purchase_orders_csv(request):
+    delivery_date = get_demand_date(request, ProductDemand.objects.upcoming())
+    writer = csv.writer(Echo())
+
+    def rows():
+        yield writer.writerow(DEMAND_COLUMNS)
+        for row in ProductDemand.objects.wanted(delivery_date).iterator():
+            yield writer.writerow(row + (row[3] + row[4],))
+
+    response = StreamingHttpResponse(rows(),
+                                     content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = \
+        'attachment; filename="purchase-orders-{}.csv"'.format(
+            delivery_date.isoformat() if delivery_date else 'undated')
+    return response
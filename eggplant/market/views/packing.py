@@ -0,0 +1,85 @@
+from django.http import Http404, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.utils.dateparse import parse_date
+from django.utils.html import format_html, format_html_join
+from django.utils.translation import ugettext as _
+from eggplant.roles.decorators import role_required
+from eggplant.roles.models import RoleAssignment
+
+from ..packing import export_packing_list, members_to_pack, products_to_pack
+
+
+def get_delivery_date(date):
+    """The delivery date in the URL, ``none`` for the lines without one."""
+    if date == 'none':
+        return None
+    try:
+        delivery_date = parse_date(date)
+    except ValueError:
+        delivery_date = None
+    if delivery_date is None:
+        raise Http404
+    return delivery_date
+
+
+MEMBER_HTML = (
+    '<div class="member">\n<h2>{} <small>({})</small></h2>\n'
+    '<p>{}</p>\n<table>\n{}\n</table>\n</div>\n'
+)
+ROW_HTML = '<tr><td>{}</td><td>{}</td><td class="quantity">{}</td></tr>'
+
+
+def render_member(member, lines, delivery):
+    return format_html(
+        MEMBER_HTML, member['name'] or member['username'],
+        member['username'], delivery,
+        format_html_join('\n', ROW_HTML,
+                         ((title, sku or '', quantity)
+                          for __, sku, title, quantity in lines)))
+
+
+def render_packing_list(request, delivery_date, chunk_size=100):
+    """
+    Yield the printable packing list: the totals per product, then a page
+    per member, ``chunk_size`` members at a time as the rows come in.
+
+    There are thousands of members with tens of thousands of lines in all,
+    too many for the template engine to get through in time, so the pages
+    of the members are formatted here, escaped by format_html like a
+    template would.
+    """
+    yield render_to_string('eggplant/market/packing/start.html', {
+        'delivery_date': delivery_date,
+        'products': products_to_pack(delivery_date),
+    }, request)
+    if delivery_date is None:
+        delivery = _("Without delivery date")
+    else:
+        delivery = _("Delivery on %s") % delivery_date.isoformat()
+    chunk = []
+    for member, lines in members_to_pack(delivery_date):
+        chunk.append(render_member(member, lines, delivery))
+        if len(chunk) >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+    chunk.append('</body>\n</html>\n')
+    yield ''.join(chunk)
+
+
+@role_required(RoleAssignment.PACKER)
+def packing_list(request, date):
+    delivery_date = get_delivery_date(date)
+    return StreamingHttpResponse(render_packing_list(request, delivery_date),
+                                 content_type='text/html; charset=utf-8')
+
+
+@role_required(RoleAssignment.PACKER)
+def packing_list_csv(request, date, by):
+    delivery_date = get_delivery_date(date)
+    response = StreamingHttpResponse(
+        export_packing_list(delivery_date, by),
+        content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = \
+        'attachment; filename="packing-{}-by-{}.csv"'.format(
+            delivery_date.isoformat() if delivery_date else 'none', by)
+    return response
@@ -2,13 +2,18 @@ import logging
 
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.utils.decorators import method_decorator
 from django.utils.translation import ugettext as _
 from django.views.generic.detail import DetailView
 from eggplant.core.views import LoginRequiredMixin
+from eggplant.roles.decorators import role_required
+from eggplant.roles.models import RoleAssignment
 from getpaid.forms import PaymentMethodForm
+from getpaid.views import NewPaymentView as BaseNewPaymentView
 
+from ..forms import LedgerForm
+from ..ledger import FORMATS, date_range, export_ledger
 from ..models import Payment
 
 log = logging.getLogger(__name__)
@@ -36,16 +41,13 @@ class PaymentView(LoginRequiredMixin, DetailView):
     model = Payment
     template_name = 'eggplant/market/payment_detail.html'
 
-    @method_decorator
-    @login_required
-    def dispatch(self, request, *args, **kwargs):
-        return super(PaymentView, self).dispatch(request, *args, **kwargs)
-
     def get_queryset(self):
         return Payment.objects.filter(account__user_profiles=self.request.user.profile)
 
     def get_context_data(self, **kwargs):
         context = super(PaymentView, self).get_context_data(**kwargs)
+        context['lines'] = self.object.lines.order_by('pk')
+        context['taxes'] = self.object.get_taxes()
         context['payment_form'] = PaymentMethodForm(
             self.object.amount.currency,
             initial={'payment': self.object}
@@ -55,15 +57,53 @@ class PaymentView(LoginRequiredMixin, DetailView):
 payment_detail = PaymentView.as_view()
 
 
+class NewPaymentView(BaseNewPaymentView):
+    """
+    getpaid's view starting a payment, which passes the form class to
+    get_form() the way Django did before 1.8.
+    """
+
+    def get_form(self, form_class=None):
+        return super().get_form(form_class or self.get_form_class())
+
+new_payment = NewPaymentView.as_view()
+
+
+@login_required
 def payment_accepted(request, pk=None):
     get_object_or_404(Payment, pk=pk, account__user_profiles=request.user.profile)
     messages.info(request, _("Your payment has been accepted and"
                              " it's being processed."))
-    return redirect('eggplant:market:payments_list')
+    return redirect('eggplant:market:payment_list')
 
 
 @login_required
 def payment_rejected(request, pk=None):
     get_object_or_404(Payment, pk=pk, account__user_profiles=request.user.profile)
     messages.error(request, _("Your payment has been cancelled."))
-    return redirect("eggplant:market:payments_list")
+    return redirect("eggplant:market:payment_list")
+
+
+@role_required(RoleAssignment.ACCOUNTANT)
+def ledger(request, fmt):
+    """
+    Stream the ledger of a period, optionally of one department only.
+    """
+    if fmt not in FORMATS:
+        raise Http404
+    form = LedgerForm(request.GET)
+    if not form.is_valid():
+        return render(request, 'eggplant/roles/accountant/dashboard.html',
+                      {'ledger_form': form}, status=400)
+    start, end = form.cleaned_data['start'], form.cleaned_data['end']
+    content_type = {
+        'csv': 'text/csv; charset=utf-8',
+        'jsonl': 'application/x-ndjson; charset=utf-8',
+    }[fmt]
+    response = StreamingHttpResponse(
+        export_ledger(fmt, *date_range(start, end),
+                      department=form.cleaned_data['department']),
+        content_type=content_type)
+    response['Content-Disposition'] = \
+        'attachment; filename="ledger-{}-{}.{}"'.format(start, end, fmt)
+    return response
@@ -1,26 +1,41 @@
 from django.conf import settings
 from django.contrib import messages
-from django.core.urlresolvers import reverse
+from django.core.urlresolvers import get_script_prefix, get_urlconf, reverse
 from django.http import HttpResponseRedirect
+from django.utils.lru_cache import lru_cache
+from django.utils.translation import get_language
 
 
 from . import models
 
 
+@lru_cache()
+def get_allowed_paths(url_names, language, urlconf, script_prefix):
+    """
+    Reverse the URLs a member with an incomplete profile may visit once per
+    language (they are prefixed through i18n_patterns) instead of on every
+    request.
+    """
+    return frozenset(reverse(url_name, urlconf=urlconf)
+                     for url_name in url_names)
+
+
 class NewUserForceProfileMiddleware(object):
 
     def process_request(self, request):
         if request.user.is_authenticated() and not request.user.is_superuser:
-            allowed_paths = [reverse(urlname) for urlname in
-                             settings.NEW_USER_FORCE_PROFILE_ALLOWED_URL_NAMES]
-            if request.path not in allowed_paths:
-                try:
-                    profile = request.user.profile
-                except models.UserProfile.DoesNotExist:
-                    profile = None
-                if not profile or not profile.is_complete():
-                    msg = "Please update your profile."
-                    messages.add_message(request, messages.WARNING, msg)
-                    return HttpResponseRedirect(
-                        reverse('eggplant:profiles:profile')
-                    )
+            allowed_paths = get_allowed_paths(
+                tuple(settings.NEW_USER_FORCE_PROFILE_ALLOWED_URL_NAMES),
+                get_language(), get_urlconf(settings.ROOT_URLCONF),
+                get_script_prefix())
+            if request.path in allowed_paths:
+                return
+            if models.is_noted_complete(request, request.user):
+                return
+            if models.note_profile_complete(request, request.user):
+                return
+            msg = "Please update your profile."
+            messages.add_message(request, messages.WARNING, msg)
+            return HttpResponseRedirect(
+                reverse('eggplant:profiles:profile')
+            )
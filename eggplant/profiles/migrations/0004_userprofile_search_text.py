@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from eggplant.profiles.search import install_search_index, member_document
+
+
+def fill_search_text(apps, schema_editor):
+    UserProfile = apps.get_model('profiles', 'UserProfile')
+    Account = apps.get_model('accounts', 'Account')
+    accounts = {}
+    for profile_id, name in Account.objects.exclude(name='')\
+            .order_by('pk').values_list('user_profiles', 'name'):
+        accounts.setdefault(profile_id, []).append(name)
+    for pk, first_name, last_name, email, tel, tel2 in \
+            UserProfile.objects.values_list(
+                'pk', 'user__first_name', 'user__last_name', 'user__email',
+                'tel', 'tel2').iterator():
+        UserProfile.objects.filter(pk=pk).update(search_text=member_document(
+            first_name, last_name, email, tel, tel2, accounts.get(pk, ())))
+
+
+def create_search_index(apps, schema_editor):
+    install_search_index(schema_editor.connection, rebuild=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_account_name'),
+        ('profiles', '0003_auto_20151225_1844'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, migrations.RunPython.noop),
+    ]
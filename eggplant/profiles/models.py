@@ -1,13 +1,28 @@
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in
 from django.contrib.staticfiles.templatetags.staticfiles import static
-from django.db import models
-from django.db.models.signals import post_save
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, models
+from django.db.models.signals import m2m_changed, post_migrate, post_save
 from django.dispatch.dispatcher import receiver
 from django.utils.translation import ugettext_lazy as _
 
+from eggplant.core.thumbnails import (get_srcset, get_thumbnail_url,
+                                      schedule_thumbnails)
 from eggplant.core.utils import disable_for_loaddata
 
+from .search import install_search_index, refresh_search_text
+
+# Holds the id of the user once their profile is known to be complete, so
+# NewUserForceProfileMiddleware need not load it on every request.
+PROFILE_COMPLETE_SESSION_KEY = '_profile_complete'
+
+# Set in the default cache, shared by all processes, for a user whose profile
+# was saved incomplete: the sessions noting it complete cannot be reached
+# from there, so the middleware looks for this to check the profile again.
+PROFILE_INCOMPLETE_CACHE_KEY = 'eggplant:profiles:incomplete:{}'
+
 
 class UserProfile(models.Model):
     MALE = 'male'
@@ -51,6 +66,10 @@ class UserProfile(models.Model):
     )
     photo = models.ImageField(blank=True, null=True)
 
+    # Names, email, phone numbers and account names for the member lookup of
+    # the cashiers, see profiles.search.
+    search_text = models.TextField(blank=True, default='', editable=False)
+
     created = models.DateTimeField(auto_now_add=True, editable=False)
     changed = models.DateTimeField(auto_now=True, editable=False)
 
@@ -89,12 +108,15 @@ class UserProfile(models.Model):
         # TODO: Figure out what accounts are active based on memberships.
         return self.accounts.all()
 
-    def photo_url_or_default(self):
+    def photo_url_or_default(self, width=160):
         if self.photo:
-            return self.photo.url
+            return get_thumbnail_url(self.photo, width)
         else:
             return static('img/default-profile-photo.png')
 
+    def photo_srcset(self, ext='webp'):
+        return get_srcset(self.photo, ext)
+
     @classmethod
     def in_department(cls, department, only_active_accounts=True):
         """
@@ -121,3 +143,100 @@ def create_user_profile(sender, instance, created, **kwargs):
         # Set the reverse instance.profile so the new profile is available
         # immediately
         instance.profile = UserProfile.objects.create(user=instance)
+
+
+def note_profile_complete(request, user):
+    """
+    Note in the session of ``request`` whether the profile of ``user`` is
+    complete, and return whether it is.
+    """
+    try:
+        complete = user.profile.is_complete()
+    except UserProfile.DoesNotExist:
+        complete = False
+    if complete:
+        request.session[PROFILE_COMPLETE_SESSION_KEY] = user.pk
+        cache.delete(PROFILE_INCOMPLETE_CACHE_KEY.format(user.pk))
+    else:
+        request.session.pop(PROFILE_COMPLETE_SESSION_KEY, None)
+    return complete
+
+
+def is_noted_complete(request, user):
+    """
+    Whether the session of ``request`` notes the profile of ``user`` complete
+    and it was not saved incomplete since.
+    """
+    return request.session.get(PROFILE_COMPLETE_SESSION_KEY) == user.pk and \
+        not cache.get(PROFILE_INCOMPLETE_CACHE_KEY.format(user.pk))
+
+
+@receiver(user_logged_in, dispatch_uid='profile-complete-on-login')
+def profile_complete_on_login(sender, request, user, **kwargs):
+    # Along with the login, so the session is not saved again for it.
+    note_profile_complete(request, user)
+
+
+@receiver(post_save, sender=UserProfile,
+          dispatch_uid='profile-incomplete-marker')
+@disable_for_loaddata
+def profile_incomplete_marker(sender, instance, **kwargs):
+    key = PROFILE_INCOMPLETE_CACHE_KEY.format(instance.user_id)
+    if instance.is_complete():
+        cache.delete(key)
+    else:
+        cache.set(key, True, None)
+
+
+@receiver(post_save, sender=UserProfile, dispatch_uid='profile-photo-thumbnails')
+@disable_for_loaddata
+def profile_photo_thumbnails(sender, instance, **kwargs):
+    schedule_thumbnails(instance.photo)
+
+
+@receiver(post_save, sender=User, dispatch_uid='profile-search-text-user')
+@receiver(post_save, sender=UserProfile,
+          dispatch_uid='profile-search-text-profile')
+@disable_for_loaddata
+def profile_search_text(sender, instance, **kwargs):
+    if sender is User:
+        profiles = UserProfile.objects.filter(user=instance)
+    else:
+        profiles = UserProfile.objects.filter(pk=instance.pk)
+    refresh_search_text(profiles)
+
+
+@receiver(post_save, sender='accounts.Account',
+          dispatch_uid='profile-search-text-account')
+@disable_for_loaddata
+def account_search_text(sender, instance, created, **kwargs):
+    if not created:
+        refresh_search_text(UserProfile.objects.filter(accounts=instance))
+
+
+@receiver(m2m_changed, sender='accounts.Account_user_profiles',
+          dispatch_uid='profile-search-text-account-profiles')
+def account_profiles_search_text(sender, instance, action, reverse, pk_set,
+                                 **kwargs):
+    if action == 'pre_clear' and not reverse:
+        # The profiles are gone by the time of post_clear.
+        instance._cleared_profiles = list(
+            instance.user_profiles.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        pk_set = [instance.pk]
+    elif action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_profiles', [])
+    refresh_search_text(UserProfile.objects.filter(pk__in=pk_set))
+
+
+@receiver(post_migrate, dispatch_uid='profiles-member-search-index')
+def member_search_index(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Make sure the search index of the members is in place after migrating,
+    SQLite drops its triggers whenever a migration rebuilds the table.
+    """
+    if sender.name == 'eggplant.profiles':
+        install_search_index(connections[using])
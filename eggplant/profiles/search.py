@@ -0,0 +1,139 @@
+"""
+Type-ahead lookup of members by name, email, phone number or account name.
+
+Those live in three tables, so every profile carries them all in one
+``search_text`` column, lower-cased, with the phone numbers also as bare
+digits. It is kept up to date by signals (see models.py) and indexed:
+
+* on PostgreSQL with a trigram GiST index, which serves ``LIKE '%...%'`` on
+  any part of a word as well as the nearest-neighbour ordering by trigram
+  distance, so only the best ten matches are ever looked at;
+* on SQLite (development and tests) with an FTS5 table with external
+  content, matching words by prefix. Ranking every match of a short prefix
+  costs more than the lookup itself, so the first ten by member number are
+  shown.
+
+Neither index is known to the ORM: ``install_search_index`` creates them,
+from a migration and again after every ``migrate``, as SQLite drops the
+triggers whenever Django rebuilds the profiles table.
+"""
+import re
+
+from django.db import connections
+
+PROFILE_TABLE = 'profiles_userprofile'
+SQLITE_FTS_TABLE = 'profiles_userprofile_fts'
+
+# Members shown while typing.
+MAX_MATCHES = 10
+
+POSTGRESQL_INSTALL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS {table}_search_text_trgm '
+    'ON {table} USING GIST (search_text gist_trgm_ops)',
+]
+
+SQLITE_INSTALL = [
+    'CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5('
+    "search_text, content='{table}', content_rowid='id')",
+    'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN '
+    'INSERT INTO {fts}(rowid, search_text) '
+    'VALUES (new.id, new.search_text); END',
+    'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN '
+    "INSERT INTO {fts}({fts}, rowid, search_text) "
+    "VALUES ('delete', old.id, old.search_text); END",
+    'CREATE TRIGGER IF NOT EXISTS {fts}_au '
+    'AFTER UPDATE OF search_text ON {table} BEGIN '
+    "INSERT INTO {fts}({fts}, rowid, search_text) "
+    "VALUES ('delete', old.id, old.search_text); "
+    'INSERT INTO {fts}(rowid, search_text) '
+    'VALUES (new.id, new.search_text); END',
+]
+
+
+def install_search_index(connection, rebuild=False):
+    """
+    Create the search index of the members, if missing. ``rebuild``
+    (re)indexes the existing profiles as well.
+    """
+    if connection.vendor == 'postgresql':
+        statements = [sql.format(table=PROFILE_TABLE)
+                      for sql in POSTGRESQL_INSTALL]
+    elif connection.vendor == 'sqlite':
+        statements = [sql.format(table=PROFILE_TABLE, fts=SQLITE_FTS_TABLE)
+                      for sql in SQLITE_INSTALL]
+        if rebuild:
+            statements.append(
+                "INSERT INTO {fts}({fts}) VALUES ('rebuild')".format(
+                    fts=SQLITE_FTS_TABLE))
+    else:
+        return
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def member_document(first_name, last_name, email, tel, tel2, accounts):
+    """The ``search_text`` of a member."""
+    phones = [tel, tel2]
+    parts = [first_name, last_name, email] + phones + \
+        [re.sub(r'\D', '', phone) for phone in phones] + list(accounts)
+    return ' '.join(part for part in parts if part).lower()
+
+
+def refresh_search_text(profiles):
+    """
+    Recompute the ``search_text`` of ``profiles`` (a queryset), with one
+    query for the members and one for their accounts.
+    """
+    from eggplant.accounts.models import Account
+    rows = list(profiles.values_list('pk', 'user__first_name',
+                                     'user__last_name', 'user__email', 'tel',
+                                     'tel2', 'search_text'))
+    accounts = {}
+    for profile_id, name in Account.objects\
+            .filter(user_profiles__in=[row[0] for row in rows])\
+            .exclude(name='').order_by('pk')\
+            .values_list('user_profiles', 'name'):
+        accounts.setdefault(profile_id, []).append(name)
+    for pk, first_name, last_name, email, tel, tel2, current in rows:
+        text = member_document(first_name, last_name, email, tel, tel2,
+                               accounts.get(pk, ()))
+        if text != current:
+            profiles.model.objects.filter(pk=pk).update(search_text=text)
+
+
+def search_members(queryset, query):
+    """
+    The best ``MAX_MATCHES`` profiles of ``queryset`` matching every word of
+    ``query``, the last one as it is being typed.
+    """
+    words = re.findall(r'\w+', (query or '').lower())
+    if not words:
+        return queryset.none()
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        return queryset.extra(
+            select={'search_distance': '{}.search_text <-> %s'.format(
+                PROFILE_TABLE)},
+            select_params=(' '.join(words),),
+            where=['{}.search_text LIKE %s'.format(PROFILE_TABLE)] *
+            len(words),
+            params=['%{}%'.format(word.replace('_', '\\_'))
+                    for word in words],
+            order_by=['search_distance'],
+        )[:MAX_MATCHES]
+    if vendor == 'sqlite':
+        match = ' '.join('"{}"*'.format(word) for word in words)
+        return queryset.extra(
+            tables=[SQLITE_FTS_TABLE],
+            where=[
+                '{fts}.rowid = {table}.id'.format(fts=SQLITE_FTS_TABLE,
+                                                  table=PROFILE_TABLE),
+                '{} MATCH %s'.format(SQLITE_FTS_TABLE),
+            ],
+            params=(match,),
+        ).order_by('pk')[:MAX_MATCHES]
+    for word in words:
+        queryset = queryset.filter(search_text__contains=word)
+    return queryset.order_by('pk')[:MAX_MATCHES]
@@ -1,12 +1,17 @@
 
 from allauth.account.models import EmailAddress
 from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
 from django.core import mail
 from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.test import RequestFactory, TestCase
 # Create your tests here.
 from eggplant.factories import AccountFactory, DepartmentFactory, UserFactory
-from eggplant.profiles.models import UserProfile
+from eggplant.profiles.middleware import (NewUserForceProfileMiddleware,
+                                          get_allowed_paths)
+from eggplant.profiles.models import PROFILE_COMPLETE_SESSION_KEY, UserProfile
+from eggplant.profiles.search import search_members
+from eggplant.roles.models import RoleAssignment
 
 
 class TestProfile(TestCase):
@@ -85,6 +90,58 @@ class TestProfile(TestCase):
         self.assertEqual(0, department.accounts.count())
 
 
+class TestForceProfile(TestCase):
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.user.set_password('pass')
+        self.user.save()
+        self.client.login(username=self.user.username, password='pass')
+
+    def complete_profile(self):
+        UserProfile.objects.filter(user=self.user).update(
+            address='address', postcode='1000', city='city', tel='12345678')
+
+    def test_incomplete_profile(self):
+        response = self.client.get(reverse('eggplant:dashboard:home'))
+        self.assertRedirects(response, reverse('eggplant:profiles:profile'))
+        response = self.client.get(reverse('eggplant:profiles:profile'))
+        self.assertEqual(response.status_code, 200)
+        self.complete_profile()
+        response = self.client.get(reverse('eggplant:dashboard:home'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_no_queries_once_complete(self):
+        self.complete_profile()
+        middleware = NewUserForceProfileMiddleware()
+        request = RequestFactory().get(reverse('eggplant:dashboard:home'))
+        request.user = User.objects.get(pk=self.user.pk)
+        request.session = SessionStore()
+        self.assertIsNone(middleware.process_request(request))
+        request.user = User.objects.get(pk=self.user.pk)
+        hits = get_allowed_paths.cache_info().hits
+        with self.assertNumQueries(0):
+            self.assertIsNone(middleware.process_request(request))
+        self.assertEqual(get_allowed_paths.cache_info().hits, hits + 1)
+
+    def test_profile_saved_incomplete(self):
+        self.complete_profile()
+        home = reverse('eggplant:dashboard:home')
+        self.assertEqual(self.client.get(home).status_code, 200)
+        self.assertEqual(self.client.session[PROFILE_COMPLETE_SESSION_KEY],
+                         self.user.pk)
+        # As from the admin, out of reach of the session.
+        profile = UserProfile.objects.get(user=self.user)
+        profile.tel = ''
+        profile.save()
+        self.assertRedirects(self.client.get(home),
+                             reverse('eggplant:profiles:profile'))
+        self.assertNotIn(PROFILE_COMPLETE_SESSION_KEY, self.client.session)
+        profile.tel = '12345678'
+        profile.save()
+        self.assertEqual(self.client.get(home).status_code, 200)
+
+
 class TestSignup(TestCase):
 
     def test_signup_get(self):
@@ -127,3 +184,64 @@ class TestSignup(TestCase):
         self.assertEqual(len(mail.outbox), 1)
         self.assertEqual(mail.outbox[0].subject,
                          '[localhost] Confirm e-mail address')
+
+
+class TestMemberLookup(TestCase):
+
+    def setUp(self):
+        self.anna = UserFactory(first_name='Anna', last_name='Jensen',
+                                email='anna@example.com')
+        UserProfile.objects.filter(user=self.anna).update(tel='+45 12 34')
+        self.anna.profile.refresh_from_db()
+        self.anna.profile.save()
+        self.bo = UserFactory(first_name='Bo', last_name='Hansen',
+                              email='bo@example.com')
+        self.account = AccountFactory(name='Hansen family',
+                                      user_profiles=[self.bo.profile])
+
+    def lookup(self, query):
+        return [profile.user_id for profile in
+                search_members(UserProfile.objects.all(), query)]
+
+    def test_search_members(self):
+        self.assertEqual(self.lookup('ann'), [self.anna.pk])
+        self.assertEqual(self.lookup('Jensen a'), [self.anna.pk])
+        self.assertEqual(self.lookup('4512'), [self.anna.pk])
+        self.assertEqual(self.lookup('family'), [self.bo.pk])
+        self.assertEqual(self.lookup('bo@example'), [self.bo.pk])
+        self.assertEqual(sorted(self.lookup('example')),
+                         [self.anna.pk, self.bo.pk])
+        self.assertEqual(self.lookup(''), [])
+
+        self.account.name = 'Bo and friends'
+        self.account.save()
+        self.assertEqual(self.lookup('family'), [])
+        self.assertEqual(self.lookup('friends'), [self.bo.pk])
+        self.account.user_profiles.clear()
+        self.assertEqual(self.lookup('friends'), [])
+        self.anna.profile.accounts.add(self.account)
+        self.assertEqual(self.lookup('friends'), [self.anna.pk])
+
+        self.anna.last_name = 'Berg'
+        self.anna.save()
+        self.assertEqual(self.lookup('jensen'), [])
+
+    def test_member_lookup_view(self):
+        cashier = UserFactory()
+        UserProfile.objects.filter(user=cashier).update(
+            address='address', postcode='1000', city='city', tel='1234')
+        cashier.set_password('pass')
+        cashier.save()
+        self.client.login(username=cashier.username, password='pass')
+        url = reverse('eggplant:profiles:member_lookup')
+        self.assertEqual(self.client.get(url, {'q': 'bo'}).status_code, 403)
+        RoleAssignment.objects.create(user=cashier,
+                                      role=RoleAssignment.CASHIER)
+        response = self.client.get(url, {'q': 'bo'})
+        self.assertEqual(response.json(), {'members': [{
+            'id': self.bo.pk,
+            'name': 'Bo Hansen',
+            'email': 'bo@example.com',
+            'tel': '',
+            'accounts': ['Hansen family'],
+        }]})
@@ -5,5 +5,6 @@ from . import views
 
 urlpatterns = [
     url(r'signup/$', views.signup, name='signup'),
+    url(r'lookup\.json$', views.member_lookup, name='member_lookup'),
     url(r'$', views.Profile.as_view(), name='profile'),
 ]
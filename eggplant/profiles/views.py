@@ -6,13 +6,16 @@ from django.contrib import messages
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse_lazy
 from django.db import transaction
-from django.http import Http404
+from django.http import Http404, JsonResponse
 from django.shortcuts import redirect, render
 from django.views.generic import FormView
 from eggplant.core.views import LoginRequiredMixin
 from eggplant.profiles.forms import (NewUserSetPasswordForm, ProfileForm,
                                      SignupForm)
 from eggplant.profiles.models import UserProfile
+from eggplant.profiles.search import search_members
+from eggplant.roles.decorators import role_required
+from eggplant.roles.models import RoleAssignment
 
 logger = logging.getLogger(__name__)
 
@@ -142,3 +145,26 @@ def signup(request):
         'form': form,
     }
     return render(request, 'eggplant/profiles/signup.html', ctx)
+
+
+@role_required(RoleAssignment.CASHIER)
+def member_lookup(request):
+    """
+    The members best matching the ``q`` parameter, for the type-ahead of
+    the cashier dashboard.
+    """
+    profiles = search_members(
+        UserProfile.objects.select_related('user')
+        .prefetch_related('accounts'),
+        request.GET.get('q'))
+    return JsonResponse({'members': [
+        {
+            'id': profile.user_id,
+            'name': profile.full_name,
+            'email': profile.user.email,
+            'tel': profile.tel,
+            'accounts': [account.name for account in profile.accounts.all()
+                         if account.name],
+        }
+        for profile in profiles
+    ]})
@@ -0,0 +1,19 @@
+from django.contrib.auth.decorators import user_passes_test
+from django.core.exceptions import PermissionDenied
+
+
+def role_required(*roles):
+    """
+    Restrict a view to the members assigned any of ``roles`` (and
+    superusers); anonymous users are sent to the login page.
+    """
+
+    def check_role(user):
+        if not user.is_authenticated:
+            return False
+        if user.is_superuser or \
+                user.role_assignments.filter(role__in=roles).exists():
+            return True
+        raise PermissionDenied
+
+    return user_passes_test(check_role)
@@ -0,0 +1,42 @@
+/*
+ * Type-ahead member lookup of the cashier dashboard: the best matches are
+ * fetched as the cashier types, answers to older queries that arrive late
+ * are dropped.
+ */
+(function ($) {
+    'use strict';
+
+    var timer = null,
+        latest = 0;
+
+    function showMembers($results, members) {
+        $results.empty();
+        $.each(members, function (i, member) {
+            $('<tr>')
+                .append($('<td>').text(member.name))
+                .append($('<td>').text(member.email))
+                .append($('<td>').text(member.tel))
+                .append($('<td>').text(member.accounts.join(', ')))
+                .appendTo($results);
+        });
+    }
+
+    $(document).on('input', 'form[data-member-lookup] input[name="q"]', function () {
+        var $form = $(this).closest('form'),
+            $results = $('[data-member-lookup-results]'),
+            query = $.trim($(this).val()),
+            request = ++latest;
+        window.clearTimeout(timer);
+        if (!query) {
+            $results.empty();
+            return;
+        }
+        timer = window.setTimeout(function () {
+            $.getJSON($form.data('member-lookup'), {q: query}).done(function (data) {
+                if (request === latest) {
+                    showMembers($results, data.members);
+                }
+            });
+        }, 150);
+    });
+}(jQuery));
@@ -0,0 +1,82 @@
+/*
+ * Editable product grid of the purchaser dashboard: only the cells that
+ * differ from the value they were rendered with are posted, all at once,
+ * along with that original value so the server can tell whether somebody
+ * else changed the product meanwhile.
+ */
+(function ($) {
+    'use strict';
+
+    function cellValue($input) {
+        if ($input.is(':checkbox')) {
+            return $input.prop('checked') ? 'true' : 'false';
+        }
+        return $input.val();
+    }
+
+    function setCell($input, value) {
+        value = value === null ? '' : String(value);
+        if ($input.is(':checkbox')) {
+            $input.prop('checked', value === 'true');
+        } else {
+            $input.val(value);
+        }
+        $input.attr('data-original', value);
+    }
+
+    $(document).on('submit', 'form[data-product-grid]', function (event) {
+        var $form = $(this),
+            $status = $form.find('[data-product-grid-status]'),
+            changes = [];
+        event.preventDefault();
+        $form.find('[data-field]').each(function () {
+            var $input = $(this),
+                value = cellValue($input),
+                original = String($input.attr('data-original'));
+            if (value !== original) {
+                changes.push({
+                    product: $input.closest('[data-product]').data('product'),
+                    field: $input.data('field'),
+                    value: value,
+                    original: original
+                });
+            }
+        });
+        if (!changes.length) {
+            return;
+        }
+        $form.find('tr').removeClass('danger');
+        $.ajax({
+            url: $form.attr('action'),
+            type: 'POST',
+            data: {
+                csrfmiddlewaretoken: $form.find('[name=csrfmiddlewaretoken]').val(),
+                changes: JSON.stringify(changes)
+            },
+            dataType: 'json'
+        }).done(function (data) {
+            var conflicts = {};
+            $.each(data.conflicts, function (i, product) {
+                conflicts[product.pk] = product;
+            });
+            $.each(changes, function (i, change) {
+                var $row = $form.find('[data-product="' + change.product + '"]'),
+                    $input = $row.find('[data-field="' + change.field + '"]'),
+                    current = conflicts[change.product];
+                if (current) {
+                    // Show what the product holds now, to be edited again.
+                    $row.addClass('danger');
+                    setCell($input, current[change.field]);
+                } else {
+                    $input.attr('data-original', change.value);
+                }
+            });
+            $status.text(data.updated + ' updated' +
+                (data.conflicts.length ?
+                    ', ' + data.conflicts.length + ' changed by somebody else' : ''));
+        }).fail(function (xhr) {
+            var data = xhr.responseJSON;
+            $status.text(data && data.errors ? data.errors.join(' ') : 'Error');
+        });
+    });
+}(jQuery));
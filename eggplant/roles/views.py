@@ -1,5 +1,14 @@
+from datetime import timedelta
+
 from django.shortcuts import render
+from django.utils import timezone
+from eggplant.market.forms import LedgerForm
 from eggplant.market.models import Product
+from eggplant.market.packing import get_delivery_dates, products_to_pack
+from eggplant.market.views.inventory import get_demand_date
+
+from .decorators import role_required
+from .models import RoleAssignment
 
 
 def role(request, role):
@@ -15,12 +24,13 @@ def role(request, role):
         return accountant(request)
 
 
+@role_required(RoleAssignment.PURCHASER)
 def purchaser(request):
     show_disabled_products = 'show-disabled-products' in request.GET
-    if show_disabled_products:
-        products = Product.objects.all()
-    else:
-        products = Product.objects.filter(enabled=True)
+    products = Product.objects.select_related('category', 'tax')\
+        .order_by('category', 'title', 'id')
+    if not show_disabled_products:
+        products = products.filter(enabled=True)
     ctx = {
         'products': products,
         'show_disabled_products': show_disabled_products
@@ -32,13 +42,31 @@ def communicator(request):
     return render(request, 'eggplant/roles/communicator/dashboard.html')
 
 
+@role_required(RoleAssignment.PACKER)
 def packer(request):
-    return render(request, 'eggplant/roles/packer/dashboard.html')
+    # The last week is kept around for late pickups.
+    dates = list(get_delivery_dates(timezone.now().date() -
+                                    timedelta(days=7)))
+    delivery_date = get_demand_date(request, dates)
+    ctx = {
+        'delivery_dates': dates,
+        'delivery_date': delivery_date,
+        'date_param': delivery_date.isoformat() if delivery_date else 'none',
+        'products': products_to_pack(delivery_date) if dates else [],
+    }
+    return render(request, 'eggplant/roles/packer/dashboard.html', ctx)
 
 
+@role_required(RoleAssignment.CASHIER)
 def cashier(request):
     return render(request, 'eggplant/roles/cashier/dashboard.html')
 
 
+@role_required(RoleAssignment.ACCOUNTANT)
 def accountant(request):
-    return render(request, 'eggplant/roles/accountant/dashboard.html')
+    today = timezone.now().date()
+    ctx = {
+        'ledger_form': LedgerForm(initial={'start': today.replace(day=1),
+                                           'end': today}),
+    }
+    return render(request, 'eggplant/roles/accountant/dashboard.html', ctx)
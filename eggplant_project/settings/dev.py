@@ -23,6 +23,12 @@ DATABASES = {
 }
 
 SITE_ID = 1
+
+# A stand-in for ePay, see eggplant.market.simulator.
+GETPAID_BACKENDS += ('eggplant.market.simulator',)
+GETPAID_BACKENDS_SETTINGS = dict(GETPAID_BACKENDS_SETTINGS, **{
+    'eggplant.market.simulator': {'secret': 'simulator'},
+})
 DOMAIN = 'localhost'
 DEFAULT_HTTP_PROTOCOL = 'http'
 
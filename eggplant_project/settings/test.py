@@ -23,6 +23,12 @@ DATABASES = {
 }
 
 SITE_ID = 1
+
+# A stand-in for ePay, see eggplant.market.simulator.
+GETPAID_BACKENDS += ('eggplant.market.simulator',)
+GETPAID_BACKENDS_SETTINGS = dict(GETPAID_BACKENDS_SETTINGS, **{
+    'eggplant.market.simulator': {'secret': 'simulator'},
+})
 DOMAIN = 'localhost'
 DEFAULT_HTTP_PROTOCOL = 'http'
 
@@ -42,6 +48,9 @@ ADMINS = ()
 
 os.environ['RECAPTCHA_TESTING'] = 'True'
 
+# A writer thread cannot get at the database of a running test.
+MARKET_AUDIT_LOG_ASYNC = False
+
 TEST_RUNNER = 'django_nose.NoseTestSuiteRunner'
 NOSE_ARGS = [
     '--verbosity=2',
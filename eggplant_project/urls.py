@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 import eggplant.profiles.views
+from eggplant.market.views.callbacks import epaydk_callback
+from eggplant.market.views.payment import new_payment
 from django.conf import settings
 from django.conf.urls import include, url
 from django.conf.urls.i18n import i18n_patterns
@@ -22,6 +24,12 @@ urlpatterns = [
     url(r'^account/logout/$',
         logout,
         {'next_page': '/'}),
+    # ePay callbacks are queued and processed by process_payment_callbacks
+    # rather than by getpaid right away.
+    url(r'^getpaid/epaydk/online/(?P<secret_path>[a-zA-Z0-9]{32,96})/$',
+        epaydk_callback),
+    url(r'^getpaid/epaydk/online/$', epaydk_callback),
+    url(r'^getpaid/new/payment/(?P<currency>[A-Z]{3})/$', new_payment),
     url(r'^getpaid/', include('getpaid.urls')),
     url(r'^account/', include('allauth.urls')),
     url(r'^', include('eggplant.urls', namespace='eggplant')),